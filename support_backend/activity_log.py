@@ -0,0 +1,117 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from prometheus_client import Counter, Gauge
+from sqlalchemy import insert
+
+import models
+from database import engine
+from partitions import add_months, drop_partitions_before, ensure_monthly_partitions, month_start
+
+logger = logging.getLogger("app")
+
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL", "1.0"))
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "1000"))
+ACTIVITY_LOG_BUFFER_LIMIT = int(os.getenv("ACTIVITY_LOG_BUFFER_LIMIT", "100000"))
+ACTIVITY_LOG_RETENTION_MONTHS = int(os.getenv("ACTIVITY_LOG_RETENTION_MONTHS", "6"))
+PARTITION_MAINTENANCE_INTERVAL = 3600
+
+ACTIVITY_LOG_WRITTEN = Counter("activity_log_written_total", "Activity log rows written to the database")
+ACTIVITY_LOG_DROPPED = Counter("activity_log_dropped_total", "Activity log rows dropped because the buffer was full")
+ACTIVITY_LOG_BUFFERED = Gauge("activity_log_buffered", "Activity log rows waiting to be flushed")
+
+
+class ActivityLogWriter:
+    """
+    Буфер activity log в памяти: запросы только добавляют запись в очередь,
+    фоновый поток сбрасывает её пачками multi-row INSERT-ом и обслуживает партиции.
+    """
+
+    def __init__(self):
+        self._buffer = deque()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_maintenance = 0.0
+
+    def record(self, user_id: Optional[int], action: str, ip_address: Optional[str]):
+        if len(self._buffer) >= ACTIVITY_LOG_BUFFER_LIMIT:
+            ACTIVITY_LOG_DROPPED.inc()
+            return
+        # deque.append потокобезопасен — лок на горячем пути не нужен
+        self._buffer.append({
+            "user_id": user_id,
+            "action": action,
+            "ip_address": ip_address,
+            "created_at": datetime.utcnow(),
+        })
+        if len(self._buffer) >= ACTIVITY_LOG_BATCH_SIZE:
+            self._wakeup.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="activity-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final activity log flush failed")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if time.time() - self._last_maintenance >= PARTITION_MAINTENANCE_INTERVAL:
+                    self.maintain_partitions()
+                self.flush()
+            except Exception:
+                logger.exception("Activity log flush failed")
+            self._wakeup.wait(ACTIVITY_LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+
+    def flush(self):
+        while self._buffer:
+            batch = []
+            while self._buffer and len(batch) < ACTIVITY_LOG_BATCH_SIZE:
+                batch.append(self._buffer.popleft())
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(models.ActivityLog.__table__), batch)
+            except Exception:
+                # Возвращаем пачку в начало очереди и пробуем на следующем цикле
+                self._buffer.extendleft(reversed(batch))
+                raise
+            finally:
+                ACTIVITY_LOG_BUFFERED.set(len(self._buffer))
+            ACTIVITY_LOG_WRITTEN.inc(len(batch))
+
+    def maintain_partitions(self):
+        table = models.ActivityLog.__tablename__
+        with engine.begin() as connection:
+            ensure_monthly_partitions(connection, table)
+            cutoff = add_months(month_start(datetime.utcnow()), -ACTIVITY_LOG_RETENTION_MONTHS)
+            dropped = drop_partitions_before(connection, table, cutoff)
+        if dropped:
+            logger.info(f"Dropped expired activity log partitions: {', '.join(dropped)}")
+        self._last_maintenance = time.time()
+
+
+activity_log_writer = ActivityLogWriter()
+
+
+def log_activity(request, user_id: Optional[int], action: str):
+    client_ip = request.client.host if request.client else None
+    activity_log_writer.record(user_id, action, client_ip)
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+from deadlines import route_template
+
+ADMISSION_INITIAL_LIMIT = float(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+ADMISSION_MIN_LIMIT = float(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = float(os.getenv("ADMISSION_MAX_LIMIT", "200"))
+# Если запрос обрабатывался дольше — считаем это признаком перегрузки и уменьшаем лимит
+ADMISSION_LATENCY_TARGET = float(os.getenv("ADMISSION_LATENCY_TARGET", "0.5"))
+# Цели задержки по шаблону маршрута, для остальных — ADMISSION_LATENCY_TARGET. У /batch и выгрузок
+# архива бюджет в десятки секунд: их задержка — не признак перегрузки, лимит они меняют только ошибками.
+# Переопределяются через ADMISSION_ROUTE_TARGETS="/orders/=0.2,/batch=off"
+ADMISSION_ROUTE_TARGETS: Dict[str, Optional[float]] = {
+    "/batch": None,
+    "/orders/archive/{month}": None,
+    "/orders/archive/{month}/download": None,
+}
+for _item in filter(None, os.getenv("ADMISSION_ROUTE_TARGETS", "").split(",")):
+    _path, _, _target = _item.rpartition("=")
+    ADMISSION_ROUTE_TARGETS[_path.strip()] = None if _target.strip() == "off" else float(_target)
+ADMISSION_BACKOFF_RATIO = 0.9
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "1.0"))
+
+HIGH, NORMAL, LOW = "high", "normal", "low"
+PRIORITIES = (HIGH, NORMAL, LOW)
+QUEUE_LIMITS = {HIGH: 100, NORMAL: 50, LOW: 5}
+
+# Классы приоритета по префиксу пути: аутентификация и health — высокий, выгрузки — низкий
+PRIORITY_PREFIXES = (
+    ("/token", HIGH),
+    ("/health", HIGH),
+    ("/metrics", HIGH),
+    ("/orders/archive", LOW),
+)
+
+# Потоки SSE открыты минутами: слот лимита и замер задержки для них бессмысленны.
+# Профилировщик нужен именно под перегрузкой — его не отбрасываем
+UNLIMITED_PATHS = ("/changes", "/debug/profile")
+
+ADMISSION_LIMIT = Gauge("admission_concurrency_limit", "Current adaptive concurrency limit")
+ADMISSION_INFLIGHT = Gauge("admission_inflight_requests", "Requests currently admitted")
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for admission", ["priority"])
+ADMISSION_SHED = Counter("admission_shed_total", "Requests rejected by admission control", ["priority"])
+
+
+def latency_target(route: Optional[str]) -> Optional[float]:
+    return ADMISSION_ROUTE_TARGETS.get(route, ADMISSION_LATENCY_TARGET)
+
+
+def request_priority(path: str) -> str:
+    for prefix, priority in PRIORITY_PREFIXES:
+        if path.startswith(prefix):
+            return priority
+    return NORMAL
+
+
+class AdaptiveLimiter:
+    """
+    AIMD-лимит конкурентности: медленный (дольше цели маршрута) или неуспешный ответ уменьшает
+    лимит мультипликативно, быстрый ответ при загруженном лимите — увеличивает на 1/limit.
+    Маршруты без цели задержки влияют на лимит только ошибками.
+    Сверх лимита запросы ждут в ограниченной очереди своего приоритета.
+    """
+
+    def __init__(self):
+        self.limit = ADMISSION_INITIAL_LIMIT
+        self.inflight = 0
+        self.queues: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        ADMISSION_LIMIT.set(self.limit)
+
+    async def acquire(self, priority: str) -> bool:
+        if self.inflight < int(self.limit) and not any(self.queues.values()):
+            self._admit()
+            return True
+
+        queue = self.queues[priority]
+        if len(queue) >= QUEUE_LIMITS[priority]:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        ADMISSION_QUEUE_DEPTH.labels(priority=priority).set(len(queue))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), ADMISSION_MAX_QUEUE_WAIT)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот выдали в момент таймаута — отдаём его следующему
+                self.release(0.0, success=True, target=None, observe=False)
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Слот выдан, но задачу отменили до возобновления (отключение клиента, остановка) —
+                # до release в middleware она не дойдёт, возвращаем слот здесь
+                self.release(0.0, success=True, target=None, observe=False)
+            raise
+        finally:
+            if waiter in queue:
+                queue.remove(waiter)
+            ADMISSION_QUEUE_DEPTH.labels(priority=priority).set(len(queue))
+
+    def release(self, latency: float, success: bool, target: Optional[float], observe: bool = True):
+        self.inflight -= 1
+        if observe:
+            if not success or (target is not None and latency > target):
+                self.limit = max(ADMISSION_MIN_LIMIT, self.limit * ADMISSION_BACKOFF_RATIO)
+            elif target is not None and self.inflight + 1 >= self.limit / 2:
+                self.limit = min(ADMISSION_MAX_LIMIT, self.limit + 1 / self.limit)
+            ADMISSION_LIMIT.set(self.limit)
+
+        # Освободившиеся слоты — ожидающим, в порядке приоритета
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue and self.inflight < int(self.limit):
+                waiter = queue.popleft()
+                if not waiter.done():
+                    self._admit()
+                    waiter.set_result(True)
+            ADMISSION_QUEUE_DEPTH.labels(priority=priority).set(len(queue))
+        ADMISSION_INFLIGHT.set(self.inflight)
+
+    def _admit(self):
+        self.inflight += 1
+        ADMISSION_INFLIGHT.set(self.inflight)
+
+
+class AdmissionMiddleware:
+    # Отказ сверх лимита — сразу 503 с Retry-After, до роутинга и обращения к БД
+
+    def __init__(self, app, limiter: AdaptiveLimiter, router):
+        self.app = app
+        self.limiter = limiter
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        # Подзапросы POST /batch уже учтены слотом самого батча
+        if (scope["type"] != "http" or scope.get("state", {}).get("batch_id")
+                or scope["path"] in UNLIMITED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        priority = request_priority(scope["path"])
+        if not await self.limiter.acquire(priority):
+            ADMISSION_SHED.labels(priority=priority).inc()
+            body = json.dumps({"detail": "Server overloaded, retry later"}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode("latin-1")),
+                            (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        status_code = 500
+
+        async def tracking_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        target = latency_target(route_template(self.router, scope))
+        start_time = time.monotonic()
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            self.limiter.release(time.monotonic() - start_time, success=status_code < 500, target=target)
@@ -0,0 +1,27 @@
+"""User password hash and role
+
+Revision ID: 5b8e0f3d2a71
+Revises: c4f2a7d91e36
+Create Date: 2026-10-19 18:20:33.904127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0f3d2a71'
+down_revision = 'c4f2a7d91e36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Пароли, сохранённые открытым текстом, перехэшируются в argon2id при следующем входе
+    op.drop_index(op.f('ix_users_password'), table_name='users')
+    op.add_column('users', sa.Column('role', sa.String(length=20), server_default='user', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'role')
+    op.create_index(op.f('ix_users_password'), 'users', ['password'], unique=False)
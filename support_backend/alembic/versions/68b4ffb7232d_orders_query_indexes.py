@@ -0,0 +1,36 @@
+"""Orders query indexes
+
+Revision ID: 68b4ffb7232d
+Revises: 933ec0dfe67f
+Create Date: 2026-10-19 10:12:04.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '68b4ffb7232d'
+down_revision = '933ec0dfe67f'
+branch_labels = None
+depends_on = None
+
+ORDER_INDEXES = [
+    ('ix_orders_user_id_id', ['user_id', 'id']),
+    ('ix_orders_user_id_status_id', ['user_id', 'status', 'id']),
+    ('ix_orders_user_id_total_amount_id', ['user_id', 'total_amount', 'id']),
+    ('ix_orders_status_id', ['status', 'id']),
+    ('ix_orders_status_total_amount_id', ['status', 'total_amount', 'id']),
+    ('ix_orders_total_amount_id', ['total_amount', 'id']),
+]
+
+def upgrade():
+    # CONCURRENTLY не работает внутри транзакции — строим индексы без блокировки записи
+    with op.get_context().autocommit_block():
+        for name, columns in ORDER_INDEXES:
+            op.create_index(name, 'orders', columns, postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in ORDER_INDEXES:
+            op.drop_index(name, table_name='orders', postgresql_concurrently=True, if_exists=True)
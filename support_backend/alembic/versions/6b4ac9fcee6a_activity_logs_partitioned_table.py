@@ -0,0 +1,34 @@
+"""Activity logs partitioned table
+
+Revision ID: 6b4ac9fcee6a
+Revises: 68b4ffb7232d
+Create Date: 2026-10-19 11:03:47.520914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b4ac9fcee6a'
+down_revision = '68b4ffb7232d'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Родительская таблица; помесячные партиции создаёт и удаляет activity_log.ActivityLogWriter
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS activity_logs (
+            id BIGSERIAL NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            user_id INTEGER,
+            action VARCHAR(100) NOT NULL,
+            ip_address VARCHAR(45),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.create_index('ix_activity_logs_user_id_created_at_id', 'activity_logs',
+                    ['user_id', 'created_at', 'id'], if_not_exists=True)
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS activity_logs CASCADE")
@@ -0,0 +1,43 @@
+"""Notify on table changes
+
+Revision ID: 7d1e3c5a9b20
+Revises: a2943f4fe813
+Create Date: 2026-10-19 14:05:41.227583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d1e3c5a9b20'
+down_revision = 'a2943f4fe813'
+branch_labels = None
+depends_on = None
+
+NOTIFY_TABLES = ['users', 'profiles', 'orders', 'user_roles', 'user_user_roles']
+
+
+def upgrade():
+    # Триггеры уровня оператора: одно уведомление на INSERT/UPDATE/DELETE, а не на каждую строку.
+    # Postgres схлопывает одинаковые уведомления в пределах транзакции
+    op.execute("""
+        CREATE FUNCTION notify_table_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in NOTIFY_TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()
+        """)
+
+
+def downgrade():
+    for table in NOTIFY_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_changed ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_table_changed()")
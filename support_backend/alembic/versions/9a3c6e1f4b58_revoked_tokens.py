@@ -0,0 +1,50 @@
+"""Revoked tokens
+
+Revision ID: 9a3c6e1f4b58
+Revises: 5b8e0f3d2a71
+Create Date: 2026-10-19 19:47:12.630518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3c6e1f4b58'
+down_revision = '5b8e0f3d2a71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'revoked_tokens',
+        sa.Column('jti', sa.String(length=36), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('jti'),
+    )
+    op.create_index(op.f('ix_revoked_tokens_expires_at'), 'revoked_tokens', ['expires_at'], unique=False)
+
+    # Воркеры держат список отозванных jti в памяти и дополняют его по этому уведомлению
+    op.execute("""
+        CREATE FUNCTION notify_token_revoked() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('token_revoked', NEW.jti || ':' || extract(epoch FROM NEW.expires_at));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER revoked_tokens_notify
+        AFTER INSERT ON revoked_tokens
+        FOR EACH ROW EXECUTE FUNCTION notify_token_revoked()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS revoked_tokens_notify ON revoked_tokens")
+    op.execute("DROP FUNCTION IF EXISTS notify_token_revoked()")
+    op.drop_index(op.f('ix_revoked_tokens_expires_at'), table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
@@ -0,0 +1,141 @@
+"""Partition orders by created_at
+
+Revision ID: a2943f4fe813
+Revises: 6b4ac9fcee6a
+Create Date: 2026-10-19 12:20:15.804116
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2943f4fe813'
+down_revision = '6b4ac9fcee6a'
+branch_labels = None
+depends_on = None
+
+COPY_BATCH_SIZE = 10000
+
+ORDER_INDEXES = [
+    ('ix_orders_created_at_id', ['created_at', 'id']),
+    ('ix_orders_user_id_created_at_id', ['user_id', 'created_at', 'id']),
+    ('ix_orders_user_id_id', ['user_id', 'id']),
+    ('ix_orders_user_id_status_id', ['user_id', 'status', 'id']),
+    ('ix_orders_user_id_total_amount_id', ['user_id', 'total_amount', 'id']),
+    ('ix_orders_status_id', ['status', 'id']),
+    ('ix_orders_status_total_amount_id', ['status', 'total_amount', 'id']),
+    ('ix_orders_total_amount_id', ['total_amount', 'id']),
+]
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    # Онлайн-миграция: новая партиционированная таблица наполняется пачками,
+    # пока триггер зеркалирует в неё текущие записи; подмена — одной короткой транзакцией.
+    # Партиции DEFAULT нет намеренно: с ней невозможен DETACH ... CONCURRENTLY при архивации.
+    connection = op.get_bind()
+
+    # 1. Возвращаем created_at (удалена в 0e5b0cae2322). Со значением по умолчанию now()
+    #    ADD COLUMN не переписывает таблицу
+    op.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now()")
+
+    # 2. Партиционированная копия с тем же sequence для id
+    op.execute("""
+        CREATE TABLE orders_partitioned (LIKE orders INCLUDING DEFAULTS)
+        PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER TABLE orders_partitioned ALTER COLUMN created_at SET NOT NULL")
+    op.execute("ALTER TABLE orders_partitioned ADD PRIMARY KEY (id, created_at)")
+    op.execute("ALTER TABLE orders_partitioned ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+
+    first = connection.execute(sa.text("SELECT min(created_at) FROM orders")).scalar() or datetime.utcnow()
+    month = _month_start(first)
+    last = _add_months(_month_start(datetime.utcnow()), 2)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE orders_{month:%Y_%m} PARTITION OF orders_partitioned "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+        )
+        month = _add_months(month, 1)
+
+    # Индексы строим до копирования под временными именами, после подмены переименуем
+    for name, columns in ORDER_INDEXES:
+        op.create_index(f'{name}_p', 'orders_partitioned', columns)
+
+    # 3. Триггер зеркалирует изменения в orders на время копирования
+    op.execute("""
+        CREATE FUNCTION orders_partitioned_sync() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO orders_partitioned (id, user_id, total_amount, status, created_at)
+                VALUES (NEW.id, NEW.user_id, NEW.total_amount, NEW.status, NEW.created_at)
+                ON CONFLICT DO NOTHING;
+                RETURN NEW;
+            ELSIF TG_OP = 'UPDATE' THEN
+                UPDATE orders_partitioned
+                SET user_id = NEW.user_id, total_amount = NEW.total_amount,
+                    status = NEW.status, created_at = NEW.created_at
+                WHERE id = OLD.id;
+                RETURN NEW;
+            ELSE
+                DELETE FROM orders_partitioned WHERE id = OLD.id;
+                RETURN OLD;
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER orders_partitioned_sync
+        AFTER INSERT OR UPDATE OR DELETE ON orders
+        FOR EACH ROW EXECUTE FUNCTION orders_partitioned_sync()
+    """)
+
+    # 4. Копирование пачками, каждая пачка — отдельная короткая транзакция.
+    #    FOR SHARE не даёт конкурентному UPDATE проскочить мимо ещё не скопированной строки
+    with op.get_context().autocommit_block():
+        max_id = connection.execute(sa.text("SELECT coalesce(max(id), 0) FROM orders")).scalar()
+        for start in range(0, max_id, COPY_BATCH_SIZE):
+            connection.execute(sa.text("""
+                INSERT INTO orders_partitioned (id, user_id, total_amount, status, created_at)
+                SELECT id, user_id, total_amount, status, coalesce(created_at, now())
+                FROM orders
+                WHERE id > :start AND id <= :end
+                FOR SHARE
+                ON CONFLICT DO NOTHING
+            """), {"start": start, "end": start + COPY_BATCH_SIZE})
+
+    # 5. Подмена таблиц под короткой эксклюзивной блокировкой
+    op.execute("LOCK TABLE orders IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER orders_partitioned_sync ON orders")
+    op.execute("DROP FUNCTION orders_partitioned_sync()")
+    op.execute("ALTER TABLE orders RENAME TO orders_old")
+    op.execute("ALTER TABLE orders_partitioned RENAME TO orders")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("DROP TABLE orders_old")
+    op.execute("ALTER TABLE orders ALTER COLUMN created_at SET DEFAULT now()")
+    for name, _ in ORDER_INDEXES:
+        op.execute(f"ALTER INDEX {name}_p RENAME TO {name}")
+
+
+def downgrade():
+    op.execute("CREATE TABLE orders_plain (LIKE orders INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO orders_plain SELECT * FROM orders")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders_plain.id")
+    op.execute("DROP TABLE orders CASCADE")
+    op.execute("ALTER TABLE orders_plain RENAME TO orders")
+    op.execute("ALTER TABLE orders ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE orders ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+    op.execute("ALTER TABLE orders DROP COLUMN created_at")
+    for name, columns in ORDER_INDEXES[2:]:
+        op.create_index(name, 'orders', columns)
@@ -0,0 +1,89 @@
+"""Change events outbox
+
+Revision ID: c4f2a7d91e36
+Revises: 7d1e3c5a9b20
+Create Date: 2026-10-19 16:42:10.518904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f2a7d91e36'
+down_revision = '7d1e3c5a9b20'
+branch_labels = None
+depends_on = None
+
+# Таблица -> имя сущности в событии
+CHANGE_EVENT_TABLES = {'users': 'user', 'profiles': 'profile', 'orders': 'order'}
+
+
+def upgrade():
+    op.create_table(
+        'change_events',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_change_events_created_at', 'change_events', ['created_at'])
+    op.create_index('ix_change_events_user_id_id', 'change_events', ['user_id', 'id'])
+    op.create_index('ix_change_events_entity_entity_id_id', 'change_events', ['entity', 'entity_id', 'id'])
+
+    # Сущность передаётся аргументом триггера: на партиционированной orders TG_TABLE_NAME — имя партиции.
+    # Событие пишется в outbox в той же транзакции и уходит в NOTIFY, который доставляется при COMMIT
+    op.execute("""
+        CREATE FUNCTION record_change_event() RETURNS trigger AS $$
+        DECLARE
+            data jsonb;
+            event change_events%ROWTYPE;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                data := to_jsonb(OLD);
+            ELSE
+                data := to_jsonb(NEW);
+                IF TG_OP = 'UPDATE' AND data = to_jsonb(OLD) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+
+            INSERT INTO change_events (entity, entity_id, user_id, op, status)
+            VALUES (
+                TG_ARGV[0],
+                (data->>'id')::bigint,
+                CASE WHEN TG_ARGV[0] = 'user' THEN (data->>'id')::int ELSE (data->>'user_id')::int END,
+                TG_OP,
+                data->>'status'
+            )
+            RETURNING * INTO event;
+
+            PERFORM pg_notify('change_events', json_build_object(
+                'id', event.id, 'entity', event.entity, 'entity_id', event.entity_id,
+                'user_id', event.user_id, 'op', event.op, 'status', event.status,
+                'created_at', event.created_at
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table, entity in CHANGE_EVENT_TABLES.items():
+        op.execute(f"""
+            CREATE TRIGGER {table}_record_change_event
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION record_change_event('{entity}')
+        """)
+
+
+def downgrade():
+    for table in CHANGE_EVENT_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_record_change_event ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS record_change_event()")
+    op.drop_index('ix_change_events_entity_entity_id_id', table_name='change_events')
+    op.drop_index('ix_change_events_user_id_id', table_name='change_events')
+    op.drop_index('ix_change_events_created_at', table_name='change_events')
+    op.drop_table('change_events')
@@ -0,0 +1,25 @@
+"""Role permissions bitmask
+
+Revision ID: e6d41b9c07a3
+Revises: 9a3c6e1f4b58
+Create Date: 2026-10-19 21:03:58.117342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6d41b9c07a3'
+down_revision = '9a3c6e1f4b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Битовая маска permissions.Permission; существующие роли прав не получают — их выдаёт администратор
+    op.add_column('user_roles', sa.Column('permissions', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('user_roles', 'permissions')
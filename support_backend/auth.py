@@ -1,56 +1,319 @@
+import logging
+import os
+import threading
+import time
+import uuid
 from fastapi.security import HTTPBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import models
+from database import SessionLocal
+from notifications import notification_listener
+from permissions import ALL_PERMISSIONS, Permission
+from passwords import hash_password, hash_password_async, verify_password_async
+from revocation import revocation_list
+from shmcache import shared_cache
+from tracing import span
+
+logger = logging.getLogger("app")
 
 # Схема для Bearer токена
 bearer_scheme = HTTPBearer()
 
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_DAYS = 3650
+# Access-токен живёт минуты: отзыв нужен редко и проверяется в памяти; сессию продлевает refresh-токен
+ACCESS_TOKEN_EXPIRE_MINUTES = float(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+ACCESS_TOKEN, REFRESH_TOKEN = "access", "refresh"
+# Проверенные токены: подпись JWT проверяется один раз за время жизни токена
+TOKEN_CACHE_SIZE = 10000
 
-fake_users_db = {
-    "admin": {
-        "username": "admin",
-        "password": "secret",
-        "role": "admin"
-    }
-}
+# Администратор создаётся при старте, если задан пароль и такого пользователя ещё нет
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 
+# Записи пользователей для get_current_user: без запроса к БД на каждый авторизованный запрос.
+# Изменения пользователей сбрасывают кэш (события сессии и NOTIFY table_changed из других воркеров)
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_SIZE = 10000
 
-def create_access_token(data: dict):
+
+class UserCache:
+    def __init__(self, ttl: float = AUTH_USER_CACHE_TTL):
+        self.ttl = ttl
+        self._users: Dict[str, Tuple[float, Optional[dict]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> Tuple[bool, Optional[dict]]:
+        entry = self._users.get(username)
+        if entry is not None and entry[0] >= time.monotonic():
+            return True, entry[1]
+        # Запись, уже загруженная другим воркером хоста
+        found, user = shared_cache.get("user", username)
+        if found:
+            self._remember(username, user)
+        return found, user
+
+    def put(self, username: str, user: Optional[dict]):
+        self._remember(username, user)
+        shared_cache.put("user", username, user, self.ttl)
+
+    def _remember(self, username: str, user: Optional[dict]):
+        with self._lock:
+            self._users.pop(username, None)
+            if len(self._users) >= AUTH_USER_CACHE_SIZE:
+                del self._users[next(iter(self._users))]
+            self._users[username] = (time.monotonic() + self.ttl, user)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+        shared_cache.invalidate("user")
+
+
+user_cache = UserCache()
+
+
+class TokenClaims(NamedTuple):
+    sub: str
+    jti: str
+    exp: float
+    typ: str
+
+
+_verified_tokens: Dict[str, TokenClaims] = {}
+
+
+def _create_token(data: dict, token_type: str, lifetime: timedelta) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    expire = datetime.utcnow() + lifetime
+    # jti — идентификатор для отзыва, typ не даёт использовать refresh-токен как access и наоборот
+    to_encode.update({"exp": expire, "jti": str(uuid.uuid4()), "typ": token_type})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_access_token(data: dict):
+    return _create_token(data, ACCESS_TOKEN, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_refresh_token(data: dict):
+    return _create_token(data, REFRESH_TOKEN, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+
+def verify_token(token: str) -> Optional[TokenClaims]:
+    # Подпись и срок; результат проверки кэшируется до истечения токена (общий с rate limiter).
+    # Отзыв здесь не проверяется — это делает вызывающий через revocation_list
+    claims = _verified_tokens.get(token)
+    if claims is not None:
+        if claims.exp > time.time():
+            return claims
+        _verified_tokens.pop(token, None)
+        return None
+    found, shared = shared_cache.get("token", token)
+    if found:
+        claims = TokenClaims(*shared)
+    else:
+        try:
+            with span("auth.jwt_decode"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        if payload.get("sub") is None or payload.get("jti") is None or payload.get("typ") is None:
+            # Токены старого формата (без jti) отозвать нельзя — не принимаем
+            return None
+        claims = TokenClaims(payload["sub"], payload["jti"], float(payload["exp"]), payload["typ"])
+        shared_cache.put("token", token, list(claims), claims.exp - time.time())
+    if len(_verified_tokens) >= TOKEN_CACHE_SIZE:
+        _verified_tokens.clear()
+    _verified_tokens[token] = claims
+    return claims
+
+
+def _user_record(db: Session, user: models.User) -> dict:
+    # Права ролей сворачиваются в одну битовую маску при загрузке записи — проверка прав
+    # в запросе становится битовой операцией без JOIN по user_user_roles
+    if user.role == "admin":
+        permissions = ALL_PERMISSIONS
+    else:
+        permissions = 0
+        for (mask,) in db.query(models.UserRole.permissions) \
+                .join(models.UserUserRole, models.UserUserRole.role_id == models.UserRole.id) \
+                .filter(models.UserUserRole.user_id == user.id):
+            permissions |= mask
+    return {"id": user.id, "username": user.email, "role": user.role, "permissions": permissions}
+
+
+def _find_user(db: Session, username: str) -> Optional[models.User]:
+    # Логин — email; при дублях берётся самый старый пользователь
+    return db.query(models.User).filter(models.User.email == username).order_by(models.User.id).first()
+
+
+def load_user(username: str) -> Optional[dict]:
+    found, user = user_cache.get(username)
+    if found:
+        return user
+    db = SessionLocal()
+    try:
+        db_user = _find_user(db, username)
+        user = _user_record(db, db_user) if db_user is not None else None
+    finally:
+        db.close()
+    user_cache.put(username, user)
+    return user
+
+
 def get_current_user(
         request: Request,
         token: HTTPAuthorizationCredentials = Depends(bearer_scheme)
 ):
-    try:
-        payload = jwt.decode(token.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+    # Подзапросы POST /batch приходят с уже проверенным пользователем в request.state
+    preauthenticated = getattr(request.state, "user", None)
+    if preauthenticated is not None:
+        return preauthenticated
 
-        user = fake_users_db.get(username)
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
+    # Горячий путь: кэш проверенных токенов, Bloom-фильтр отзыва и кэш пользователей — без БД
+    claims = verify_token(token.credentials)
+    if claims is None or claims.typ != ACCESS_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if revocation_list.is_revoked(claims.jti):
+        raise HTTPException(status_code=401, detail="Token revoked")
 
-        # 💡 Сохраняем пользователя в request.state для middleware
-        request.state.user = user
+    user = load_user(claims.sub)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
 
-        return user
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    # 💡 Сохраняем пользователя в request.state для middleware
+    request.state.user = user
+    request.state.token = claims
+
+    return user
+
+
+def require_permission(permission: Permission):
+    # Зависимость маршрута: пользователь из get_current_user, у которого есть все биты permission
+    def dependency(current_user: dict = Depends(get_current_user)):
+        if current_user["permissions"] & permission != permission:
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+        return current_user
+
+    return dependency
+
+
+def _fetch_password(username: str) -> Tuple[Optional[int], Optional[str]]:
+    db = SessionLocal()
+    try:
+        db_user = _find_user(db, username)
+        if db_user is None:
+            return None, None
+        return db_user.id, db_user.password
+    finally:
+        db.close()
 
 
-def authenticate_user(username: str, password: str):
-    user = fake_users_db.get(username)
-    if not user or user["password"] != password:
+def _store_password_hash(user_id: int, old_password: str, new_hash: str):
+    # Условие на старое значение: не затираем пароль, сменённый параллельно с входом
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.id == user_id, models.User.password == old_password) \
+            .update({models.User.password: new_hash}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def authenticate_user(username: str, password: str):
+    # Запросы к БД — в threadpool, argon2 — в отдельном пуле хэширования: event loop не блокируется
+    user_id, stored = await run_in_threadpool(_fetch_password, username)
+    with span("auth.verify_password"):
+        valid, needs_rehash = await verify_password_async(stored, password)
+    if not valid:
         return False
-    return user
\ No newline at end of file
+
+    if needs_rehash:
+        # Параметры argon2 изменились (или пароль хранился открытым текстом) — пересчитываем при входе
+        try:
+            new_hash = await hash_password_async(password)
+            await run_in_threadpool(_store_password_hash, user_id, stored, new_hash)
+        except Exception:
+            logger.exception(f"Password rehash failed for user {user_id}")
+    return await run_in_threadpool(load_user, username)
+
+
+def issue_tokens(user: dict) -> dict:
+    return {
+        "access_token": create_access_token(data={"sub": user["username"]}),
+        "refresh_token": create_refresh_token(data={"sub": user["username"]}),
+        "token_type": "bearer",
+        "expires_in": int(ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+    }
+
+
+async def refresh_tokens(refresh_token: str) -> dict:
+    claims = verify_token(refresh_token)
+    if claims is None or claims.typ != REFRESH_TOKEN or revocation_list.is_revoked(claims.jti):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    user = await run_in_threadpool(load_user, claims.sub)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    # Ротация: использованный refresh-токен отзывается, повторно предъявить его нельзя.
+    # Из двух параллельных обменов одного токена новую пару получает только первый
+    if not await run_in_threadpool(revocation_list.revoke, claims.jti, user["id"], claims.exp):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return issue_tokens(user)
+
+
+def revoke_token(token: str, user: dict):
+    claims = verify_token(token)
+    if claims is not None and claims.sub == user["username"]:
+        revocation_list.revoke(claims.jti, user["id"], claims.exp)
+
+
+def ensure_admin_user():
+    if not ADMIN_PASSWORD:
+        return
+    db = SessionLocal()
+    try:
+        if _find_user(db, ADMIN_EMAIL) is None:
+            db.add(models.User(name="admin", email=ADMIN_EMAIL, password=hash_password(ADMIN_PASSWORD), role="admin"))
+            db.commit()
+            logger.info(f"Created admin user {ADMIN_EMAIL}")
+    finally:
+        db.close()
+
+
+# Слушаем Session, а не RoutingSession: записи атомарного /batch тоже должны сбрасывать кэш.
+# Роли и членство в них входят в маску прав закэшированных записей
+@event.listens_for(Session, "after_flush")
+def _collect_user_writes(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, (models.User, models.UserRole, models.UserUserRole)):
+            session.info["users_written"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _reset_user_cache(session):
+    if session.info.pop("users_written", False):
+        user_cache.clear()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_writes(session):
+    session.info.pop("users_written", None)
+
+
+def _on_table_changed(table: str):
+    if table in ("users", "user_roles", "user_user_roles"):
+        user_cache.clear()
+
+
+notification_listener.subscribe("table_changed", _on_table_changed)
+notification_listener.on_reconnect(user_cache.clear)
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import HTTPException, Request
+from prometheus_client import Counter, Histogram
+from starlette.concurrency import run_in_threadpool
+
+import schemas
+from database import RoutingSession
+
+MAX_BATCH_REQUESTS = 50
+ALLOWED_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+ALLOWED_PREFIXES = ("/users", "/profiles", "/orders")
+BATCH_ID_HEADER = "x-batch-id"
+
+# Подзапросы дополнительно считаются отдельно, чтобы их можно было
+# отличить от обычного трафика в Prometheus
+BATCH_SUBREQUESTS = Counter(
+    "batch_subrequests_total", "Sub-requests executed via POST /batch", ["method", "status"]
+)
+BATCH_SUBREQUEST_LATENCY = Histogram(
+    "batch_subrequest_duration_seconds", "Latency of sub-requests executed via POST /batch", ["method"]
+)
+
+
+class BatchSession(RoutingSession):
+    """
+    Общая сессия атомарного POST /batch. commit() в обработчиках подзапросов лишь сбрасывает
+    изменения в транзакцию батча (flush). Настоящий COMMIT один — commit_batch() в конце, и только
+    после него срабатывают after_commit-хуки: поколения кэша результатов, single-flight, кэш пользователей.
+    """
+
+    def commit(self):
+        self.flush()
+
+    def commit_batch(self):
+        super().commit()
+
+
+def validate_batch(batch: schemas.BatchRequest):
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one request")
+    if len(batch.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Too many sub-requests (max {MAX_BATCH_REQUESTS})")
+    for sub in batch.requests:
+        if sub.method.upper() not in ALLOWED_METHODS:
+            raise HTTPException(status_code=400, detail=f"Unsupported method: {sub.method}")
+        if not sub.path.startswith(ALLOWED_PREFIXES):
+            raise HTTPException(status_code=400, detail=f"Path not allowed in batch: {sub.path}")
+
+
+async def dispatch(request: Request, sub: schemas.BatchSubRequest, state: dict,
+                   batch_id: str) -> schemas.BatchSubResponse:
+    # Подзапрос проходит через всё приложение (middleware, роутинг, зависимости) в том же процессе —
+    # поэтому он логируется и попадает в метрики как обычный запрос
+    path, _, query_string = sub.path.partition("?")
+    method = sub.method.upper()
+    body = b"" if sub.body is None else json.dumps(sub.body).encode("utf-8")
+
+    headers = [
+        (b"authorization", request.headers.get("authorization", "").encode("latin-1")),
+        (b"content-type", b"application/json"),
+        (BATCH_ID_HEADER.encode("latin-1"), batch_id.encode("latin-1")),
+    ]
+    if body:
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": "1.1",
+        "method": method,
+        "scheme": request.url.scheme,
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "root_path": request.scope.get("root_path", ""),
+        "query_string": query_string.encode("utf-8"),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+        # Пользователь уже аутентифицирован на уровне /batch — get_current_user возьмёт его отсюда
+        # batch_id в state (не в заголовке) — его не подделать снаружи; по нему admission пропускает подзапрос
+        "state": {**state, "batch_id": batch_id},
+    }
+
+    body_sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Как у настоящего соединения: disconnect приходит только после завершения ответа
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    status_code = 500
+    content_type = ""
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal status_code, content_type
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            for key, value in message.get("headers", []):
+                if key.lower() == b"content-type":
+                    content_type = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    start_time = time.time()
+    try:
+        await request.app(scope, receive, send)
+    finally:
+        finished.set()
+    BATCH_SUBREQUEST_LATENCY.labels(method=method).observe(time.time() - start_time)
+    BATCH_SUBREQUESTS.labels(method=method, status=str(status_code)).inc()
+
+    raw = b"".join(chunks)
+    response_body = None
+    if raw:
+        if content_type.startswith("application/json"):
+            response_body = json.loads(raw)
+        else:
+            response_body = raw.decode("utf-8", errors="replace")
+
+    return schemas.BatchSubResponse(status=status_code, body=response_body)
+
+
+async def run_batch(request: Request, batch: schemas.BatchRequest, current_user: dict) -> schemas.BatchResponse:
+    validate_batch(batch)
+    batch_id = uuid.uuid4().hex
+    state = {"user": current_user, "token": getattr(request.state, "token", None)}
+
+    if not batch.atomic:
+        results = [await dispatch(request, sub, state, batch_id) for sub in batch.requests]
+        return schemas.BatchResponse(batch_id=batch_id, results=results)
+
+    # Атомарный режим: все подзапросы работают в одной транзакции сессии батча.
+    # Соединение она берёт лениво — в потоке первого обращающегося к БД обработчика;
+    # COMMIT, ROLLBACK и возврат соединения тоже блокирующие — выполняются вне event loop
+    results: List[schemas.BatchSubResponse] = []
+    committed: Optional[bool] = False
+    db = BatchSession()
+    state["db"] = db
+    try:
+        failed = False
+        for sub in batch.requests:
+            if failed:
+                # После первой ошибки остальные подзапросы не выполняются
+                results.append(schemas.BatchSubResponse(status=424, body={"detail": "Skipped: batch rolled back"}))
+                continue
+            result = await dispatch(request, sub, state, batch_id)
+            results.append(result)
+            failed = result.status >= 400
+
+        if failed:
+            await run_in_threadpool(db.rollback)
+        else:
+            await run_in_threadpool(db.commit_batch)
+            committed = True
+    finally:
+        # close() откатывает незавершённую транзакцию (ошибка коммита, отмена запроса)
+        await run_in_threadpool(db.close)
+
+    return schemas.BatchResponse(batch_id=batch_id, results=results, committed=committed)
@@ -0,0 +1,64 @@
+"""
+POST /orders/ с обычным COMMIT на запрос и с group commit (ORDER_GROUP_COMMIT) при разной конкурентности.
+Клиенты — корутины в том же event loop, что и приложение (httpx ASGITransport), без сети.
+"""
+import asyncio
+import itertools
+import time
+
+import httpx
+from sqlalchemy import text
+
+from benchmarks.common import admin_client, admin_headers, percentile, reset_schema
+
+USERS = 100
+CONCURRENCY = (1, 8, 32, 128)
+REQUESTS_PER_WORKER = 40
+MIN_REQUESTS = 400
+
+
+async def run_level(app, headers, concurrency: int) -> tuple:
+    total = max(MIN_REQUESTS, concurrency * REQUESTS_PER_WORKER)
+    counter = itertools.count()
+    latencies, errors = [], 0
+
+    async def worker(client):
+        nonlocal errors
+        while (i := next(counter)) < total:
+            started = time.perf_counter()
+            response = await client.post("/orders/", headers=headers,
+                                         json={"user_id": 1 + i % USERS, "total_amount": "10.00", "status": "new"})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return total / elapsed, latencies, errors
+
+
+def main():
+    engine = reset_schema()
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (name, email, password, role) "
+            "SELECT 'user' || i, 'user' || i || '@example.com', '', 'user' FROM generate_series(1, :n) i"
+        ), {"n": USERS})
+    headers = admin_headers(admin_client())
+
+    import main as app_module
+
+    print(f"{'mode':<14} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for group_commit in (False, True):
+        app_module.ORDER_GROUP_COMMIT = group_commit
+        for concurrency in CONCURRENCY:
+            throughput, latencies, errors = asyncio.run(run_level(app_module.app, headers, concurrency))
+            print(f"{'group' if group_commit else 'per-request':<14} {concurrency:>7} {throughput:>8.0f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.95) * 1000:>8.2f} "
+                  f"{percentile(latencies, 0.99) * 1000:>8.2f} {errors:>6}")
+
+
+if __name__ == "__main__":
+    main()
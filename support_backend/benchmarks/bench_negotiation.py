@@ -0,0 +1,84 @@
+"""
+Одни и те же страницы в JSON и MessagePack (Accept: application/msgpack): размер тела, запросы в секунду
+через TestClient и скорость кодирования/разбора тела на клиенте. GET /users/ кодирует msgpack сам
+(serialization.render), GET /orders/ перекодируется из JSON в MsgPackMiddleware. Строки страниц
+берутся из кэша результатов — меряется сериализация, а не БД.
+"""
+import json
+import statistics
+import time
+
+import msgpack
+from sqlalchemy import text
+
+from benchmarks.common import admin_client, measure, percentile, reset_schema
+
+USERS = 2000
+ORDERS_PER_USER = 5
+PAGES = (("users, 50 per page", "/users/", {"limit": 50}),
+         ("orders, 50 per page", "/orders/", {"limit": 50}))
+FORMATS = (("json", "application/json"), ("msgpack", "application/msgpack"))
+REPEAT = 1000
+SECONDS = 2.0
+
+
+def seed(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (name, email, password, role) "
+            "SELECT 'user' || i, 'user' || i || '@example.com', '', 'user' FROM generate_series(1, :n) i"
+        ), {"n": USERS})
+        connection.execute(text("INSERT INTO user_roles (name) VALUES ('support'), ('billing'), ('audit')"))
+        connection.execute(text(
+            "INSERT INTO user_user_roles (user_id, role_id) "
+            "SELECT i, r.id FROM generate_series(1, :n) i JOIN user_roles r ON r.id <= 1 + i % 3"
+        ), {"n": USERS})
+        connection.execute(text(
+            "INSERT INTO orders (user_id, total_amount, status, created_at) "
+            "SELECT 1 + i % :n, (i::bigint * 7919 % 100000) / 100.0, 'new', "
+            "date_trunc('month', now()) - interval '2 months' + (i % 7776000) * interval '1 second' "
+            "FROM generate_series(1, :total) i"
+        ), {"n": USERS, "total": USERS * ORDERS_PER_USER})
+        connection.execute(text("ANALYZE"))
+
+
+def per_second(fn) -> float:
+    fn()
+    count, started = 0, time.perf_counter()
+    while time.perf_counter() - started < SECONDS:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    seed(reset_schema())
+    client = admin_client()
+    codecs = {
+        "json": (lambda data: json.dumps(data).encode("utf-8"), json.loads),
+        "msgpack": (lambda data: msgpack.packb(data, datetime=True), lambda body: msgpack.unpackb(body, timestamp=3)),
+    }
+
+    print(f"{USERS} users, {USERS * ORDERS_PER_USER} orders, {REPEAT} requests per case")
+    print(f"{'page':<22} {'format':<8} {'bytes':>7} {'req/s':>8} {'p50 ms':>7} {'encode/s':>9} {'decode/s':>9}")
+    for name, path, params in PAGES:
+        for fmt, media_type in FORMATS:
+            headers = {"Accept": media_type}
+
+            def fetch():
+                response = client.get(path, params=params, headers=headers)
+                response.raise_for_status()
+                return response
+
+            response = fetch()
+            assert response.headers["content-type"].startswith(media_type), response.headers["content-type"]
+            encode, decode = codecs[fmt]
+            data = decode(response.content)
+            samples = measure(fetch, REPEAT)
+            print(f"{name:<22} {fmt:<8} {len(response.content):>7} {1 / statistics.mean(samples):>8.0f} "
+                  f"{percentile(samples, 0.5) * 1000:>7.2f} {per_second(lambda: encode(data)):>9.0f} "
+                  f"{per_second(lambda: decode(response.content)):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
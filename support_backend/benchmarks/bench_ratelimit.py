@@ -0,0 +1,88 @@
+"""
+Стоимость rate limit на запрос: TokenBucketStore.take при разном числе клиентов и шардов
+и накладные расходы RateLimitMiddleware на пустом ASGI-приложении (без HTTP-клиента и сети)
+с ключом по IP и по субъекту JWT. БД не нужна:
+
+    python -m benchmarks.bench_ratelimit
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# ratelimit импортирует auth, а тот — database: engine создаётся при импорте, но к БД не подключается
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+KEY_COUNTS = (1, 1000, 100000)
+SHARD_COUNTS = (1, 64, 1024)
+TAKES = 500000
+REQUESTS = 200000
+# Лимит, который не срабатывает: меряется учёт, а не ответ 429
+RATE, BURST = 1e9, 1e9
+
+
+def take_ns(shards: int, keys: int) -> float:
+    from ratelimit import TokenBucketStore
+
+    store = TokenBucketStore(shards)
+    names = [f"read:user:{i}" for i in range(keys)]
+    for name in names:
+        store.take(name, RATE, BURST, time.time())
+    take = store.take
+    started = time.perf_counter()
+    for i in range(TAKES):
+        take(names[i % keys], RATE, BURST, time.time())
+    return (time.perf_counter() - started) / TAKES * 1e9
+
+
+async def empty_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"0")]})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def request_us(app, headers) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scopes = [{"type": "http", "method": "GET", "path": "/users/", "headers": headers,
+               "client": (f"10.0.{i // 256 % 256}.{i % 256}", 40000), "state": {}} for i in range(1000)]
+    for scope in scopes:
+        await app(scope, receive, send)
+    started = time.perf_counter()
+    for i in range(REQUESTS):
+        await app(scopes[i % len(scopes)], receive, send)
+    return (time.perf_counter() - started) / REQUESTS * 1e6
+
+
+def main():
+    import ratelimit
+    from auth import create_access_token
+
+    ratelimit.RATE_LIMITS["read"] = (RATE, BURST)
+
+    print(f"TokenBucketStore.take, {TAKES} calls (ns/call)")
+    print(f"{'keys':>8}" + "".join(f"{f'{shards} shards':>13}" for shards in SHARD_COUNTS))
+    for keys in KEY_COUNTS:
+        print(f"{keys:>8}" + "".join(f"{take_ns(shards, keys):>13.0f}" for shards in SHARD_COUNTS))
+
+    token = create_access_token(data={"sub": "bench"})
+    cases = [
+        ("no limiter", empty_app, []),
+        ("limiter, key by IP", ratelimit.RateLimitMiddleware(empty_app, redis_url=None), []),
+        ("limiter, key by JWT subject", ratelimit.RateLimitMiddleware(empty_app, redis_url=None),
+         [(b"authorization", f"Bearer {token}".encode("latin-1"))]),
+    ]
+    print(f"\nEmpty ASGI app, {REQUESTS} requests (us/request)")
+    baseline = None
+    for name, app, headers in cases:
+        elapsed = asyncio.run(request_us(app, headers))
+        baseline = elapsed if baseline is None else baseline
+        print(f"{name:<30} {elapsed:>7.2f}   overhead {elapsed - baseline:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Строки в секунду для списков: прежний путь через ORM-объекты и from_attributes против строк Core
+и закэшированных TypeAdapter (serialization.py). Меряется выборка плюс валидация в схемы ответа,
+без HTTP и кэша результатов; страницы берутся по кругу из всей таблицы
+(пользователи — OFFSET, как в GET /users/).
+"""
+import itertools
+import time
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+
+from benchmarks.common import reset_schema
+
+USERS = 20000
+ORDERS_PER_USER = 5
+PAGE_SIZES = (100, 1000)
+SECONDS = 3.0
+
+
+def seed(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (name, email, password, role) "
+            "SELECT 'user' || i, 'user' || i || '@example.com', '', 'user' FROM generate_series(1, :n) i"
+        ), {"n": USERS})
+        connection.execute(text("INSERT INTO user_roles (name) VALUES ('support'), ('billing'), ('audit')"))
+        connection.execute(text(
+            "INSERT INTO user_user_roles (user_id, role_id) "
+            "SELECT i, r.id FROM generate_series(1, :n) i JOIN user_roles r ON r.id <= 1 + i % 3"
+        ), {"n": USERS})
+        connection.execute(text(
+            "INSERT INTO orders (user_id, total_amount, status, created_at) "
+            "SELECT 1 + i % :n, (i::bigint * 7919 % 100000) / 100.0, 'new', "
+            "date_trunc('month', now()) - interval '2 months' + (i % 7776000) * interval '1 second' "
+            "FROM generate_series(1, :total) i"
+        ), {"n": USERS, "total": USERS * ORDERS_PER_USER})
+        connection.execute(text("ANALYZE"))
+
+
+def rows_per_second(load_page, page_size: int, total: int) -> float:
+    offsets = itertools.cycle(range(0, total - page_size + 1, page_size))
+    load_page(next(offsets), page_size)
+    rows, started = 0, time.perf_counter()
+    while time.perf_counter() - started < SECONDS:
+        rows += len(load_page(next(offsets), page_size))
+    return rows / (time.perf_counter() - started)
+
+
+def main():
+    seed(reset_schema())
+
+    import models
+    import schemas
+    from database import SessionLocal
+    from serialization import ORDER_COLUMNS, rows_to, select_users_page, users_page_statement
+
+    db = SessionLocal()
+
+    def users_orm_lazy(skip, limit):
+        # Прежний read_users: связи каждого пользователя догружаются отдельными запросами
+        users = db.query(models.User).order_by(models.User.id).offset(skip).limit(limit).all()
+        result = [schemas.UserResponse.model_validate(user) for user in users]
+        db.expunge_all()
+        return result
+
+    def users_orm_selectin(skip, limit):
+        users = (db.query(models.User).options(selectinload(models.User.orders), selectinload(models.User.roles))
+                 .order_by(models.User.id).offset(skip).limit(limit).all())
+        result = [schemas.UserResponse.model_validate(user) for user in users]
+        db.expunge_all()
+        return result
+
+    def users_core(skip, limit):
+        return select_users_page(db, users_page_statement(skip, limit))
+
+    # Заказы листаются keyset-курсором, как в GET /orders/: id засеяны подряд с 1
+    def orders_orm(skip, limit):
+        orders = db.query(models.Order).filter(models.Order.id > skip).order_by(models.Order.id).limit(limit).all()
+        result = [schemas.OrderResponse.model_validate(order) for order in orders]
+        db.expunge_all()
+        return result
+
+    def orders_core(skip, limit):
+        rows = db.query(*ORDER_COLUMNS).filter(models.Order.id > skip).order_by(models.Order.id).limit(limit).all()
+        return rows_to(List[schemas.OrderResponse], rows)
+
+    cases = [
+        ("users: ORM, lazy relations", users_orm_lazy, USERS),
+        ("users: ORM, selectinload", users_orm_selectin, USERS),
+        ("users: Core + TypeAdapter", users_core, USERS),
+        ("orders: ORM", orders_orm, USERS * ORDERS_PER_USER),
+        ("orders: Core + TypeAdapter", orders_core, USERS * ORDERS_PER_USER),
+    ]
+    print(f"{USERS} users, {USERS * ORDERS_PER_USER} orders")
+    print(f"{'path':<30}" + "".join(f"{f'page {size}':>14}" for size in PAGE_SIZES) + "   (rows/s)")
+    for name, load_page, total in cases:
+        print(f"{name:<30}" + "".join(f"{rows_per_second(load_page, size, total):>14.0f}" for size in PAGE_SIZES))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
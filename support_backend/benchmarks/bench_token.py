@@ -0,0 +1,93 @@
+"""
+POST /token при разной конкурентности: проверка argon2 в пуле хэширования (passwords.hash_executor)
+против проверки прямо в обработчике, в event loop. Параллельно с входами опрашивается /health —
+его задержка показывает, блокирует ли хэширование цикл. Клиенты — корутины в том же event loop,
+что и приложение (httpx ASGITransport), без сети.
+"""
+import asyncio
+import itertools
+import os
+import time
+
+import httpx
+from sqlalchemy import text
+
+# При 32 клиентах и проверке в event loop вход ждёт дольше штатного дедлайна /token — меряется очередь, а не 504
+os.environ.setdefault("ROUTE_DEADLINES", "/token=120")
+
+from benchmarks.common import admin_client, percentile, reset_schema
+
+USERS = 200
+PASSWORD = "bench-password"
+CONCURRENCY = (1, 8, 32)
+LOGINS = 160
+HEALTH_INTERVAL = 0.05
+
+
+async def run_level(app, concurrency: int) -> tuple:
+    counter = itertools.count()
+    latencies, health, errors = [], [], 0
+    done = asyncio.Event()
+
+    async def worker(client):
+        nonlocal errors
+        while (i := next(counter)) < LOGINS:
+            started = time.perf_counter()
+            response = await client.post("/token", params={"username": f"user{1 + i % USERS}@example.com",
+                                                           "password": PASSWORD})
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    async def probe(client):
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/health")
+            health.append(time.perf_counter() - started)
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        prober = asyncio.create_task(probe(client))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+    return LOGINS / elapsed, latencies, health, errors
+
+
+def main():
+    from passwords import hash_password
+
+    engine = reset_schema()
+    # Один хэш на всех: засев 200 хэшей argon2 мерил бы сам себя. Параметры текущие — без пересчёта при входе
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (name, email, password, role) "
+            "SELECT 'user' || i, 'user' || i || '@example.com', :password, 'user' FROM generate_series(1, :n) i"
+        ), {"n": USERS, "password": hash_password(PASSWORD)})
+    admin_client()
+
+    import auth
+    import main as app_module
+    from passwords import verify_password
+
+    async def verify_inline(stored, password):
+        return verify_password(stored, password)
+
+    executor_verify = auth.verify_password_async
+    print(f"{LOGINS} logins per level, /health probed every {HEALTH_INTERVAL * 1000:.0f} ms")
+    print(f"{'mode':<10} {'clients':>7} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'health p50':>11} {'health p99':>11} {'errors':>6}")
+    for mode, verify in (("executor", executor_verify), ("inline", verify_inline)):
+        auth.verify_password_async = verify
+        for concurrency in CONCURRENCY:
+            throughput, latencies, health, errors = asyncio.run(run_level(app_module.app, concurrency))
+            print(f"{mode:<10} {concurrency:>7} {throughput:>9.1f} {percentile(latencies, 0.5) * 1000:>8.1f} "
+                  f"{percentile(latencies, 0.99) * 1000:>8.1f} {percentile(health, 0.5) * 1000:>11.1f} "
+                  f"{percentile(health, 0.99) * 1000:>11.1f} {errors:>6}")
+    auth.verify_password_async = executor_verify
+
+
+if __name__ == "__main__":
+    main()
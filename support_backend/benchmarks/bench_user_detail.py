@@ -0,0 +1,61 @@
+"""
+GET /users/{id}/detail против прежней последовательности read_user -> read_profile -> read_orders_by_user.
+Каждая итерация берёт нового пользователя, чтобы кэш результатов не подменял собой БД.
+"""
+from benchmarks.common import admin_client, measure, report, reset_schema
+
+from sqlalchemy import text
+
+USERS = 6000
+ORDERS_PER_USER = 40
+REPEAT = 2000
+
+
+def seed(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO users (name, email, password, role) "
+            "SELECT 'user' || i, 'user' || i || '@example.com', '', 'user' FROM generate_series(1, :n) i"
+        ), {"n": USERS})
+        connection.execute(text(
+            "INSERT INTO profiles (user_id, bio) SELECT i, 'bio ' || i FROM generate_series(1, :n) i"
+        ), {"n": USERS})
+        connection.execute(text("INSERT INTO user_roles (name) VALUES ('support'), ('billing'), ('audit')"))
+        connection.execute(text(
+            "INSERT INTO user_user_roles (user_id, role_id) "
+            "SELECT i, r.id FROM generate_series(1, :n) i JOIN user_roles r ON r.id = 1 + i % 3"
+        ), {"n": USERS})
+        connection.execute(text(
+            "INSERT INTO orders (user_id, total_amount, status, created_at) "
+            "SELECT 1 + i % :n, (i::bigint * 7919 % 100000) / 100.0, 'new', "
+            "date_trunc('month', now()) - interval '2 months' + (i % 7776000) * interval '1 second' "
+            "FROM generate_series(1, :total) i"
+        ), {"n": USERS, "total": USERS * ORDERS_PER_USER})
+        connection.execute(text("ANALYZE"))
+
+
+def main():
+    seed(reset_schema())
+    client = admin_client()
+    # Администратор занимает users.id = USERS + 1 — выборка идёт только по засеянным
+    detail_ids = iter(range(1, USERS // 2))
+    separate_ids = iter(range(USERS // 2, USERS))
+
+    def detail():
+        user_id = next(detail_ids)
+        client.get(f"/users/{user_id}/detail").raise_for_status()
+
+    def separate():
+        # Профиль засеян с тем же id, что и пользователь
+        user_id = next(separate_ids)
+        client.get(f"/users/{user_id}").raise_for_status()
+        client.get(f"/profiles/{user_id}").raise_for_status()
+        client.get(f"/users/{user_id}/orders", params={"sort": "-created_at", "limit": 10}).raise_for_status()
+
+    print(f"{USERS} users, {USERS * ORDERS_PER_USER} orders, {REPEAT} requests each")
+    report("GET /users/{id}/detail", measure(detail, REPEAT, warmup=50))
+    report("user + profile + orders (3 calls)", measure(separate, REPEAT, warmup=50))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from prometheus_client import Counter, Gauge
+from starlette.concurrency import run_in_threadpool
+
+import models
+import schemas
+from database import SessionLocal
+from notifications import notification_listener
+
+logger = logging.getLogger("app")
+
+# Канал, в который триггеры (миграция c4f2a7d91e36) пишут события из outbox change_events
+CHANGE_EVENTS_CHANNEL = "change_events"
+ENTITIES = ("user", "profile", "order")
+
+# Событий в очереди подписчика; медленный клиент при переполнении отключается и догоняет через Last-Event-ID
+CHANGE_FEED_BUFFER = int(os.getenv("CHANGE_FEED_BUFFER", "100"))
+# Сколько событий отдаётся из outbox за одно подключение; остальное — после переподключения
+CHANGE_FEED_REPLAY_LIMIT = int(os.getenv("CHANGE_FEED_REPLAY_LIMIT", "5000"))
+CHANGE_FEED_REPLAY_PAGE = 500
+CHANGE_FEED_KEEPALIVE_SECONDS = float(os.getenv("CHANGE_FEED_KEEPALIVE_SECONDS", "15"))
+CHANGE_FEED_RETENTION_HOURS = float(os.getenv("CHANGE_FEED_RETENTION_HOURS", "24"))
+CHANGE_FEED_PRUNE_INTERVAL = 600
+# Пауза перед переподключением EventSource (мс)
+CHANGE_FEED_RETRY_MS = 1000
+
+CHANGE_FEED_SUBSCRIBERS = Gauge("change_feed_subscribers", "Open change feed streams")
+CHANGE_FEED_EVENTS = Counter("change_feed_events_total", "Change events received from the database", ["entity"])
+CHANGE_FEED_REPLAYED = Counter("change_feed_replayed_events_total", "Change events replayed from the outbox")
+CHANGE_FEED_DISCONNECTS = Counter(
+    "change_feed_disconnects_total", "Streams closed by the server so the client resumes from Last-Event-ID", ["reason"]
+)
+
+
+class Subscription:
+    __slots__ = ("loop", "queue", "user_id", "entity", "entity_id", "closed")
+
+    def __init__(self, loop, user_id: Optional[int], entity: Optional[str], entity_id: Optional[int]):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CHANGE_FEED_BUFFER)
+        self.user_id = user_id
+        self.entity = entity
+        self.entity_id = entity_id
+        # Причина, по которой поток нужно закрыть (переполнение, потеря уведомлений)
+        self.closed: Optional[str] = None
+
+    @property
+    def index_key(self) -> tuple:
+        # Самый избирательный из фильтров: по нему подписка ищется при рассылке
+        if self.entity_id is not None:
+            return ("entity_id", self.entity, self.entity_id)
+        if self.user_id is not None:
+            return ("user", self.user_id)
+        if self.entity is not None:
+            return ("entity", self.entity)
+        return ("all",)
+
+    def matches(self, event: dict) -> bool:
+        return ((self.user_id is None or event["user_id"] == self.user_id)
+                and (self.entity is None or event["entity"] == self.entity)
+                and (self.entity_id is None or event["entity_id"] == self.entity_id))
+
+    def close(self, reason: str):
+        if self.closed is None:
+            self.closed = reason
+            CHANGE_FEED_DISCONNECTS.labels(reason=reason).inc()
+        # Будим генератор, если он ждёт событий
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+
+def _event_index_keys(event: dict) -> tuple:
+    return (("entity_id", event["entity"], event["entity_id"]), ("user", event["user_id"]),
+            ("entity", event["entity"]), ("all",))
+
+
+def _sse(event_id: int, entity: str, data: str) -> str:
+    return f"id: {event_id}\nevent: {entity}\ndata: {data}\n\n"
+
+
+class ChangeFeed:
+    """
+    Лента изменений users/profiles/orders. Триггеры пишут событие в outbox change_events и в
+    NOTIFY; единственный на воркер слушатель (notification_listener) раздаёт его открытым
+    SSE-потокам с подходящим фильтром. Очередь подписчика ограничена: медленный клиент
+    отключается и продолжает с Last-Event-ID, пропущенное отдаётся из outbox.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[tuple, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="change-feed-pruner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def subscribe(self, user_id: Optional[int], entity: Optional[str], entity_id: Optional[int]) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), user_id, entity, entity_id)
+        with self._lock:
+            self._subscriptions[subscription.index_key].add(subscription)
+        CHANGE_FEED_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.index_key)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.index_key]
+        CHANGE_FEED_SUBSCRIBERS.dec()
+
+    def publish(self, payload: str):
+        # Вызывается из потока слушателя: в event loop подписчиков — один вызов на loop
+        event = json.loads(payload)
+        CHANGE_FEED_EVENTS.labels(entity=event["entity"]).inc()
+        by_loop: Dict[asyncio.AbstractEventLoop, List[Subscription]] = defaultdict(list)
+        with self._lock:
+            for key in _event_index_keys(event):
+                for subscription in self._subscriptions.get(key, ()):
+                    if subscription.matches(event):
+                        by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            loop.call_soon_threadsafe(self._deliver, subscriptions, event["id"], event["entity"], payload)
+
+    def close_all(self, reason: str):
+        # Уведомления, пришедшие без слушателя, потеряны — клиенты догонят их из outbox
+        by_loop: Dict[asyncio.AbstractEventLoop, List[Subscription]] = defaultdict(list)
+        with self._lock:
+            for subscriptions in self._subscriptions.values():
+                for subscription in subscriptions:
+                    by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            loop.call_soon_threadsafe(self._close, subscriptions, reason)
+
+    @staticmethod
+    def _deliver(subscriptions: List[Subscription], event_id: int, entity: str, payload: str):
+        for subscription in subscriptions:
+            if subscription.closed is not None:
+                continue
+            try:
+                subscription.queue.put_nowait((event_id, entity, payload))
+            except asyncio.QueueFull:
+                subscription.closed = "overflow"
+                CHANGE_FEED_DISCONNECTS.labels(reason="overflow").inc()
+
+    @staticmethod
+    def _close(subscriptions: List[Subscription], reason: str):
+        for subscription in subscriptions:
+            subscription.close(reason)
+
+    async def stream(self, user_id: Optional[int], entity: Optional[str], entity_id: Optional[int],
+                     last_event_id: Optional[int]) -> AsyncIterator[str]:
+        # Подписываемся до чтения outbox: событие, закоммиченное между ними, придёт хотя бы одним путём
+        subscription = self.subscribe(user_id, entity, entity_id)
+        try:
+            yield f"retry: {CHANGE_FEED_RETRY_MS}\n\n"
+            replayed: Set[int] = set()
+            if last_event_id is not None:
+                events = await run_in_threadpool(replay_events, last_event_id, user_id, entity, entity_id)
+                for event in events:
+                    replayed.add(event.id)
+                    yield _sse(event.id, event.entity, event.model_dump_json())
+                if len(events) >= CHANGE_FEED_REPLAY_LIMIT:
+                    # Отставание больше лимита: клиент переподключится с последним id и получит продолжение
+                    CHANGE_FEED_DISCONNECTS.labels(reason="replay_limit").inc()
+                    return
+
+            while True:
+                if subscription.closed is not None and subscription.queue.empty():
+                    return
+                try:
+                    item = await asyncio.wait_for(subscription.queue.get(), CHANGE_FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE держит соединение через прокси и выявляет отключившихся клиентов
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    continue
+                event_id, event_entity, payload = item
+                if event_id in replayed:
+                    continue
+                yield _sse(event_id, event_entity, payload)
+        finally:
+            self.unsubscribe(subscription)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                prune_events()
+            except Exception:
+                logger.exception("Change events pruning failed")
+            self._stopped.wait(CHANGE_FEED_PRUNE_INTERVAL)
+
+
+def replay_events(last_event_id: int, user_id: Optional[int], entity: Optional[str],
+                  entity_id: Optional[int]) -> List[schemas.ChangeEventResponse]:
+    # Только primary: событие, ещё не доехавшее до реплики, не пришло бы и через NOTIFY
+    db = SessionLocal()
+    try:
+        query = db.query(models.ChangeEvent)
+        if user_id is not None:
+            query = query.filter(models.ChangeEvent.user_id == user_id)
+        if entity is not None:
+            query = query.filter(models.ChangeEvent.entity == entity)
+        if entity_id is not None:
+            query = query.filter(models.ChangeEvent.entity_id == entity_id)
+
+        events: List[schemas.ChangeEventResponse] = []
+        after = last_event_id
+        while len(events) < CHANGE_FEED_REPLAY_LIMIT:
+            page = (query.filter(models.ChangeEvent.id > after)
+                    .order_by(models.ChangeEvent.id)
+                    .limit(min(CHANGE_FEED_REPLAY_PAGE, CHANGE_FEED_REPLAY_LIMIT - len(events)))
+                    .all())
+            events.extend(schemas.ChangeEventResponse.model_validate(event) for event in page)
+            if len(page) < CHANGE_FEED_REPLAY_PAGE:
+                break
+            after = page[-1].id
+        CHANGE_FEED_REPLAYED.inc(len(events))
+        return events
+    finally:
+        db.close()
+
+
+def prune_events():
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=CHANGE_FEED_RETENTION_HOURS)
+        db.query(models.ChangeEvent).filter(models.ChangeEvent.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+change_feed = ChangeFeed()
+
+notification_listener.subscribe(CHANGE_EVENTS_CHANNEL, change_feed.publish)
+notification_listener.on_reconnect(lambda: change_feed.close_all("reconnect"))
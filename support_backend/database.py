@@ -1,11 +1,108 @@
-from sqlalchemy import create_engine
+import os
+import time
+from prometheus_client import Gauge
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from replicas import ReplicaRouter
 
 # Настройки подключения к БД
-SQLALCHEMY_DATABASE_URL = "postgresql://admin:admin@db/users"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://admin:admin@db/users")
+
+# Реплики для чтения: REPLICA_DATABASE_URLS=postgresql://...@replica1/users,postgresql://...@replica2/users
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# Сколько максимум клиент после записи читает с primary (read-your-writes)
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "10"))
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replica_engines = [create_engine(url, pool_pre_ping=True) for url in REPLICA_DATABASE_URLS]
+replica_router = ReplicaRouter(engine, replica_engines, REPLICA_MAX_LAG_SECONDS, READ_YOUR_WRITES_WINDOW)
+
+
+class RoutingSession(Session):
+    # Чтения сессии, помеченной read_only, уходят на реплику; всё остальное — на primary
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get("read_only") and not self._flushing and replica_router.enabled:
+            # Реплика выбирается один раз на сессию: запросы одного обработчика видят один снимок
+            # и не держат по соединению на каждую реплику
+            bind = self.info.get("read_bind")
+            if bind is None:
+                client_key = self.info.get("client_key")
+                bind = self.info["read_bind"] = replica_router.read_bind(client_key() if client_key else None)
+            return bind
+        return engine
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(session):
+    if not session.info.pop("wrote", False) or not replica_router.enabled:
+        return
+    client_key = session.info.get("client_key")
+    connection = session.info.get("primary_connection")
+    if client_key is None:
+        return
+    # LSN после коммита: реплика, воспроизведшая его, уже видит запись клиента.
+    # Читаем на соединении транзакции — сессия вернёт его в пул только после after_commit
+    try:
+        lsn = connection.exec_driver_sql("SELECT pg_current_wal_lsn()::text").scalar()
+    except Exception:
+        lsn = None  # без LSN клиент просто читает с primary всё окно READ_YOUR_WRITES_WINDOW
+    replica_router.record_write(client_key(), lsn)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
+
+
+@event.listens_for(RoutingSession, "after_begin")
+def _track_connection_checkout(session, transaction, connection):
+    # Соединение сессия берёт из пула при первом запросе транзакции, а не при создании
+    session.info.setdefault("connection_acquired_at", time.monotonic())
+    if connection.engine is engine:
+        session.info["primary_connection"] = connection
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _track_connection_release(session, transaction):
+    if transaction.parent is not None:
+        return
+    session.info.pop("primary_connection", None)
+    acquired_at = session.info.pop("connection_acquired_at", None)
+    if acquired_at is not None:
+        held = time.monotonic() - acquired_at
+        session.info["connection_seconds"] = session.info.get("connection_seconds", 0.0) + held
+
+
+DB_POOL_IN_USE = Gauge("db_pool_connections_in_use", "Connections checked out of the pool", ["pool"])
+
+
+def _track_pool(pool_engine, label: str):
+    gauge = DB_POOL_IN_USE.labels(pool=label)
+    event.listen(pool_engine, "checkout", lambda *args: gauge.inc())
+    event.listen(pool_engine, "checkin", lambda *args: gauge.dec())
+
+
+_track_pool(engine, "primary")
+for _index, _replica_engine in enumerate(replica_engines):
+    _track_pool(_replica_engine, f"replica{_index}")
+
+
+def _mark_replica_unhealthy(context):
+    if context.is_disconnect:
+        replica_router.mark_unhealthy(context.engine)
+
+
+for _replica_engine in replica_engines:
+    event.listen(_replica_engine, "handle_error", _mark_replica_unhealthy)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from prometheus_client import Counter
+from sqlalchemy import event
+from starlette.routing import Match
+
+from database import RoutingSession
+
+logger = logging.getLogger("app")
+
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("DEFAULT_DEADLINE_SECONDS", "10"))
+
+# Дедлайны по шаблону пути маршрута; переопределяются через
+# ROUTE_DEADLINES="/users/=2,/orders/archive/{month}=60"
+ROUTE_DEADLINES: Dict[str, float] = {
+    "/token": 5,
+    "/users/": 5,
+    "/orders/": 5,
+    "/batch": 30,
+    "/orders/archive/{month}": 30,
+    "/orders/archive/{month}/download": 60,
+}
+# Долгоживущие потоки (SSE): ограничивать нечего, запросы к БД в них со своими сессиями.
+# Сессия профилировщика длится ровно заданное время и ограничена PROFILE_MAX_SECONDS
+STREAMING_ROUTES = ("/changes", "/debug/profile")
+for _item in filter(None, os.getenv("ROUTE_DEADLINES", "").split(",")):
+    _path, _, _seconds = _item.rpartition("=")
+    ROUTE_DEADLINES[_path.strip()] = float(_seconds)
+
+REQUEST_TIMEOUTS = Counter(
+    "request_timeouts_total", "Requests aborted by deadline, statement timeout or client disconnect", ["route", "kind"]
+)
+
+
+class DbCancelScope:
+    # DBAPI-соединения, на которых сейчас работает запрос; cancel() прерывает их текущие запросы
+    def __init__(self):
+        self._connections = set()
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def register(self, dbapi_connection):
+        with self._lock:
+            self._connections.add(dbapi_connection)
+
+    def unregister(self, dbapi_connection):
+        with self._lock:
+            self._connections.discard(dbapi_connection)
+
+    def cancel(self):
+        self.cancelled = True
+        with self._lock:
+            connections = list(self._connections)
+        for dbapi_connection in connections:
+            try:
+                dbapi_connection.cancel()
+            except Exception:
+                logger.exception("Failed to cancel database query")
+
+
+@event.listens_for(RoutingSession, "after_begin")
+def _apply_deadline(session, transaction, connection):
+    deadline = session.info.get("deadline")
+    if deadline is not None and connection.dialect.name == "postgresql":
+        remaining_ms = max(int((deadline - time.monotonic()) * 1000), 1)
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {remaining_ms}")
+
+    cancel_scope = session.info.get("cancel_scope")
+    if cancel_scope is not None:
+        dbapi_connection = connection.connection.dbapi_connection
+        cancel_scope.register(dbapi_connection)
+        session.info.setdefault("cancel_connections", []).append(dbapi_connection)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release_cancel_scope(session, transaction):
+    # Соединение возвращается в пул — отменять на нём уже нечего (и нельзя: его возьмёт другой запрос)
+    if transaction.parent is not None:
+        return
+    cancel_scope = session.info.get("cancel_scope")
+    for dbapi_connection in session.info.pop("cancel_connections", []):
+        if cancel_scope is not None:
+            cancel_scope.unregister(dbapi_connection)
+
+
+def route_template(router, scope) -> Optional[str]:
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+class DeadlineMiddleware:
+    """
+    ASGI-middleware: ограничивает время обработки запроса дедлайном маршрута
+    и прерывает запросы к БД, если дедлайн истёк или клиент отключился.
+    Дедлайн передаётся в request.state, откуда get_db ставит statement_timeout.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(self.router, scope) or scope["path"]
+        if route in STREAMING_ROUTES:
+            await self.app(scope, receive, send)
+            return
+        seconds = ROUTE_DEADLINES.get(route, DEFAULT_DEADLINE_SECONDS)
+        cancel_scope = DbCancelScope()
+        state = scope.setdefault("state", {})
+        state["deadline"] = time.monotonic() + seconds
+        state["cancel_scope"] = cancel_scope
+
+        # Тело запроса читаем целиком заранее: дальше receive слушает только отключение клиента
+        messages = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            messages.append(message)
+            more_body = message.get("more_body", False)
+
+        disconnected = asyncio.Event()
+
+        async def replay_receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        response_started = False
+        response_complete = False
+
+        async def tracking_send(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        app_task = asyncio.ensure_future(self.app(scope, replay_receive, tracking_send))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            done, _ = await asyncio.wait({app_task, watcher}, timeout=seconds,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if app_task in done or response_complete:
+                # Отключение после полностью отправленного ответа — обычное завершение запроса
+                await app_task
+                return
+
+            kind = "disconnect" if watcher in done else "deadline"
+            REQUEST_TIMEOUTS.labels(route=route, kind=kind).inc()
+            logger.warning(f"Request {scope['method']} {scope['path']} aborted: {kind} after {seconds}s budget")
+            cancel_scope.cancel()
+            app_task.cancel()
+
+            if kind == "deadline" and not response_started:
+                body = json.dumps({"detail": "Request deadline exceeded"}).encode("utf-8")
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode("latin-1"))],
+                })
+                await send({"type": "http.response.body", "body": body})
+        finally:
+            watcher.cancel()
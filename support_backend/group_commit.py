@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+
+from database import engine
+
+logger = logging.getLogger("app")
+
+# Включается явно: ORDER_GROUP_COMMIT=1
+ORDER_GROUP_COMMIT = os.getenv("ORDER_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "3"))
+GROUP_COMMIT_MAX_ITEMS = int(os.getenv("GROUP_COMMIT_MAX_ITEMS", "100"))
+
+
+class GroupCommitter:
+    """
+    Копит конкурентные INSERT-ы в окне window_ms (или до max_items штук)
+    и записывает их одним multi-row INSERT ... RETURNING и одним COMMIT.
+    Каждый вызывающий получает свою строку или свою ошибку.
+    """
+
+    def __init__(self, table, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_items: int = GROUP_COMMIT_MAX_ITEMS):
+        self.table = table
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, values: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((values, future))
+
+        if len(self._pending) >= self.max_items:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+
+        return await future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._flush(batch))
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            # Драйвер синхронный — сама запись идёт в пуле потоков, event loop не блокируется
+            results = await loop.run_in_executor(None, self._write, [values for values, _ in batch])
+        except Exception as e:
+            logger.exception("Group commit failed")
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _write(self, rows: List[dict]) -> list:
+        statement = insert(self.table).returning(*self.table.c, sort_by_parameter_order=True)
+        try:
+            with engine.begin() as connection:
+                return [dict(row) for row in connection.execute(statement, rows).mappings()]
+        except DBAPIError:
+            # Одна плохая строка (например, нарушение FK) не должна ронять всю пачку:
+            # повторяем по одной через SAVEPOINT, по-прежнему в одной транзакции
+            return self._write_one_by_one(rows)
+
+    def _write_one_by_one(self, rows: List[dict]) -> list:
+        statement = insert(self.table).returning(*self.table.c)
+        results = []
+        with engine.begin() as connection:
+            for row in rows:
+                savepoint = connection.begin_nested()
+                try:
+                    results.append(dict(connection.execute(statement, row).mappings().one()))
+                    savepoint.commit()
+                except DBAPIError as e:
+                    savepoint.rollback()
+                    results.append(e)
+        return results
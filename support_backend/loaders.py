@@ -0,0 +1,63 @@
+from typing import Dict, List, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import Integer, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+import schemas
+from pagination import MAX_PAGE_SIZE
+from querycache import query_cache
+from singleflight import read_flights
+
+# Сколько id можно запросить за один batch-запрос
+MAX_BATCH_IDS = MAX_PAGE_SIZE
+
+
+def parse_ids(raw: str) -> List[int]:
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {MAX_BATCH_IDS})")
+    return ids
+
+
+def load_by_ids(db: Session, model, ids: List[int], options=()) -> Dict[int, object]:
+    # Один запрос WHERE id = ANY(:ids) с массивом в одном параметре
+    # вместо отдельного SELECT на каждый id
+    unique_ids = list(dict.fromkeys(ids))
+    ids_param = bindparam("ids", unique_ids, type_=ARRAY(Integer))
+    rows = db.query(model).options(*options).filter(model.id == any_(ids_param)).all()
+    return {row.id: row for row in rows}
+
+
+def load_batch(db: Session, model, ids: List[int], schema: Type[BaseModel], tables: Tuple[str, ...],
+               options=()) -> List[schemas.BatchItem]:
+    """
+    Пачка сущностей в порядке входных id, отсутствующие помечаются found=false.
+    Каждая сущность кэшируется в query_cache отдельно (по поколениям tables), поэтому
+    пересекающиеся пачки и повторы берут найденное из кэша; промахи — одним запросом
+    load_by_ids, одинаковые конкурентные промахи схлопываются single-flight.
+    """
+    kind = model.__tablename__
+
+    def load_missing(keys):
+        missing = [entity_id for _, entity_id in keys]
+
+        def load():
+            rows = load_by_ids(db, model, missing, options)
+            return {(kind, entity_id): schema.model_validate(row) for entity_id, row in rows.items()}
+
+        return read_flights.do((kind, "ids", tuple(missing)), load)
+
+    found = query_cache.fetch_many(db, [(kind, entity_id) for entity_id in dict.fromkeys(ids)], tables, load_missing)
+    items = []
+    for entity_id in ids:
+        item = found.get((kind, entity_id))
+        items.append(schemas.BatchItem[schema](id=entity_id, found=item is not None, item=item))
+    return items
@@ -5,13 +5,15 @@ import os
 from logging.handlers import RotatingFileHandler
 from typing import Any
 
+from tracing import current_trace_ids
+
 LOG_DIR = "logs"
 LOG_FILE_PATH = os.path.join(LOG_DIR, "app.json.log")
 
 # Создаем папку для логов
 os.makedirs(LOG_DIR, exist_ok=True)
 
-SENSITIVE_KEYS = {"password", "passwd", "secret", "token", "api_key", "authorization", "refresh_token"}
+SENSITIVE_KEYS = {"password", "passwd", "secret", "token", "api_key", "authorization", "access_token", "refresh_token"}
 
 
 def mask_sensitive_data(data, keys=SENSITIVE_KEYS):
@@ -40,6 +42,11 @@ class JSONFormatter(logging.Formatter):
                 "message": record.getMessage(),
             }
 
+            # Связь записи лога с трассой запроса (если он попал в выборку трассировки)
+            trace_ids = current_trace_ids()
+            if trace_ids is not None:
+                log_data["trace_id"], log_data["span_id"] = trace_ids
+
             # Добавляем extra данные если они есть
             if hasattr(record, 'extra_data'):
                 log_data.update(record.extra_data)
@@ -1,36 +1,86 @@
-import json
-import logging
-from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
-from typing import List
+import os
+import time
+from datetime import datetime
+from decimal import Decimal
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Query
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
 import models
 import schemas
-from database import SessionLocal, engine
-from auth import get_current_user, create_access_token, authenticate_user
+from database import SessionLocal, engine, replica_router
+from auth import (get_current_user, authenticate_user, ensure_admin_user, issue_tokens, refresh_tokens,
+                  require_permission, revoke_token)
+from permissions import ALL_PERMISSIONS, Permission, parse_permissions, permission_names
+from revocation import revocation_list
 from logger import setup_logger
 from fastapi.middleware.cors import CORSMiddleware
 from middleware import log_requests_middleware
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, clamp_limit, keyset_page
+from loaders import parse_ids, load_batch
+from batch import run_batch
+from group_commit import ORDER_GROUP_COMMIT, GroupCommitter
+from activity_log import activity_log_writer, log_activity
+from deadlines import REQUEST_TIMEOUTS, DeadlineMiddleware
+from admission import AdaptiveLimiter, AdmissionMiddleware
+from ratelimit import RateLimitMiddleware
+from negotiation import MsgPackMiddleware
+from tracing import setup_tracing, telemetry_config
+from singleflight import read_flights
+from querycache import query_cache
+from serialization import (ORDER_COLUMNS, parse_fields, render, rows_to, select_users_page, selected_columns,
+                           user_list_tables, users_page_statement)
+from notifications import notification_listener
+from changefeed import ENTITIES, change_feed
+from memory import (GROUPINGS, MemoryTrackingMiddleware, memory_stats, setup_memory_instrumentation, snapshot_store,
+                    start_tracing, stop_tracing, top_allocations)
+from profiling import FORMATS, PROFILE_MAX_SECONDS, profiler_sessions, render_profile, route_codes
+from order_archive import archive_path, list_archives, order_archiver, parse_month, read_archive
+from passwords import hash_password
+from prometheus_client import Counter, Histogram
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # === 1. Настройка логгера ===
 setup_logger()
+setup_tracing()
+setup_memory_instrumentation()
 
 # === 2. Создание таблиц ===
 models.Base.metadata.create_all(bind=engine)
+ensure_admin_user()
+
+# === 2.1. Фоновая запись activity log (батчи + обслуживание партиций) ===
+activity_log_writer.start()
+order_archiver.start()
+replica_router.start()
+notification_listener.start()
+revocation_list.start()
+change_feed.start()
 
 # === 3. Создание приложения ===
 app = FastAPI(
     title="Support Backend API",
     description="API for user management and support system",
-    version="1.0.0"
+    version="1.0.0",
+    telemetry=telemetry_config(),
 )
 
 # === 4. ПОДКЛЮЧАЕМ MIDDLEWARE В ПРАВИЛЬНОМ ПОРЯДКЕ ===
 
-# ВАЖНО: логирующий middleware — первым!
+# Логирующий middleware добавляется первым, то есть оказывается самым внутренним:
+# каждый следующий add_middleware оборачивает уже подключённые
 app.middleware("http")(log_requests_middleware)
 
+# MessagePack (Accept / Content-Type: application/msgpack) — снаружи логирования, оно видит JSON
+app.add_middleware(MsgPackMiddleware)
+
+# Пик аллокаций на запрос (при включённом tracemalloc) — вокруг логирования и MessagePack:
+# именно они держат тела запроса и ответа в сыром и разобранном виде
+app.add_middleware(MemoryTrackingMiddleware, router=app.router)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -38,8 +88,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Дедлайны маршрутов: 504 по истечении, отмена запросов к БД при таймауте и отключении клиента
+app.add_middleware(DeadlineMiddleware, router=app.router)
+
+# Адаптивный лимит конкурентности — снаружи дедлайнов: ожидание в очереди не съедает бюджет маршрута
+app.add_middleware(AdmissionMiddleware, limiter=AdaptiveLimiter(), router=app.router)
+
+# Rate limit по клиенту — самым внешним: превысивший лимит не занимает слот конкурентности
+app.add_middleware(RateLimitMiddleware)
+
+
+# statement_timeout (или отмена запроса) в Postgres — отдаём 503, а не 500
+@app.exception_handler(OperationalError)
+async def database_operational_error_handler(request: Request, exc: OperationalError):
+    if getattr(exc.orig, "pgcode", None) != "57014":  # query_canceled
+        raise exc
+    route = getattr(request.scope.get("route"), "path", request.url.path)
+    REQUEST_TIMEOUTS.labels(route=route, kind="statement").inc()
+    return JSONResponse(status_code=503, content={"detail": "Database statement timeout"},
+                        headers={"Retry-After": "1"})
+
 # === 5. Подключаем Prometheus ПОСЛЕ middleware ===
 # Это добавит /metrics, но мы хотим, чтобы он тоже логировался
 instrumentator = Instrumentator()
@@ -51,13 +122,74 @@ def metrics():
     from fastapi.responses import Response
     return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
 # === 6. Зависимость для БД ===
-def get_db():
+READ_ONLY_METHODS = {"GET", "HEAD"}
+
+
+def client_key(request: Request) -> Optional[str]:
+    # Клиент для read-your-writes: пользователь из токена, иначе IP
+    user = getattr(request.state, "user", None)
+    if user:
+        return user.get("username")
+    return request.client.host if request.client else None
+
+
+DB_CONNECTION_HOLD = Histogram(
+    "db_request_connection_seconds", "Time a request held a database connection", ["route"]
+)
+DB_SESSIONS_WITHOUT_CONNECTION = Counter(
+    "db_request_sessions_unused_total", "Requests whose session never checked out a connection", ["route"]
+)
+
+
+def get_db(request: Request):
+    # Подзапросы атомарного POST /batch используют общую сессию батча
+    shared_db = getattr(request.state, "db", None)
+    if shared_db is not None:
+        yield shared_db
+        return
+
+    # Сессия ленивая: соединение берётся из пула только при первом запросе к БД,
+    # поэтому попадания в кэш и ранние 404/422 пул не трогают.
+    # Обработчики получают её через db_session (scope="function"): сессия закрывается сразу
+    # после обработчика и сериализации ответа, а не после отправки ответа и логирования
     db = SessionLocal()
+    # Читающие запросы идут на реплики (если они настроены), пишущие — на primary
+    db.info["read_only"] = request.method in READ_ONLY_METHODS
+    db.info["client_key"] = lambda: client_key(request)
+    # Остаток дедлайна маршрута уходит в SET LOCAL statement_timeout каждой транзакции
+    db.info["deadline"] = getattr(request.state, "deadline", None)
+    db.info["cancel_scope"] = getattr(request.state, "cancel_scope", None)
     try:
         yield db
     finally:
         db.close()
+        route = getattr(request.scope.get("route"), "path", request.url.path)
+        connection_seconds = db.info.get("connection_seconds")
+        if connection_seconds is None:
+            DB_SESSIONS_WITHOUT_CONNECTION.labels(route=route).inc()
+        else:
+            DB_CONNECTION_HOLD.labels(route=route).observe(connection_seconds)
+
+
+db_session = Depends(get_db, scope="function")
+
+# Проверка прав — битовая операция над маской ролей из закэшированной записи пользователя
+can_read_users = Depends(require_permission(Permission.USERS_READ))
+can_write_users = Depends(require_permission(Permission.USERS_WRITE))
+can_read_profiles = Depends(require_permission(Permission.PROFILES_READ))
+can_write_profiles = Depends(require_permission(Permission.PROFILES_WRITE))
+can_read_orders = Depends(require_permission(Permission.ORDERS_READ))
+can_write_orders = Depends(require_permission(Permission.ORDERS_WRITE))
+can_export_orders = Depends(require_permission(Permission.ORDERS_EXPORT))
+can_read_changes = Depends(require_permission(Permission.CHANGES_READ))
+can_manage_roles = Depends(require_permission(Permission.ROLES_MANAGE))
+can_debug = Depends(require_permission(Permission.DEBUG))
 
 
 # === 7. Маршруты ===
@@ -74,12 +206,21 @@ async def read_home(request: Request):
             <h2>Доступные эндпоинты:</h2>
             <ul>
                 <li><strong>POST /token</strong> — Получить JWT-токен по логину и паролю</li>
+                <li><strong>POST /token/refresh</strong> — Обменять refresh-токен на новую пару токенов</li>
+                <li><strong>POST /token/revoke</strong> — Отозвать текущий токен (выход)</li>
                 <li><strong>POST /users/</strong> — Создать нового пользователя (требуется токен)</li>
                 <li><strong>GET /users/</strong> — Получить список пользователей (требуется токен)</li>
+                <li><strong>GET /users/batch?ids=1,2,3</strong> — Пачка пользователей по ID, также /orders/batch и /profiles/batch (требуется токен)</li>
                 <li><strong>GET /users/{user_id}</strong> — Получить пользователя по ID (требуется токен)</li>
+                <li><strong>GET /users/{user_id}/detail</strong> — Пользователь с профилями, последними заказами и ролями одним запросом (требуется токен)</li>
+                <li><strong>GET /users/{user_id}/logs</strong> — Журнал действий пользователя с фильтром по времени (требуется токен)</li>
                 <li><strong>PUT /users/{user_id}</strong> — Обновить данные пользователя (требуется токен)</li>
                 <li><strong>DELETE /users/{user_id}</strong> — Удалить пользователя (требуется токен)</li>
+                <li><strong>GET /orders/</strong> — Список заказов с фильтрами и курсорной пагинацией (требуется токен)</li>
+                <li><strong>POST /batch</strong> — Выполнить несколько запросов к /users, /profiles, /orders за один HTTP-вызов (требуется токен)</li>
+                <li><strong>GET /orders/archive</strong> — Архивные (выгруженные в Parquet) месяцы заказов (требуется токен)</li>
                 <li><strong>GET /metrics</strong> — Метрики Prometheus для мониторинга</li>
+                <li><strong>GET /health</strong> — Проверка доступности сервиса</li>
             </ul>
             <h2>Полезные ссылки:</h2>
             <ul>
@@ -87,7 +228,7 @@ async def read_home(request: Request):
                 <li><a href="/redoc">ReDoc</a> — альтернативная документация</li>
             </ul>
             <p><strong>Аутентификация:</strong> Используйте <code>/token</code> с тестовыми данными:<br>
-               username: <code>admin</code>, password: <code>secret</code></p>
+               username — email пользователя; администратор создаётся из <code>ADMIN_EMAIL</code>/<code>ADMIN_PASSWORD</code></p>
         </body>
     </html>
     """
@@ -96,60 +237,167 @@ async def read_home(request: Request):
 
 @app.post("/token")
 async def login(request: Request, username: str, password: str):
-    user = authenticate_user(username, password)
+    user = await authenticate_user(username, password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    token = create_access_token(data={"sub": user["username"]})
-    return {"access_token": token, "token_type": "bearer"}
+    return issue_tokens(user)
+
+
+@app.post("/token/refresh")
+async def refresh(body: schemas.RefreshTokenRequest):
+    return await refresh_tokens(body.refresh_token)
+
+
+@app.post("/token/revoke")
+def revoke(request: Request, body: Optional[schemas.RevokeTokenRequest] = None,
+           current_user: dict = Depends(get_current_user)):
+    # Выход: отзываются текущий access-токен и, если передан, refresh-токен того же пользователя
+    # У подзапросов POST /batch в state — токен самого батча
+    claims = getattr(request.state, "token", None)
+    if claims is not None:
+        revocation_list.revoke(claims.jti, current_user["id"], claims.exp)
+    if body is not None and body.refresh_token is not None:
+        revoke_token(body.refresh_token, current_user)
+    return {"detail": "Token revoked"}
+
+
+### BATCH ###
+@app.post("/batch", response_model=schemas.BatchResponse)
+async def batch(request: Request, batch_request: schemas.BatchRequest,
+                current_user: dict = Depends(get_current_user)):
+    return await run_batch(request, batch_request, current_user)
 
 
 ### USERS ###
 @app.post("/users/", response_model=schemas.UserResponse)
-async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db),
-                      current_user: dict = Depends(get_current_user)):
-    db_user = models.User(**user.dict())
+def create_user(request: Request, user: schemas.UserCreate, db: Session = db_session,
+                current_user: dict = can_write_users):
+    db_user = models.User(**{**user.dict(), "password": hash_password(user.password)})
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    log_activity(request, db_user.id, "user_created")
     return db_user
 
 
-@app.get("/users/")
-async def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                     current_user: dict = Depends(get_current_user)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
-    return users
+@app.get("/users/", response_model=List[schemas.UserResponse])
+def read_users(skip: int = 0, limit: int = 100, fields: Optional[str] = None,
+               db: Session = db_session, current_user: dict = can_read_users):
+    started = time.perf_counter()
+    # Быстрый путь: строки Core вместо ORM-объектов, сразу в UserResponse.
+    # ?fields= сужает и ответ, и SELECT; незапрошенные связи не загружаются
+    selected = parse_fields(fields, schemas.UserResponse)
+    statement = users_page_statement(skip, clamp_limit(limit), selected)
+    users = query_cache.fetch(db, (query_cache.query_key(statement), selected), user_list_tables(selected),
+                              lambda: select_users_page(db, statement, selected))
+    return render("/users/", schemas.UserResponse, selected, users, started, many=True)
+
+
+# Пачки по id объявлены до /{id}-маршрутов: иначе "batch" попадёт в параметр пути
+@app.get("/users/batch", response_model=List[schemas.BatchItem[schemas.UserResponse]])
+def read_users_batch(ids: str, db: Session = db_session, current_user: dict = can_read_users):
+    return load_batch(db, models.User, parse_ids(ids), schemas.UserResponse, user_list_tables(None),
+                      options=(selectinload(models.User.orders), selectinload(models.User.roles)))
 
 
 @app.get("/users/{user_id}", response_model=schemas.UserResponse)
-async def read_user(user_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
+def read_user(user_id: int, db: Session = db_session, current_user: dict = can_read_users):
+    # Одинаковые конкурентные запросы разделяют один запрос к БД (и его 404)
+    def load():
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return schemas.UserResponse.model_validate(user)
+
+    return read_flights.do(("user", user_id), load)
+
+
+DEFAULT_RECENT_ORDERS = 10
+
+# Пользователь, профили, последние заказы и роли одним запросом —
+# вместо четырёх последовательных вызовов read_user/read_profile/read_orders_by_user
+USER_DETAIL_SQL = text("""
+    SELECT u.id, u.name, u.email,
+           COALESCE((SELECT json_agg(json_build_object(
+                                'id', p.id, 'user_id', p.user_id,
+                                'bio', p.bio, 'avatar_url', p.avatar_url) ORDER BY p.id)
+                     FROM profiles p
+                     WHERE p.user_id = u.id), '[]'::json) AS profiles,
+           COALESCE((SELECT json_agg(o ORDER BY o.created_at DESC, o.id DESC)
+                     FROM (SELECT id, user_id, total_amount, status, created_at
+                           FROM orders
+                           WHERE user_id = u.id
+                           ORDER BY created_at DESC, id DESC
+                           LIMIT :orders_limit) o), '[]'::json) AS recent_orders,
+           COALESCE((SELECT json_agg(json_build_object('id', r.id, 'name', r.name) ORDER BY r.id)
+                     FROM user_roles r
+                     JOIN user_user_roles ur ON ur.role_id = r.id
+                     WHERE ur.user_id = u.id), '[]'::json) AS roles
+    FROM users u
+    WHERE u.id = :user_id
+""")
+
+
+@app.get("/users/{user_id}/detail", response_model=schemas.UserDetailResponse)
+def read_user_detail(user_id: int, orders_limit: int = Query(DEFAULT_RECENT_ORDERS, ge=0),
+                     db: Session = db_session, current_user: dict = can_read_users):
+    row = db.execute(USER_DETAIL_SQL, {"user_id": user_id,
+                                       "orders_limit": min(orders_limit, MAX_PAGE_SIZE)}).mappings().first()
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return dict(row)
+
+
+# Журнал действий читается только в пределах партиций, попавших в [since, until)
+ACTIVITY_LOG_SORT_KEYS = {
+    "created_at": ([models.ActivityLog.created_at, models.ActivityLog.id], [datetime.fromisoformat, int]),
+}
+
+
+@app.get("/users/{user_id}/logs", response_model=List[schemas.ActivityLogResponse])
+def read_user_logs(user_id: int,
+                   response: Response,
+                   since: Optional[datetime] = None,
+                   until: Optional[datetime] = None,
+                   cursor: Optional[str] = None,
+                   limit: int = DEFAULT_PAGE_SIZE,
+                   db: Session = db_session,
+                   current_user: dict = can_read_users):
+    query = db.query(models.ActivityLog).filter(models.ActivityLog.user_id == user_id)
+    if since is not None:
+        query = query.filter(models.ActivityLog.created_at >= since)
+    if until is not None:
+        query = query.filter(models.ActivityLog.created_at < until)
+
+    logs, next_cursor = keyset_page(query, "-created_at", ACTIVITY_LOG_SORT_KEYS, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return logs
 
 
 @app.put("/users/{user_id}", response_model=schemas.UserResponse)
-async def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(get_db),
-                      current_user: dict = Depends(get_current_user)):
+def update_user(request: Request, user_id: int, user: schemas.UserUpdate, db: Session = db_session,
+                current_user: dict = can_write_users):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
     for key, value in user.dict().items():
-        setattr(db_user, key, value)
+        setattr(db_user, key, hash_password(value) if key == "password" and value is not None else value)
 
     db.commit()
     db.refresh(db_user)
+    log_activity(request, db_user.id, "user_updated")
     return db_user
 
 @app.patch("/users/{user_id}", response_model=schemas.UserResponse)
-async def partial_update_user(
+def partial_update_user(
+        request: Request,
         user_id: int,
         user: schemas.UserUpdate,
-        db: Session = Depends(get_db),
-        current_user: dict = Depends(get_current_user)
+        db: Session = db_session,
+        current_user: dict = can_write_users
 ):
     # Находим пользователя
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -158,6 +406,8 @@ async def partial_update_user(
 
     # Получаем только переданные поля (исключаем None значения)
     update_data = user.dict(exclude_unset=True)
+    if update_data.get("password") is not None:
+        update_data["password"] = hash_password(update_data["password"])
 
     # Обновляем только переданные поля
     for key, value in update_data.items():
@@ -165,42 +415,131 @@ async def partial_update_user(
 
     db.commit()
     db.refresh(db_user)
+    log_activity(request, db_user.id, "user_updated")
     return db_user
 
 
 @app.delete("/users/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def delete_user(request: Request, user_id: int, db: Session = db_session,
+                current_user: dict = can_write_users):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
     db.delete(db_user)
     db.commit()
+    log_activity(request, user_id, "user_deleted")
     return {"detail": "User deleted"}
 
 
+### ROLES ###
+def role_response(role: models.UserRole) -> schemas.RolePermissionsResponse:
+    return schemas.RolePermissionsResponse(id=role.id, name=role.name, permissions=permission_names(role.permissions))
+
+
+@app.get("/permissions", response_model=List[str])
+def read_permissions(current_user: dict = can_manage_roles):
+    return permission_names(ALL_PERMISSIONS)
+
+
+@app.get("/roles/", response_model=List[schemas.RolePermissionsResponse])
+def read_roles(db: Session = db_session, current_user: dict = can_manage_roles):
+    return [role_response(role) for role in db.query(models.UserRole).order_by(models.UserRole.id)]
+
+
+@app.post("/roles/", response_model=schemas.RolePermissionsResponse)
+def create_role(role: schemas.RoleCreate, db: Session = db_session, current_user: dict = can_manage_roles):
+    if db.query(models.UserRole.id).filter(models.UserRole.name == role.name).first():
+        raise HTTPException(status_code=400, detail="Role already exists")
+    db_role = models.UserRole(name=role.name, permissions=parse_permissions(role.permissions))
+    db.add(db_role)
+    db.commit()
+    db.refresh(db_role)
+    return role_response(db_role)
+
+
+@app.put("/roles/{role_id}", response_model=schemas.RolePermissionsResponse)
+def update_role(role_id: int, role: schemas.RoleUpdate, db: Session = db_session,
+                current_user: dict = can_manage_roles):
+    db_role = db.query(models.UserRole).filter(models.UserRole.id == role_id).first()
+    if not db_role:
+        raise HTTPException(status_code=404, detail="Role not found")
+    db_role.name = role.name
+    db_role.permissions = parse_permissions(role.permissions)
+    db.commit()
+    db.refresh(db_role)
+    return role_response(db_role)
+
+
+@app.delete("/roles/{role_id}")
+def delete_role(role_id: int, db: Session = db_session, current_user: dict = can_manage_roles):
+    db_role = db.query(models.UserRole).filter(models.UserRole.id == role_id).first()
+    if not db_role:
+        raise HTTPException(status_code=404, detail="Role not found")
+    db.query(models.UserUserRole).filter(models.UserUserRole.role_id == role_id).delete(synchronize_session=False)
+    db.delete(db_role)
+    db.commit()
+    return {"detail": "Role deleted"}
+
+
+@app.put("/users/{user_id}/roles/{role_id}", response_model=schemas.UserRoleLink)
+def grant_role(request: Request, user_id: int, role_id: int, db: Session = db_session,
+               current_user: dict = can_manage_roles):
+    if not db.query(models.User.id).filter(models.User.id == user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
+    if not db.query(models.UserRole.id).filter(models.UserRole.id == role_id).first():
+        raise HTTPException(status_code=404, detail="Role not found")
+    link = db.get(models.UserUserRole, (user_id, role_id))
+    if link is None:
+        db.add(models.UserUserRole(user_id=user_id, role_id=role_id))
+        db.commit()
+        log_activity(request, user_id, "role_granted")
+    return schemas.UserRoleLink(user_id=user_id, role_id=role_id)
+
+
+@app.delete("/users/{user_id}/roles/{role_id}")
+def revoke_role(request: Request, user_id: int, role_id: int, db: Session = db_session,
+                current_user: dict = can_manage_roles):
+    link = db.get(models.UserUserRole, (user_id, role_id))
+    if link is None:
+        raise HTTPException(status_code=404, detail="Role not granted")
+    db.delete(link)
+    db.commit()
+    log_activity(request, user_id, "role_revoked")
+    return {"detail": "Role revoked"}
+
+
 ### PROFILES ###
 @app.post("/profiles/", response_model=schemas.ProfileResponse)
-async def create_profile(profile: schemas.ProfileCreate, db: Session = Depends(get_db),
-                         current_user: dict = Depends(get_current_user)):
+def create_profile(request: Request, profile: schemas.ProfileCreate, db: Session = db_session,
+                   current_user: dict = can_write_profiles):
     db_profile = models.Profile(**profile.dict())
     db.add(db_profile)
     db.commit()
     db.refresh(db_profile)
+    log_activity(request, db_profile.user_id, "profile_created")
     return db_profile
 
 
+@app.get("/profiles/batch", response_model=List[schemas.BatchItem[schemas.ProfileResponse]])
+def read_profiles_batch(ids: str, db: Session = db_session, current_user: dict = can_read_profiles):
+    return load_batch(db, models.Profile, parse_ids(ids), schemas.ProfileResponse, ("profiles",))
+
+
 @app.get("/profiles/{profile_id}", response_model=schemas.ProfileResponse)
-async def read_profile(profile_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    profile = db.query(models.Profile).filter(models.Profile.id == profile_id).first()
-    if not profile:
-        raise HTTPException(status_code=404, detail="Profile not found")
-    return profile
+def read_profile(profile_id: int, db: Session = db_session, current_user: dict = can_read_profiles):
+    def load():
+        profile = db.query(models.Profile).filter(models.Profile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return schemas.ProfileResponse.model_validate(profile)
+
+    return read_flights.do(("profile", profile_id), load)
 
 
 @app.put("/profiles/{profile_id}", response_model=schemas.ProfileResponse)
-async def update_profile(profile_id: int, profile: schemas.ProfileUpdate, db: Session = Depends(get_db),
-                         current_user: dict = Depends(get_current_user)):
+def update_profile(request: Request, profile_id: int, profile: schemas.ProfileUpdate,
+                   db: Session = db_session, current_user: dict = can_write_profiles):
     db_profile = db.query(models.Profile).filter(models.Profile.id == profile_id).first()
     if not db_profile:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -210,50 +549,173 @@ async def update_profile(profile_id: int, profile: schemas.ProfileUpdate, db: Se
 
     db.commit()
     db.refresh(db_profile)
+    log_activity(request, db_profile.user_id, "profile_updated")
     return db_profile
 
 
 @app.delete("/profiles/{profile_id}")
-async def delete_profile(profile_id: int, db: Session = Depends(get_db),
-                         current_user: dict = Depends(get_current_user)):
+def delete_profile(request: Request, profile_id: int, db: Session = db_session,
+                   current_user: dict = can_write_profiles):
     db_profile = db.query(models.Profile).filter(models.Profile.id == profile_id).first()
     if not db_profile:
         raise HTTPException(status_code=404, detail="Profile not found")
 
+    owner_id = db_profile.user_id
     db.delete(db_profile)
     db.commit()
+    log_activity(request, owner_id, "profile_deleted")
     return {"detail": "Profile deleted"}
 
 
 ### ORDERS ###
+order_committer = GroupCommitter(models.Order.__table__)
+
+
 @app.post("/orders/", response_model=schemas.OrderResponse)
-async def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db),
-                       current_user: dict = Depends(get_current_user)):
+async def create_order(request: Request, order: schemas.OrderCreate, db: Session = db_session,
+                       current_user: dict = can_write_orders):
+    # Group commit: конкурентные создания заказов пишутся одной пачкой и одним COMMIT.
+    # В атомарном /batch заказ должен попасть в общую транзакцию, поэтому там обычный путь
+    if ORDER_GROUP_COMMIT and getattr(request.state, "db", None) is None:
+        created = await order_committer.submit(order.dict())
+        replica_router.record_write(client_key(request))
+        read_flights.forget("user_orders", created["user_id"])
+        query_cache.generations.bump("orders")
+        log_activity(request, created["user_id"], "order_created")
+        return created
+
+    # Обработчик асинхронный — синхронная запись через сессию уходит в пул потоков
+    return await run_in_threadpool(insert_order, request, order, db)
+
+
+def insert_order(request: Request, order: schemas.OrderCreate, db: Session):
     db_order = models.Order(**order.dict())
     db.add(db_order)
     db.commit()
     db.refresh(db_order)
+    log_activity(request, db_order.user_id, "order_created")
     return db_order
 
 
+@app.get("/orders/archive", response_model=List[schemas.OrderArchiveResponse])
+def read_order_archives(current_user: dict = can_export_orders):
+    return list_archives()
+
+
+@app.get("/orders/archive/{month}", response_model=List[schemas.OrderResponse])
+def read_archived_orders(month: str, user_id: Optional[int] = None,
+                         order_status: Optional[str] = Query(None, alias="status"),
+                         limit: int = DEFAULT_PAGE_SIZE,
+                         current_user: dict = can_export_orders):
+    return read_archive(parse_month(month), user_id, order_status, min(limit, MAX_PAGE_SIZE))
+
+
+@app.get("/orders/archive/{month}/download")
+def download_archived_orders(month: str, current_user: dict = can_export_orders):
+    path = archive_path(parse_month(month))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Archive not found")
+    return FileResponse(path, media_type="application/vnd.apache.parquet", filename=os.path.basename(path))
+
+
+@app.get("/orders/batch", response_model=List[schemas.BatchItem[schemas.OrderResponse]])
+def read_orders_batch(ids: str, db: Session = db_session, current_user: dict = can_read_orders):
+    return load_batch(db, models.Order, parse_ids(ids), schemas.OrderResponse, ("orders",))
+
+
 @app.get("/orders/{order_id}", response_model=schemas.OrderResponse)
-async def read_order(order_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+def read_order(order_id: int, fields: Optional[str] = None, db: Session = db_session,
+               current_user: dict = can_read_orders):
+    started = time.perf_counter()
+    selected = parse_fields(fields, schemas.OrderResponse)
+    order = db.query(*selected_columns(ORDER_COLUMNS, selected)).filter(models.Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return render("/orders/{order_id}", schemas.OrderResponse, selected, order, started)
+
+
+# Допустимые ключи сортировки: колонки keyset-курсора и парсеры их значений
+ORDER_SORT_KEYS = {
+    "id": ([models.Order.id], [int]),
+    "total_amount": ([models.Order.total_amount, models.Order.id], [Decimal, int]),
+    "created_at": ([models.Order.created_at, models.Order.id], [datetime.fromisoformat, int]),
+}
+
+
+def query_orders_page(db: Session, user_id: Optional[int], order_status: Optional[str],
+                      min_amount: Optional[Decimal], max_amount: Optional[Decimal],
+                      created_from: Optional[datetime], created_to: Optional[datetime],
+                      sort: str, cursor: Optional[str], limit: int):
+    # Только колонки ответа: строки Core, без гидрации ORM-объектов
+    query = db.query(*ORDER_COLUMNS)
+    if user_id is not None:
+        query = query.filter(models.Order.user_id == user_id)
+    if order_status is not None:
+        query = query.filter(models.Order.status == order_status)
+    if min_amount is not None:
+        query = query.filter(models.Order.total_amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(models.Order.total_amount <= max_amount)
+    # Фильтр по created_at отсекает лишние партиции (partition pruning)
+    if created_from is not None:
+        query = query.filter(models.Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(models.Order.created_at < created_to)
+
+    rows, next_cursor = keyset_page(query, sort, ORDER_SORT_KEYS, cursor, limit)
+    return rows_to(List[schemas.OrderResponse], rows), next_cursor
+
+
+@app.get("/orders/", response_model=List[schemas.OrderResponse])
+def read_orders(response: Response,
+                user_id: Optional[int] = None,
+                order_status: Optional[str] = Query(None, alias="status"),
+                min_amount: Optional[Decimal] = None,
+                max_amount: Optional[Decimal] = None,
+                created_from: Optional[datetime] = None,
+                created_to: Optional[datetime] = None,
+                sort: str = "id",
+                cursor: Optional[str] = None,
+                limit: int = DEFAULT_PAGE_SIZE,
+                db: Session = db_session,
+                current_user: dict = can_read_orders):
+    orders, next_cursor = query_orders_page(db, user_id, order_status, min_amount, max_amount,
+                                            created_from, created_to, sort, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return orders
 
 
 @app.get("/users/{user_id}/orders", response_model=List[schemas.OrderResponse])
-async def read_orders_by_user(user_id: int, db: Session = Depends(get_db),
-                              current_user: dict = Depends(get_current_user)):
-    orders = db.query(models.Order).filter(models.Order.user_id == user_id).all()
+def read_orders_by_user(user_id: int,
+                        response: Response,
+                        order_status: Optional[str] = Query(None, alias="status"),
+                        min_amount: Optional[Decimal] = None,
+                        max_amount: Optional[Decimal] = None,
+                        created_from: Optional[datetime] = None,
+                        created_to: Optional[datetime] = None,
+                        sort: str = "id",
+                        cursor: Optional[str] = None,
+                        limit: int = DEFAULT_PAGE_SIZE,
+                        db: Session = db_session,
+                        current_user: dict = can_read_orders):
+    key = ("user_orders", user_id, order_status, min_amount, max_amount,
+           created_from, created_to, sort, cursor, limit)
+
+    def load():
+        return query_orders_page(db, user_id, order_status, min_amount, max_amount,
+                                 created_from, created_to, sort, cursor, limit)
+
+    # Кэш результатов (по поколению таблицы orders), промах — через single-flight
+    orders, next_cursor = query_cache.fetch(db, key, ("orders",), lambda: read_flights.do(key, load))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return orders
 
 
 @app.put("/orders/{order_id}", response_model=schemas.OrderResponse)
-async def update_order(order_id: int, order: schemas.OrderUpdate, db: Session = Depends(get_db),
-                       current_user: dict = Depends(get_current_user)):
+def update_order(request: Request, order_id: int, order: schemas.OrderUpdate, db: Session = db_session,
+                 current_user: dict = can_write_orders):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -263,15 +725,111 @@ async def update_order(order_id: int, order: schemas.OrderUpdate, db: Session =
 
     db.commit()
     db.refresh(db_order)
+    log_activity(request, db_order.user_id, "order_updated")
     return db_order
 
 
 @app.delete("/orders/{order_id}")
-async def delete_order(order_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def delete_order(request: Request, order_id: int, db: Session = db_session,
+                 current_user: dict = can_write_orders):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    owner_id = db_order.user_id
     db.delete(db_order)
     db.commit()
-    return {"detail": "Order deleted"}
\ No newline at end of file
+    log_activity(request, owner_id, "order_deleted")
+    return {"detail": "Order deleted"}
+
+
+# === Лента изменений (SSE) ===
+@app.get("/changes")
+async def stream_changes(request: Request,
+                         user_id: Optional[int] = None,
+                         entity: Optional[str] = None,
+                         entity_id: Optional[int] = None,
+                         last_event_id: Optional[int] = None,
+                         current_user: dict = can_read_changes):
+    # Вместо опроса GET /orders/{id}: события user/profile/order с фильтром по пользователю или сущности.
+    # EventSource при переподключении сам присылает Last-Event-ID, параметр — для первого подключения
+    if entity is not None and entity not in ENTITIES:
+        raise HTTPException(status_code=400, detail=f"entity must be one of: {', '.join(ENTITIES)}")
+    if entity_id is not None and entity is None:
+        raise HTTPException(status_code=400, detail="entity_id requires entity")
+    header = request.headers.get("last-event-id")
+    if header:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    return StreamingResponse(
+        change_feed.stream(user_id, entity, entity_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/debug/profile")
+async def profile_worker(seconds: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+                         format: str = "flamegraph",
+                         route: Optional[str] = None,
+                         tasks: bool = True,
+                         idle: bool = False,
+                         current_user: dict = can_debug):
+    # Профиль того воркера, который принял запрос; для картины по всем воркерам — повторить несколько раз
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    codes = route_codes(app.routes, route) if route is not None else None
+    profiler = await profiler_sessions.profile(seconds, codes, include_tasks=tasks, include_idle=idle)
+    title = f"worker {os.getpid()}, {seconds}s" + (f", route {route}" if route else "")
+    body, media_type = render_profile(profiler, format, title)
+    return Response(content=body, media_type=media_type, headers={"X-Profile-Samples": str(profiler.samples)})
+
+
+@app.get("/debug/memory")
+def memory_summary(current_user: dict = can_debug):
+    return memory_stats()
+
+
+@app.put("/debug/memory/tracing")
+def set_memory_tracing(enabled: bool, current_user: dict = can_debug):
+    # Только в воркере, принявшем запрос; трассируются аллокации, сделанные после включения
+    if enabled:
+        start_tracing()
+    else:
+        stop_tracing()
+    return memory_stats()
+
+
+@app.get("/debug/memory/top")
+def memory_top(limit: int = Query(20, ge=1, le=200), group_by: str = "lineno", current_user: dict = can_debug):
+    if group_by not in GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUPINGS)}")
+    return top_allocations(limit, group_by)
+
+
+@app.post("/debug/memory/snapshots")
+def take_memory_snapshot(current_user: dict = can_debug):
+    return snapshot_store.take()
+
+
+@app.get("/debug/memory/snapshots")
+def list_memory_snapshots(current_user: dict = can_debug):
+    return snapshot_store.list()
+
+
+@app.get("/debug/memory/snapshots/{snapshot_id}/diff")
+def diff_memory_snapshots(snapshot_id: int, base: Optional[int] = None, limit: int = Query(20, ge=1, le=200),
+                          group_by: str = "lineno", current_user: dict = can_debug):
+    # base — более ранний снимок; без него снимок сравнивается с текущей кучей
+    if group_by not in GROUPINGS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUPINGS)}")
+    return snapshot_store.diff(snapshot_id, base, limit, group_by)
+
+
+@app.delete("/debug/memory/snapshots/{snapshot_id}")
+def delete_memory_snapshot(snapshot_id: int, current_user: dict = can_debug):
+    snapshot_store.delete(snapshot_id)
+    return {"message": "Snapshot deleted"}
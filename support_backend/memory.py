@@ -0,0 +1,249 @@
+import gc
+import itertools
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge, Histogram
+
+from deadlines import STREAMING_ROUTES, route_template
+from profiling import short_path
+
+logger = logging.getLogger("app")
+
+# tracemalloc замедляет каждую аллокацию в разы — включается явно: при старте или через /debug/memory/tracing
+MEMORY_TRACING = os.getenv("MEMORY_TRACING", "0") == "1"
+# Глубина трассировки аллокации; 1 — только строка, больше — дороже по памяти и CPU
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+# Снимок кучи — десятки мегабайт; держим несколько последних для сравнения
+MEMORY_MAX_SNAPSHOTS = int(os.getenv("MEMORY_MAX_SNAPSHOTS", "4"))
+GROUPINGS = ("lineno", "filename", "traceback")
+
+# Служебные аллокации самого tracemalloc и импорта модулей в отчётах только мешают
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+REQUEST_PEAK_ALLOCATION = Histogram(
+    "request_peak_allocation_bytes", "Peak traced allocation growth during a request", ["route"],
+    buckets=(16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20, 64 << 20, 256 << 20),
+)
+# Текущий RSS уже отдаёт ProcessCollector prometheus_client (process_resident_memory_bytes),
+# но всплеск между опросами Prometheus виден только по максимуму за время жизни процесса
+PROCESS_PEAK_RSS = Gauge("process_peak_rss_bytes", "Peak resident set size of the worker")
+TRACED_MEMORY = Gauge("tracemalloc_traced_bytes", "Memory traced by tracemalloc", ["kind"])
+GC_PAUSE_SECONDS = Histogram(
+    "gc_pause_seconds", "Garbage collector pause", ["generation"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+GC_COLLECTED = Counter("gc_collected_objects_total", "Objects freed by the garbage collector", ["generation"])
+
+
+def rss_bytes() -> int:
+    # /proc/self/statm: размер и резидентная часть в страницах
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+PROCESS_PEAK_RSS.set_function(peak_rss_bytes)
+TRACED_MEMORY.labels(kind="current").set_function(lambda: tracemalloc.get_traced_memory()[0])
+TRACED_MEMORY.labels(kind="peak").set_function(lambda: tracemalloc.get_traced_memory()[1])
+
+
+class GcPauseTracker:
+    # gc.callbacks вызываются в том потоке, который запустил сборку, — начало храним по потоку
+    def __init__(self):
+        self._started = threading.local()
+        self._pauses = [GC_PAUSE_SECONDS.labels(generation=str(generation)) for generation in range(3)]
+        self._collected = [GC_COLLECTED.labels(generation=str(generation)) for generation in range(3)]
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def _callback(self, phase: str, info: dict):
+        if phase == "start":
+            self._started.value = time.perf_counter()
+            return
+        started = getattr(self._started, "value", None)
+        if started is None:
+            return
+        self._started.value = None
+        generation = info["generation"]
+        self._pauses[generation].observe(time.perf_counter() - started)
+        self._collected[generation].inc(info["collected"])
+
+
+gc_pause_tracker = GcPauseTracker()
+
+
+def start_tracing(frames: int = MEMORY_TRACE_FRAMES):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info(f"tracemalloc enabled in worker {os.getpid()} ({frames} frames)")
+
+
+def stop_tracing():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info(f"tracemalloc disabled in worker {os.getpid()}")
+
+
+def setup_memory_instrumentation():
+    gc_pause_tracker.install()
+    if MEMORY_TRACING:
+        start_tracing()
+
+
+def _require_tracing():
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="Memory tracing is disabled, enable it first")
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def _site(statistic) -> dict:
+    # При группировке по файлу номер строки — 0
+    frames = [f"{short_path(frame.filename)}:{frame.lineno}" if frame.lineno else short_path(frame.filename)
+              for frame in statistic.traceback]
+    site = {"site": frames[0], "size_bytes": statistic.size, "count": statistic.count}
+    if len(frames) > 1:
+        site["traceback"] = frames
+    return site
+
+
+def top_allocations(limit: int, group_by: str) -> List[dict]:
+    _require_tracing()
+    return [_site(statistic) for statistic in _snapshot().statistics(group_by)[:limit]]
+
+
+class SnapshotStore:
+    # Снимки конкретного воркера; самые старые вытесняются, чтобы отладка не стала утечкой сама
+    def __init__(self, capacity: int = MEMORY_MAX_SNAPSHOTS):
+        self.capacity = capacity
+        self._snapshots: "OrderedDict[int, tuple]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def take(self) -> dict:
+        _require_tracing()
+        entry = (time.time(), _snapshot())
+        with self._lock:
+            snapshot_id = next(self._ids)
+            self._snapshots[snapshot_id] = entry
+            while len(self._snapshots) > self.capacity:
+                self._snapshots.popitem(last=False)
+        return self._describe(snapshot_id, *entry)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            items = list(self._snapshots.items())
+        return [self._describe(snapshot_id, *entry) for snapshot_id, entry in items]
+
+    def delete(self, snapshot_id: int):
+        with self._lock:
+            if self._snapshots.pop(snapshot_id, None) is None:
+                raise HTTPException(status_code=404, detail="Snapshot not found")
+
+    def diff(self, snapshot_id: int, base_id: Optional[int], limit: int, group_by: str) -> dict:
+        # Без base — сравнение с текущим состоянием кучи
+        snapshot = self._get(snapshot_id)
+        if base_id is None:
+            _require_tracing()
+            base, snapshot = snapshot, _snapshot()
+        else:
+            base = self._get(base_id)
+        statistics = snapshot.compare_to(base, group_by)
+        return {
+            "size_diff_bytes": sum(statistic.size_diff for statistic in statistics),
+            "top": [{**_site(statistic), "size_diff_bytes": statistic.size_diff, "count_diff": statistic.count_diff}
+                    for statistic in statistics[:limit]],
+        }
+
+    def _get(self, snapshot_id: int) -> tracemalloc.Snapshot:
+        entry = self._snapshots.get(snapshot_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Snapshot not found")
+        return entry[1]
+
+    @staticmethod
+    def _describe(snapshot_id: int, taken_at: float, snapshot: tracemalloc.Snapshot) -> dict:
+        return {
+            "id": snapshot_id,
+            "taken_at": taken_at,
+            "traced_bytes": sum(trace.size for trace in snapshot.traces),
+            "blocks": len(snapshot.traces),
+        }
+
+
+snapshot_store = SnapshotStore()
+
+
+def memory_stats() -> dict:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "tracing": tracemalloc.is_tracing(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "gc_counts": gc.get_count(),
+        "gc_stats": gc.get_stats(),
+    }
+
+
+class MemoryTrackingMiddleware:
+    """
+    ASGI-middleware: прирост пика трассируемой памяти за время запроса по шаблону маршрута.
+    Пик у tracemalloc один на процесс, поэтому одновременно измеряется один запрос, остальные
+    проходят без замера; параллельные неизмеряемые запросы попадают в пик, так что значение —
+    оценка сверху, пригодная для сравнения маршрутов в массе. Без tracemalloc — пропускает всё.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+        self._measuring = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._measuring or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+        route = route_template(self.router, scope)
+        if route is None or route in STREAMING_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        self._measuring = True
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._measuring = False
+            if tracemalloc.is_tracing():
+                REQUEST_PEAK_ALLOCATION.labels(route=route).observe(
+                    max(tracemalloc.get_traced_memory()[1] - baseline, 0))
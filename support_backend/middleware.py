@@ -2,7 +2,10 @@ from fastapi import Request, Response
 from typing import Callable
 import json
 import time
+import msgpack
 from logger import log_request, mask_sensitive_data
+from negotiation import is_msgpack
+from tracing import span
 from logging import getLogger
 
 logger = getLogger("app")
@@ -15,18 +18,22 @@ async def log_requests_middleware(request: Request, call_next: Callable) -> Resp
     request_body = None
     try:
         if request.method not in ("GET", "HEAD") and request.headers.get("content-length"):
-            body = await request.body()
-            request._body = body
-
-            try:
-                decoded = body.decode("utf-8")
-                if decoded.strip():
-                    try:
-                        request_body = json.loads(decoded)
-                    except json.JSONDecodeError:
-                        request_body = decoded
-            except Exception:
-                request_body = "<binary_data>"
+            with span("log_middleware.read_request_body"):
+                body = await request.body()
+                request._body = body
+
+                try:
+                    if is_msgpack(request.headers.get("content-type", "").encode("latin-1")):
+                        request_body = msgpack.unpackb(body)
+                    else:
+                        decoded = body.decode("utf-8")
+                        if decoded.strip():
+                            try:
+                                request_body = json.loads(decoded)
+                            except json.JSONDecodeError:
+                                request_body = decoded
+                except Exception:
+                    request_body = "<binary_data>"
     except Exception as e:
         request_body = f"<error_reading_body: {str(e)}>"
 
@@ -45,23 +52,28 @@ async def log_requests_middleware(request: Request, call_next: Callable) -> Resp
         # === ПЕРЕХВАТ ТЕЛА ОТВЕТА ДЛЯ FastAPI ===
         # Для стандартных ответов FastAPI
         if hasattr(response, "body") and response.body:
-            try:
-                if isinstance(response.body, bytes):
-                    body_content = response.body
-                    try:
-                        decoded = body_content.decode("utf-8")
-                        if decoded.strip():
-                            try:
-                                response_body = json.loads(decoded)
-                            except json.JSONDecodeError:
-                                response_body = decoded
-                    except Exception:
-                        response_body = "<binary_response>"
-                elif isinstance(response.body, str):
-                    response_body = response.body
-            except Exception as e:
-                response_body = f"<error_reading_response: {str(e)}>"
-                logger.error(f"Error reading response body: {e}")
+            with span("log_middleware.parse_response_body"):
+                try:
+                    content_type = response.headers.get("content-type", "").encode("latin-1")
+                    if isinstance(response.body, bytes) and is_msgpack(content_type):
+                        # MessagePack-ответ декодируем, чтобы маскировка работала так же, как для JSON
+                        response_body = msgpack.unpackb(response.body)
+                    elif isinstance(response.body, bytes):
+                        body_content = response.body
+                        try:
+                            decoded = body_content.decode("utf-8")
+                            if decoded.strip():
+                                try:
+                                    response_body = json.loads(decoded)
+                                except json.JSONDecodeError:
+                                    response_body = decoded
+                        except Exception:
+                            response_body = "<binary_response>"
+                    elif isinstance(response.body, str):
+                        response_body = response.body
+                except Exception as e:
+                    response_body = f"<error_reading_response: {str(e)}>"
+                    logger.error(f"Error reading response body: {e}")
 
     except Exception as e:
         logger.exception("Unhandled exception in request flow")
@@ -92,15 +104,19 @@ async def log_requests_middleware(request: Request, call_next: Callable) -> Resp
         user = "anonymous"
 
     details = f"client_ip: {client_ip}, process_time: {process_time:.3f}s"
-
-    log_request(
-        user=user,
-        method=method,
-        endpoint=endpoint,
-        status=status_code,
-        details=details,
-        request_body=safe_request_body,
-        response_body=safe_response_body,
-    )
+    batch_id = request.headers.get("x-batch-id")
+    if batch_id:
+        details += f", batch_id: {batch_id}"
+
+    with span("log_middleware.write_log"):
+        log_request(
+            user=user,
+            method=method,
+            endpoint=endpoint,
+            status=status_code,
+            details=details,
+            request_body=safe_request_body,
+            response_body=safe_response_body,
+        )
 
     return response
\ No newline at end of file
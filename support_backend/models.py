@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Numeric
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Numeric, Index, func
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -8,7 +9,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, index=True)
     name = Column(String, index=True)
-    password = Column(String, index=True)
+    password = Column(String)  # хэш argon2id (passwords.py)
+    role = Column(String(20), nullable=False, server_default="user")
 
     profile = relationship("Profile", back_populates="user")
     orders = relationship("Order", back_populates="user")
@@ -24,22 +26,81 @@ class Profile(Base):
     user = relationship("User", back_populates="profile")
 
 class Order(Base):
+    # Партиционирована по месяцам (RANGE по created_at), см. order_archive.py
     __tablename__ = 'orders'
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow,
+                        server_default=func.now())
     user_id = Column(Integer, ForeignKey('users.id'))
     total_amount = Column(Numeric(10, 2))
     status = Column(String(50))
 
     user = relationship("User", back_populates="orders")
 
+    # Индексы под фильтры/сортировки GET /orders/ и GET /users/{id}/orders:
+    # id в хвосте каждого индекса нужен для keyset-пагинации
+    __table_args__ = (
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_orders_user_id_id", "user_id", "id"),
+        Index("ix_orders_user_id_status_id", "user_id", "status", "id"),
+        Index("ix_orders_user_id_total_amount_id", "user_id", "total_amount", "id"),
+        Index("ix_orders_status_id", "status", "id"),
+        Index("ix_orders_status_total_amount_id", "status", "total_amount", "id"),
+        Index("ix_orders_total_amount_id", "total_amount", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
 class UserRole(Base):
     __tablename__ = 'user_roles'
     id = Column(Integer, primary_key=True)
     name = Column(String(50), unique=True)
+    permissions = Column(BigInteger, nullable=False, server_default="0")  # битовая маска permissions.Permission
 
     users = relationship("User", secondary="user_user_roles", back_populates="roles")
 
 class UserUserRole(Base):
     __tablename__ = 'user_user_roles'
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
-    role_id = Column(Integer, ForeignKey('user_roles.id'), primary_key=True)
\ No newline at end of file
+    role_id = Column(Integer, ForeignKey('user_roles.id'), primary_key=True)
+
+class ActivityLog(Base):
+    # Партиционирована по месяцам (RANGE по created_at), партиции создаёт activity_log.ActivityLogWriter.
+    # Ключ партиционирования обязан входить в PK; FK на users нет — журнал переживает удаление пользователя
+    __tablename__ = 'activity_logs'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, primary_key=True, nullable=False, server_default=func.now())
+    user_id = Column(Integer)
+    action = Column(String(100), nullable=False)
+    ip_address = Column(String(45))
+
+    __table_args__ = (
+        Index("ix_activity_logs_user_id_created_at_id", "user_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+class ChangeEvent(Base):
+    # Outbox ленты изменений: строки пишут триггеры на users/profiles/orders (миграция c4f2a7d91e36)
+    # и сразу шлют их в NOTIFY change_events; хранятся CHANGE_FEED_RETENTION_HOURS для resume по id
+    __tablename__ = 'change_events'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(BigInteger, nullable=False)
+    user_id = Column(Integer)
+    op = Column(String(10), nullable=False)
+    status = Column(String(50))
+
+    __table_args__ = (
+        Index("ix_change_events_user_id_id", "user_id", "id"),
+        Index("ix_change_events_entity_entity_id_id", "entity", "entity_id", "id"),
+    )
+
+class RevokedToken(Base):
+    # Отозванные access/refresh токены до истечения их срока; триггер (миграция 9a3c6e1f4b58)
+    # рассылает jti воркерам через NOTIFY token_revoked
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String(36), primary_key=True)
+    user_id = Column(Integer)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, server_default=func.now())
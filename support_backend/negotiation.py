@@ -0,0 +1,160 @@
+import json
+from contextvars import ContextVar
+from datetime import datetime
+
+import msgpack
+
+MSGPACK_MEDIA_TYPES = (b"application/msgpack", b"application/x-msgpack")
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Клиент просил MessagePack (Accept) — обработчики с собственной сериализацией
+# (serialization.render) кодируют ответ сразу в msgpack, без промежуточного JSON
+response_msgpack: ContextVar[bool] = ContextVar("response_msgpack", default=False)
+
+
+def _json_default(value):
+    # Расширение timestamp из msgpack -> ISO-строка, как в JSON-запросах
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Unsupported MessagePack value: {type(value).__name__}")
+
+
+def unpack_to_json(body: bytes) -> bytes:
+    return json.dumps(msgpack.unpackb(body, timestamp=3), default=_json_default).encode("utf-8")
+
+
+def is_msgpack(content_type: bytes) -> bool:
+    return content_type.split(b";")[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+def _header(headers, name: bytes) -> bytes:
+    for key, value in headers:
+        if key == name:
+            return value
+    return b""
+
+
+def _replace_headers(headers, content_type: bytes, length: int):
+    result = [(key, value) for key, value in headers if key not in (b"content-type", b"content-length")]
+    result.append((b"content-type", content_type))
+    result.append((b"content-length", str(length).encode("latin-1")))
+    return result
+
+
+def _vary_accept(headers) -> list:
+    # Тело зависит от Accept: общий кэш не должен отдать JSON клиенту, просившему msgpack, и наоборот
+    result, found = [], False
+    for key, value in headers:
+        if key.lower() == b"vary":
+            found = True
+            parts = [part.strip().lower() for part in value.split(b",")]
+            if b"accept" not in parts and b"*" not in parts:
+                value += b", Accept"
+        result.append((key, value))
+    if not found:
+        result.append((b"vary", b"Accept"))
+    return result
+
+
+class MsgPackMiddleware:
+    """
+    ASGI-middleware согласования формата: тело application/msgpack перекодируется в JSON
+    до валидации (те же схемы и ошибки), JSON-ответ — в msgpack, если его просили в Accept.
+    Любой ответ, в том числе JSON, помечается Vary: Accept.
+    Стоит снаружи логирующего middleware, поэтому тот видит JSON с обеих сторон,
+    кроме ответов, которые обработчик уже отдал в msgpack.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = scope["headers"]
+        accept = _header(headers, b"accept").lower()
+        wants_msgpack = any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+        if is_msgpack(_header(headers, b"content-type")):
+            body = b""
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                body += message.get("body", b"")
+                more_body = message.get("more_body", False)
+            try:
+                body = unpack_to_json(body) if body else b""
+            except (ValueError, TypeError, msgpack.UnpackException):
+                await self._send_error(send, wants_msgpack, 400, "Invalid MessagePack body")
+                return
+
+            scope = dict(scope, headers=_replace_headers(headers, b"application/json", len(body)))
+            replayed = False
+
+            async def receive_json():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            receive = receive_json
+
+        # Ставим и False: подзапросы POST /batch выполняются в контексте внешнего запроса
+        token = response_msgpack.set(wants_msgpack)
+        if not wants_msgpack:
+            async def vary_send(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = _vary_accept(message.get("headers", []))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, vary_send)
+            finally:
+                response_msgpack.reset(token)
+            return
+
+        start_message = None
+        chunks = []
+
+        async def transcoding_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                content_type = _header(message.get("headers", []), b"content-type")
+                if content_type.split(b";")[0].strip() == b"application/json":
+                    # Отправку заголовков откладываем до конца тела: поменяются тип и длина
+                    start_message = message
+                    return
+                message["headers"] = _vary_accept(message.get("headers", []))
+                await send(message)
+            elif message["type"] == "http.response.body" and start_message is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                raw = b"".join(chunks)
+                body = msgpack.packb(json.loads(raw)) if raw else b""
+                headers = _vary_accept(_replace_headers(start_message.get("headers", []),
+                                                        MSGPACK_MEDIA_TYPE.encode("latin-1"), len(body)))
+                await send({"type": "http.response.start", "status": start_message["status"], "headers": headers})
+                await send({"type": "http.response.body", "body": body})
+            else:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, transcoding_send)
+        finally:
+            response_msgpack.reset(token)
+
+    @staticmethod
+    async def _send_error(send, as_msgpack: bool, status: int, detail: str):
+        if as_msgpack:
+            body, content_type = msgpack.packb({"detail": detail}), MSGPACK_MEDIA_TYPE.encode("latin-1")
+        else:
+            body, content_type = json.dumps({"detail": detail}).encode("utf-8"), b"application/json"
+        await send({"type": "http.response.start", "status": status,
+                    "headers": _vary_accept(_replace_headers([], content_type, len(body)))})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,82 @@
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from database import engine
+
+logger = logging.getLogger("app")
+
+RECONNECT_DELAY = 1.0
+
+
+class NotificationListener:
+    """
+    Фоновый поток с выделенным соединением, подписанным (LISTEN) на каналы Postgres.
+    Обработчики канала получают payload уведомления. После переподключения вызываются
+    on_reconnect-обработчики: уведомления, пришедшие пока соединения не было, потеряны.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._reconnect_handlers: List[Callable[[], None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]):
+        self._handlers[channel].append(handler)
+
+    def on_reconnect(self, handler: Callable[[], None]):
+        self._reconnect_handlers.append(handler)
+
+    def start(self):
+        if self._thread is not None or engine.dialect.name != "postgresql":
+            return
+        self._thread = threading.Thread(target=self._run, name="pg-notify-listener", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = engine.raw_connection()
+                # После detach() driver_connection уже None — берём драйверное соединение до него
+                dbapi_connection = connection.driver_connection
+                # Соединение живёт всё время работы процесса — в пул его не возвращаем
+                connection.detach()
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    for channel in self._handlers:
+                        cursor.execute(f"LISTEN {channel}")
+
+                if connected_before:
+                    for handler in self._reconnect_handlers:
+                        handler()
+                connected_before = True
+                self._listen(dbapi_connection)
+            except Exception:
+                logger.exception("Notification listener failed, reconnecting")
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                time.sleep(RECONNECT_DELAY)
+
+    def _listen(self, dbapi_connection):
+        while True:
+            if select.select([dbapi_connection], [], [], 5.0) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                notify = dbapi_connection.notifies.pop(0)
+                for handler in self._handlers.get(notify.channel, ()):
+                    try:
+                        handler(notify.payload)
+                    except Exception:
+                        logger.exception(f"Notification handler for {notify.channel} failed")
+
+
+notification_listener = NotificationListener()
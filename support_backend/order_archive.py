@@ -0,0 +1,182 @@
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from prometheus_client import Counter
+from sqlalchemy import text
+
+from database import engine
+from partitions import add_months, ensure_monthly_partitions, list_monthly_partitions, month_start, partition_name
+
+logger = logging.getLogger("app")
+
+ARCHIVE_DIR = os.path.join("archive", "orders")
+ORDERS_HOT_MONTHS = int(os.getenv("ORDERS_HOT_MONTHS", "12"))
+ORDER_ARCHIVE_INTERVAL = int(os.getenv("ORDER_ARCHIVE_INTERVAL", "86400"))
+ARCHIVE_CHUNK_ROWS = 50000
+# Ключ advisory lock: архивацию в каждый момент выполняет только один воркер
+ORDER_ARCHIVE_LOCK_ID = 7300032
+
+ORDERS_ARCHIVED = Counter("orders_archived_partitions_total", "Orders partitions archived to Parquet")
+
+MONTH_PATTERN = re.compile(r"^(\d{4})-(\d{2})$")
+
+
+def parse_month(value: str) -> date:
+    match = MONTH_PATTERN.match(value)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise HTTPException(status_code=400, detail="Month must be in YYYY-MM format")
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def archive_path(month: date) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{partition_name('orders', month)}.parquet")
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.int32()),
+        ("created_at", pa.timestamp("us")),
+        ("user_id", pa.int32()),
+        ("total_amount", pa.decimal128(10, 2)),
+        ("status", pa.string()),
+    ])
+
+
+def export_table(name: str, path: str) -> int:
+    # pyarrow нужен только архиватору — импортируем лениво
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    schema = _parquet_schema()
+    tmp_path = path + ".tmp"
+    rows = 0
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=ARCHIVE_CHUNK_ROWS).execute(
+            text(f'SELECT id, created_at, user_id, total_amount, status FROM "{name}" ORDER BY id')
+        )
+        with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+            for chunk in result.mappings().partitions():
+                writer.write_table(pa.Table.from_pylist([dict(row) for row in chunk], schema=schema))
+                rows += len(chunk)
+
+    os.replace(tmp_path, path)
+    return rows
+
+
+def _detached_month_tables(connection) -> List[tuple]:
+    # Таблицы orders_YYYY_MM, которые уже отсоединены, но ещё не выгружены (например, после падения)
+    names = connection.execute(text(
+        "SELECT relname FROM pg_class "
+        "WHERE relkind = 'r' AND NOT relispartition AND relname ~ '^orders_[0-9]{4}_[0-9]{2}$'"
+    )).scalars()
+    return [(name, date(int(name[7:11]), int(name[12:14]), 1)) for name in names]
+
+
+def archive_cold_partitions() -> List[str]:
+    cutoff = add_months(month_start(datetime.utcnow()), -ORDERS_HOT_MONTHS)
+    archived = []
+
+    with engine.connect() as lock_connection:
+        if not lock_connection.execute(text("SELECT pg_try_advisory_lock(:id)"),
+                                       {"id": ORDER_ARCHIVE_LOCK_ID}).scalar():
+            return archived
+        try:
+            with engine.begin() as connection:
+                ensure_monthly_partitions(connection, "orders")
+                cold = [(name, month) for name, month in list_monthly_partitions(connection, "orders")
+                        if month < cutoff]
+                pending = _detached_month_tables(connection)
+
+            for name, _ in cold:
+                # DETACH ... CONCURRENTLY не блокирует запись в orders, но работает только вне транзакции
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    connection.execute(text(f'ALTER TABLE orders DETACH PARTITION "{name}" CONCURRENTLY'))
+                    # DDL не вызывает триггеры уведомлений — кэши запросов к orders сбрасываем явно
+                    connection.execute(text("SELECT pg_notify('table_changed', 'orders')"))
+
+            for name, month in cold + pending:
+                rows = export_table(name, archive_path(month))
+                with engine.begin() as connection:
+                    connection.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                ORDERS_ARCHIVED.inc()
+                archived.append(name)
+                logger.info(f"Archived orders partition {name}: {rows} rows")
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": ORDER_ARCHIVE_LOCK_ID})
+            lock_connection.commit()
+
+    return archived
+
+
+def list_archives() -> List[dict]:
+    import pyarrow.parquet as pq
+
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    archives = []
+    for filename in sorted(os.listdir(ARCHIVE_DIR)):
+        match = re.match(r"^orders_(\d{4})_(\d{2})\.parquet$", filename)
+        if not match:
+            continue
+        path = os.path.join(ARCHIVE_DIR, filename)
+        archives.append({
+            "month": f"{match.group(1)}-{match.group(2)}",
+            "rows": pq.ParquetFile(path).metadata.num_rows,
+            "size_bytes": os.path.getsize(path),
+        })
+    return archives
+
+
+def read_archive(month: date, user_id: Optional[int] = None, status: Optional[str] = None,
+                 limit: Optional[int] = None) -> List[dict]:
+    import pyarrow.parquet as pq
+
+    path = archive_path(month)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Archive not found")
+
+    filters = []
+    if user_id is not None:
+        filters.append(("user_id", "=", user_id))
+    if status is not None:
+        filters.append(("status", "=", status))
+    table = pq.read_table(path, filters=filters or None)
+    if limit is not None:
+        table = table.slice(0, limit)
+    return table.to_pylist()
+
+
+class OrderArchiver:
+    # Раз в ORDER_ARCHIVE_INTERVAL создаёт будущие партиции orders и архивирует холодные
+
+    def __init__(self):
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="order-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                archive_cold_partitions()
+            except Exception:
+                logger.exception("Orders archival failed")
+            self._stopped.wait(ORDER_ARCHIVE_INTERVAL)
+
+
+order_archiver = OrderArchiver()
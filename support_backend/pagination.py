@@ -0,0 +1,72 @@
+import base64
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# Жёсткий лимит размера страницы — клиент не может запросить больше
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort: str, values: List[Any]) -> str:
+    raw = json.dumps({"s": sort, "v": values}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, parsers: List[Callable[[Any], Any]]) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if data["s"] != sort or len(data["v"]) != len(parsers):
+            raise ValueError("cursor does not match sort")
+        return [parse(value) for parse, value in zip(parsers, data["v"])]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(
+        query,
+        sort: str,
+        sort_keys: Dict[str, Tuple[list, List[Callable[[Any], Any]]]],
+        cursor: Optional[str],
+        limit: int,
+):
+    """
+    Keyset-пагинация: сортировка по ключу из sort_keys ("-" в начале — по убыванию),
+    курсор хранит значения ключа последней строки страницы.
+    Возвращает (items, next_cursor).
+    """
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    if key not in sort_keys:
+        raise HTTPException(status_code=400, detail=f"Unsupported sort key: {key}")
+
+    columns, parsers = sort_keys[key]
+    limit = clamp_limit(limit)
+
+    if cursor:
+        values = decode_cursor(cursor, sort, parsers)
+        if len(columns) == 1:
+            left, right = columns[0], values[0]
+        else:
+            left, right = tuple_(*columns), tuple_(*values)
+        query = query.filter(left < right if descending else left > right)
+
+    order_by = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, [getattr(last, column.key) for column in columns])
+
+    return rows, next_cursor
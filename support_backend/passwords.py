@@ -0,0 +1,78 @@
+import asyncio
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from prometheus_client import Histogram
+
+# Параметры argon2id; при их изменении хэши пересчитываются при следующем входе пользователя
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", str(64 * 1024)))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+# argon2 отпускает GIL, поэтому потоки дают настоящий параллелизм; больше ядер держать смысла нет
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds", "Password hashing and verification time", ["op"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+password_hasher = PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST,
+                                 parallelism=ARGON2_PARALLELISM)
+# Отдельный ограниченный пул: хэширование не занимает event loop и общий threadpool обработчиков
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+_dummy_hash: Optional[str] = None
+
+
+def is_password_hash(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("$argon2")
+
+
+def hash_password(password: str) -> str:
+    started = time.perf_counter()
+    try:
+        return password_hasher.hash(password)
+    finally:
+        PASSWORD_HASH_SECONDS.labels(op="hash").observe(time.perf_counter() - started)
+
+
+def verify_password(stored: Optional[str], password: str) -> Tuple[bool, bool]:
+    """
+    Проверка пароля против сохранённого значения. Возвращает (верен ли пароль, нужно ли
+    пересчитать хэш): хэш со старыми параметрами или пароль, сохранённый до перехода на argon2
+    открытым текстом. Для неизвестного пользователя (stored=None) проверяется фиктивный хэш,
+    чтобы время ответа не выдавало существование логина.
+    """
+    global _dummy_hash
+    started = time.perf_counter()
+    try:
+        if stored is None:
+            if _dummy_hash is None:
+                _dummy_hash = password_hasher.hash("dummy-password")
+            try:
+                password_hasher.verify(_dummy_hash, password)
+            except VerificationError:
+                pass
+            return False, False
+        if not is_password_hash(stored):
+            return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")), True
+        try:
+            password_hasher.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False, False
+        return True, password_hasher.check_needs_rehash(stored)
+    finally:
+        PASSWORD_HASH_SECONDS.labels(op="verify").observe(time.perf_counter() - started)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, hash_password, password)
+
+
+async def verify_password_async(stored: Optional[str], password: str) -> Tuple[bool, bool]:
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, verify_password, stored, password)
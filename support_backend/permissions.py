@@ -0,0 +1,42 @@
+from enum import IntFlag
+from typing import Iterable, List
+
+from fastapi import HTTPException
+
+
+class Permission(IntFlag):
+    # Биты хранятся в user_roles.permissions — существующие значения не перенумеровывать
+    USERS_READ = 1 << 0
+    USERS_WRITE = 1 << 1
+    PROFILES_READ = 1 << 2
+    PROFILES_WRITE = 1 << 3
+    ORDERS_READ = 1 << 4
+    ORDERS_WRITE = 1 << 5
+    ORDERS_EXPORT = 1 << 6
+    CHANGES_READ = 1 << 7
+    ROLES_MANAGE = 1 << 8
+    DEBUG = 1 << 9
+
+
+ALL_PERMISSIONS = 0
+for _permission in Permission:
+    ALL_PERMISSIONS |= _permission
+
+
+def parse_permissions(names: Iterable[str]) -> int:
+    # ["orders_read", "orders_write"] -> битовая маска; неизвестные имена — 400
+    mask = 0
+    unknown = []
+    for name in names:
+        permission = Permission.__members__.get(name.upper())
+        if permission is None:
+            unknown.append(name)
+        else:
+            mask |= permission
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown permissions: {', '.join(unknown)}")
+    return mask
+
+
+def permission_names(mask: int) -> List[str]:
+    return [permission.name.lower() for permission in Permission if mask & permission]
@@ -0,0 +1,257 @@
+import asyncio
+import html
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter as StackCounter
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from prometheus_client import Counter
+
+logger = logging.getLogger("app")
+
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# 100 Гц: обход всех стеков воркера занимает десятки микросекунд, накладные расходы — доли процента
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))
+# Профилирование одновременно в одном воркере — больше одной сессии только искажает результат
+PROFILE_MAX_SESSIONS = int(os.getenv("PROFILE_MAX_SESSIONS", "1"))
+FORMATS = ("flamegraph", "speedscope", "collapsed")
+
+# Стек, который заканчивается в этих модулях, — поток ждёт (блокировка, очередь, select), а не работает
+STDLIB_DIR = os.path.dirname(os.__file__)
+IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", os.path.join("concurrent", "futures", "thread.py"))
+
+PROFILE_SESSIONS = Counter("profile_sessions_total", "Sampling profiler sessions", ["result"])
+
+
+def short_path(filename: str) -> str:
+    # Путь относительно site-packages, стандартной библиотеки или каталога приложения
+    marker = filename.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        return filename[marker + len("site-packages") + 1:]
+    for directory in (STDLIB_DIR, os.getcwd()):
+        if filename.startswith(directory + os.sep):
+            return filename[len(directory) + 1:]
+    return filename
+
+
+class _Frames:
+    # Подпись кадра «функция (файл:строка начала)» — одна на объект кода, считается один раз
+    def __init__(self):
+        self._labels: Dict[object, str] = {}
+
+    def label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+
+def _is_idle(code) -> bool:
+    return code.co_filename.endswith(IDLE_MODULES)
+
+
+def _coroutine_codes(coroutine):
+    # Цепочка await ожидающей задачи: coroutine -> cr_await -> ... до Future, от внешнего к внутреннему
+    while coroutine is not None:
+        frame = (getattr(coroutine, "cr_frame", None) or getattr(coroutine, "gi_frame", None)
+                 or getattr(coroutine, "ag_frame", None))
+        if frame is None:
+            return
+        yield frame.f_code
+        coroutine = (getattr(coroutine, "cr_await", None) or getattr(coroutine, "gi_yieldfrom", None)
+                     or getattr(coroutine, "ag_await", None))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock профилировщик текущего воркера: раз в interval из отдельного потока снимаются
+    стеки всех потоков (sys._current_frames) и цепочки await ожидающих задач event loop.
+    Код не инструментируется — пока сессии нет, накладных расходов нет вовсе.
+    Фильтр маршрута оставляет только стеки, проходящие через обработчики этого маршрута.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 route_codes: Optional[FrozenSet] = None, include_idle: bool = False):
+        self.interval = interval
+        self.loop = loop
+        self.route_codes = route_codes
+        self.include_idle = include_idle
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self._frames = _Frames()
+
+    def run(self, seconds: float):
+        own_thread = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+        while next_sample < deadline:
+            self._sample(own_thread)
+            self.samples += 1
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Не успеваем за частотой — пропускаем такты, а не копим долг
+                next_sample = time.monotonic()
+
+    def _sample(self, own_thread: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_thread:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            self._record(f"thread:{names.get(ident, ident)}", codes)
+        if self.loop is not None:
+            self._sample_tasks()
+
+    def _sample_tasks(self):
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            return
+        for task in tasks:
+            coroutine = task.get_coro()
+            # Выполняющаяся сейчас задача уже есть в стеке потока event loop
+            if coroutine is None or getattr(coroutine, "cr_running", False):
+                continue
+            self._record("task", list(_coroutine_codes(coroutine)))
+
+    def _record(self, root: str, codes: list):
+        if not codes:
+            return
+        if not self.include_idle and _is_idle(codes[-1]):
+            return
+        if self.route_codes is not None and not any(code in self.route_codes for code in codes):
+            return
+        label = self._frames.label
+        self.stacks[(root,) + tuple(label(code) for code in codes)] += 1
+
+    def collapsed(self) -> str:
+        # Формат flamegraph.pl / speedscope / inferno: «кадр;кадр;кадр число»
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self, name: str) -> dict:
+        frames: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(round(count * self.interval, 6))
+        total = round(sum(weights), 6)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": frame} for frame in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "support-backend",
+        }
+
+    def flamegraph(self, title: str, width: int = 1200, frame_height: int = 16) -> str:
+        # Самодостаточный SVG: корень снизу, ширина кадра пропорциональна числу сэмплов, подсказка в <title>
+        tree: dict = {}
+        for stack, count in self.stacks.items():
+            node = tree
+            for frame in stack:
+                entry = node.setdefault(frame, [0, {}])
+                entry[0] += count
+                node = entry[1]
+        total = sum(self.stacks.values()) or 1
+
+        def depth(node: dict) -> int:
+            return 1 + max((depth(child) for _, child in node.values()), default=0)
+
+        height = (depth(tree) + 1) * frame_height + 24
+        scale = (width - 20) / total
+        rects = []
+
+        def layout(node: dict, x: float, level: int):
+            for frame, (count, children) in sorted(node.items()):
+                w = count * scale
+                if w >= 0.5:
+                    y = height - (level + 1) * frame_height - 4
+                    hue = zlib.crc32(frame.encode("utf-8")) % 60
+                    text = html.escape(frame)
+                    label = text if w > 40 else ""
+                    rects.append(
+                        f'<g><title>{text} ({count} samples, {count * 100 / total:.2f}%)</title>'
+                        f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" '
+                        f'fill="hsl({hue},85%,60%)"/>'
+                        f'<text x="{x + 3:.1f}" y="{y + frame_height - 4}" textLength="{max(w - 6, 0):.1f}" '
+                        f'lengthAdjust="spacingAndGlyphs">{label}</text></g>'
+                    )
+                    layout(children, x, level + 1)
+                x += w
+
+        layout(tree, 10, 0)
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'font-family="monospace" font-size="11">'
+            f'<rect width="100%" height="100%" fill="#fdfdfd"/>'
+            f'<text x="10" y="16" font-size="13">{html.escape(title)}</text>'
+            + "".join(rects) + "</svg>"
+        )
+
+
+class ProfilerSessions:
+    # Жёсткий лимит одновременных сессий на воркер: лишняя сразу получает 429, а не ждёт
+    def __init__(self, limit: int = PROFILE_MAX_SESSIONS):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    async def profile(self, seconds: float, route_codes: Optional[FrozenSet] = None,
+                      include_tasks: bool = True, include_idle: bool = False) -> SamplingProfiler:
+        if not self._semaphore.acquire(blocking=False):
+            PROFILE_SESSIONS.labels(result="rejected").inc()
+            raise HTTPException(status_code=429, detail="Profiling session already running")
+        try:
+            profiler = SamplingProfiler(loop=asyncio.get_running_loop() if include_tasks else None,
+                                        route_codes=route_codes, include_idle=include_idle)
+            # Отдельный поток из пула event loop, а не threadpool обработчиков: профилировать
+            # приходится как раз тогда, когда threadpool занят
+            await asyncio.to_thread(profiler.run, seconds)
+        finally:
+            self._semaphore.release()
+        PROFILE_SESSIONS.labels(result="completed").inc()
+        logger.info(f"Profiled worker {os.getpid()} for {seconds}s: {profiler.samples} samples, "
+                    f"{len(profiler.stacks)} distinct stacks")
+        return profiler
+
+
+def route_codes(routes: Iterable, path: str) -> FrozenSet:
+    # Объекты кода обработчиков всех методов маршрута с этим шаблоном пути
+    codes = {inspect.unwrap(route.endpoint).__code__ for route in routes
+             if getattr(route, "path", None) == path and hasattr(route, "endpoint")}
+    if not codes:
+        raise HTTPException(status_code=400, detail=f"Unknown route: {path}")
+    return frozenset(codes)
+
+
+def render_profile(profiler: SamplingProfiler, output: str, title: str) -> Tuple[str, str]:
+    # -> (тело, media type)
+    if output == "collapsed":
+        return profiler.collapsed(), "text/plain"
+    if output == "speedscope":
+        return json.dumps(profiler.speedscope(title)), "application/json"
+    return profiler.flamegraph(title), "image/svg+xml"
+
+
+profiler_sessions = ProfilerSessions()
@@ -0,0 +1,173 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from prometheus_client import Counter, Gauge
+from pydantic_core import to_json
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import REPLICA_MAX_LAG_SECONDS, replica_router
+from notifications import notification_listener
+
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Канал, в который триггеры (миграция 7d1e3c5a9b20) пишут имя изменённой таблицы
+TABLE_CHANGED_CHANNEL = "table_changed"
+
+QUERY_CACHE_REQUESTS = Counter("query_cache_requests_total", "Query result cache lookups", ["result"])
+QUERY_CACHE_EVICTIONS = Counter("query_cache_evictions_total", "Query result cache evictions", ["reason"])
+QUERY_CACHE_BYTES = Gauge("query_cache_bytes", "Approximate size of cached query results")
+QUERY_CACHE_ENTRIES = Gauge("query_cache_entries", "Number of cached query results")
+
+
+class TableGenerations:
+    # Поколение таблицы меняется при любой записи в неё; значения берутся из общего счётчика,
+    # поэтому конкурентные bump не теряются без блокировок
+    def __init__(self):
+        self._counter = itertools.count(1)
+        self._epoch = 0
+        self._epoch_bumped_at = 0.0
+        self._generations: Dict[str, int] = {}
+        self._bumped_at: Dict[str, float] = {}
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        return (self._epoch,) + tuple(self._generations.get(table, 0) for table in tables)
+
+    def bump(self, table: str):
+        self._generations[table] = next(self._counter)
+        self._bumped_at[table] = time.monotonic()
+
+    def bump_all(self):
+        self._epoch = next(self._counter)
+        self._epoch_bumped_at = time.monotonic()
+
+    def last_bump(self, tables: Iterable[str]) -> float:
+        return max([self._epoch_bumped_at] + [self._bumped_at.get(table, 0.0) for table in tables])
+
+
+class QueryCache:
+    """
+    Кэш результатов запросов. Ключ — скомпилированный SQL и его параметры, запись помечена
+    таблицами, которые читает запрос, и хранит их поколения на момент чтения. Запись
+    валидна, пока поколения не изменились, — отслеживать отдельные ключи не нужно.
+    Размер ограничен QUERY_CACHE_MAX_BYTES, вытесняются давно не использованные записи.
+    """
+
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.generations = TableGenerations()
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def query_key(query) -> tuple:
+        # ORM Query или Core select
+        compiled = getattr(query, "statement", query).compile()
+        return str(compiled), tuple(sorted(compiled.params.items()))
+
+    def fetch(self, db: Session, key: Any, tables: Tuple[str, ...], load: Callable[[], Any]) -> Any:
+        # load должен вернуть результат, не привязанный к сессии (схемы ответа, dict, ...)
+        generations = self.generations.snapshot(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == generations:
+                    self._entries.move_to_end(key)
+                    QUERY_CACHE_REQUESTS.labels(result="hit").inc()
+                    return entry[1]
+                self._remove(key)
+                QUERY_CACHE_EVICTIONS.labels(reason="stale").inc()
+        QUERY_CACHE_REQUESTS.labels(result="miss").inc()
+
+        # Поколения сняты до запроса: запись, закоммиченная во время чтения, сразу сделает результат устаревшим
+        result = load()
+        self._store(db, key, tables, generations, result)
+        return result
+
+    def fetch_many(self, db: Session, keys: List[Any], tables: Tuple[str, ...],
+                   load_missing: Callable[[List[Any]], Dict[Any, Any]]) -> Dict[Any, Any]:
+        # Пакетный fetch: каждый ключ кэшируется отдельно, промахи загружаются одним вызовом
+        # load_missing(ключи) -> {ключ: результат}; ключей, которых нет в ответе, нет и в результате
+        generations = self.generations.snapshot(tables)
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == generations:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                    continue
+                if entry is not None:
+                    self._remove(key)
+                    QUERY_CACHE_EVICTIONS.labels(reason="stale").inc()
+                missing.append(key)
+        QUERY_CACHE_REQUESTS.labels(result="hit").inc(len(found))
+        QUERY_CACHE_REQUESTS.labels(result="miss").inc(len(missing))
+        if missing:
+            loaded = load_missing(missing)
+            for key, result in loaded.items():
+                self._store(db, key, tables, generations, result)
+            found.update(loaded)
+        return found
+
+    def _store(self, db: Session, key: Any, tables: Tuple[str, ...], generations: Tuple[int, ...], result: Any):
+        # Реплика может отставать на REPLICA_MAX_LAG_SECONDS — её результат сразу после записи не кэшируем
+        from_replica = replica_router.enabled and db.info.get("read_only")
+        if from_replica and time.monotonic() - self.generations.last_bump(tables) < REPLICA_MAX_LAG_SECONDS:
+            return
+
+        size = len(to_json(result))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (generations, result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                QUERY_CACHE_EVICTIONS.labels(reason="memory").inc()
+            QUERY_CACHE_BYTES.set(self._bytes)
+            QUERY_CACHE_ENTRIES.set(len(self._entries))
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+        QUERY_CACHE_BYTES.set(self._bytes)
+        QUERY_CACHE_ENTRIES.set(len(self._entries))
+
+
+query_cache = QueryCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_written_tables(session, flush_context):
+    tables = session.info.setdefault("written_tables", set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        tables.add(instance.__table__.name)
+    # Связи many-to-many пишут в ассоциативные таблицы без собственных объектов
+    for mapper in {state.mapper for state in flush_context.states}:
+        for relationship in mapper.relationships:
+            if relationship.secondary is not None:
+                tables.add(relationship.secondary.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_written_tables(session):
+    for table in session.info.pop("written_tables", ()):
+        query_cache.generations.bump(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_written_tables(session):
+    session.info.pop("written_tables", None)
+
+
+# Внешние писатели (и другие воркеры) сообщают об изменениях через NOTIFY из триггеров;
+# пока слушатель был отключён, уведомления терялись — сбрасываем всё
+notification_listener.subscribe(TABLE_CHANGED_CHANNEL, query_cache.generations.bump)
+notification_listener.on_reconnect(query_cache.generations.bump_all)
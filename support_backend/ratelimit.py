@@ -0,0 +1,203 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter
+
+from auth import verify_token
+
+logger = logging.getLogger("app")
+
+# Группа маршрутов -> (токенов в секунду, размер корзины). Переопределяются через
+# RATE_LIMITS="orders_write=5:10,read=100:200"
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "auth": (1, 10),
+    "orders_write": (10, 20),
+    "write": (20, 40),
+    "read": (50, 100),
+    "batch": (5, 10),
+    "export": (0.2, 2),
+}
+for _item in filter(None, os.getenv("RATE_LIMITS", "").split(",")):
+    _group, _, _value = _item.partition("=")
+    _rate, _, _burst = _value.partition(":")
+    RATE_LIMITS[_group.strip()] = (float(_rate), float(_burst or _rate))
+
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_SHARDS = 64
+# Каждые SWEEP_EVERY обращений к шарду из него удаляются полностью восстановившиеся корзины
+SWEEP_EVERY = 1024
+
+EXEMPT_PATHS = ("/health", "/metrics", "/docs", "/redoc", "/openapi.json")
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected by the rate limiter", ["group"])
+
+
+def route_group(method: str, path: str) -> Optional[str]:
+    if path == "/" or path.startswith(EXEMPT_PATHS):
+        return None
+    if path.startswith("/token"):
+        return "auth"
+    if path.startswith("/batch"):
+        return "batch"
+    if path.startswith("/orders/archive"):
+        return "export"
+    if method == "POST" and path.rstrip("/") == "/orders":
+        return "orders_write"
+    return "write" if method in WRITE_METHODS else "read"
+
+
+class TokenBucketStore:
+    """
+    Token bucket в памяти процесса. Корзина — кортеж (токены, время обновления, момент
+    полного восстановления); восстановившаяся корзина неотличима от отсутствующей,
+    поэтому такие записи удаляются лениво, при периодическом проходе по шарду.
+    Шардирование ограничивает стоимость одного прохода. Вызывается только из event loop,
+    поэтому блокировки не нужны.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS):
+        self._shards = [dict() for _ in range(shards)]
+        self._operations = [0] * shards
+        self._mask = shards - 1
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        # 0 — запрос разрешён, иначе — через сколько секунд появится токен
+        index = hash(key) & self._mask
+        shard = self._shards[index]
+        bucket = shard.get(key)
+        if bucket is None or bucket[2] <= now:
+            tokens = burst
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        shard[key] = (tokens, now, now + (burst - tokens) / rate)
+
+        self._operations[index] += 1
+        if self._operations[index] >= SWEEP_EVERY:
+            self._operations[index] = 0
+            for expired in [k for k, value in shard.items() if value[2] <= now]:
+                del shard[expired]
+        return retry_after
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+
+# Атомарное списание токена в Redis: состояние корзины в hash, TTL — время полного восстановления
+REDIS_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = burst
+if bucket[1] then
+    tokens = math.min(burst, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * rate)
+end
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisBucketStore:
+    # Общая для всех воркеров корзина (pip install redis); при недоступности Redis — локальная
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(REDIS_TAKE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        return float(await self._script(keys=[f"ratelimit:{key}"], args=[rate, burst, now]))
+
+
+class RateLimitMiddleware:
+    """
+    ASGI-middleware: ограничение частоты запросов по субъекту JWT, а без токена — по IP.
+    Лимиты задаются по группам маршрутов; превышение — 429 с Retry-After.
+    """
+
+    def __init__(self, app, redis_url: Optional[str] = RATE_LIMIT_REDIS_URL):
+        self.app = app
+        self.local = TokenBucketStore()
+        self.shared: Optional[RedisBucketStore] = None
+        if redis_url:
+            try:
+                self.shared = RedisBucketStore(redis_url)
+            except ImportError:
+                logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed, using in-memory limits")
+
+    def client_key(self, scope) -> str:
+        user = scope.get("state", {}).get("user")
+        if user:
+            return f"user:{user['username']}"
+
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                subject = self._token_subject(value.decode("latin-1"))
+                if subject is not None:
+                    return f"user:{subject}"
+                break
+        client = scope.get("client")
+        return f"ip:{client[0] if client else '-'}"
+
+    def _token_subject(self, authorization: str) -> Optional[str]:
+        # Проверка подписи JWT стоит десятки микросекунд — verify_token кэширует проверенные токены
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        claims = verify_token(token)
+        return claims.sub if claims is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        group = route_group(scope["method"], scope["path"])
+        if group is None or group not in RATE_LIMITS:
+            await self.app(scope, receive, send)
+            return
+
+        rate, burst = RATE_LIMITS[group]
+        key = f"{group}:{self.client_key(scope)}"
+        now = time.time()
+        retry_after = None
+        if self.shared is not None:
+            try:
+                retry_after = await self.shared.take(key, rate, burst, now)
+            except Exception as e:
+                logger.warning(f"Shared rate limit store failed, using in-memory limits: {e}")
+        if retry_after is None:
+            retry_after = self.local.take(key, rate, burst, now)
+
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        RATE_LIMITED.labels(group=group).inc()
+        body = json.dumps({"detail": "Too many requests"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode("latin-1")),
+                        (b"retry-after", str(math.ceil(retry_after)).encode("latin-1"))],
+        })
+        await send({"type": "http.response.body", "body": body})
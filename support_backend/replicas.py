@@ -0,0 +1,119 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from prometheus_client import Gauge
+from sqlalchemy import text
+
+logger = logging.getLogger("app")
+
+REPLICA_LAG = Gauge("db_replica_lag_seconds", "Replication lag of a read replica", ["replica"])
+REPLICA_LAG_BYTES = Gauge("db_replica_lag_bytes", "WAL bytes not yet replayed by a read replica", ["replica"])
+REPLICA_HEALTHY = Gauge("db_replica_healthy", "1 if the read replica is used for reads", ["replica"])
+
+
+def parse_lsn(value: Optional[str]) -> int:
+    if not value:
+        return 0
+    high, low = value.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaRouter:
+    """
+    Выбор реплики для чтения. Фоновый поток раз в check_interval опрашивает реплики
+    (воспроизведённый LSN, лаг) и помечает нездоровые. Клиент, который недавно писал,
+    читает с primary, пока реплика не догонит LSN его записи (но не дольше sticky_window).
+    """
+
+    def __init__(self, primary, replicas: List, max_lag: float, sticky_window: float, check_interval: float = 1.0):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.sticky_window = sticky_window
+        self.check_interval = check_interval
+        self._healthy: Dict[int, bool] = {}
+        self._replay_lsn: Dict[int, int] = {}
+        self._writes: Dict[str, tuple] = {}
+        self._counter = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def record_write(self, client_key: Optional[str], lsn: Optional[str] = None):
+        if client_key is not None:
+            self._writes[client_key] = (time.monotonic(), parse_lsn(lsn))
+
+    def read_bind(self, client_key: Optional[str]):
+        min_lsn = 0
+        last_write = self._writes.get(client_key)
+        if last_write is not None:
+            written_at, lsn = last_write
+            if time.monotonic() - written_at < self.sticky_window:
+                if not lsn:
+                    return self.primary
+                min_lsn = lsn
+            else:
+                self._writes.pop(client_key, None)
+
+        candidates = [index for index in range(len(self.replicas))
+                      if self._healthy.get(index) and self._replay_lsn.get(index, 0) >= min_lsn]
+        if not candidates:
+            # Нет здоровой (или догнавшей) реплики — читаем с primary
+            return self.primary
+        return self.replicas[candidates[next(self._counter) % len(candidates)]]
+
+    def mark_unhealthy(self, replica_engine):
+        for index, candidate in enumerate(self.replicas):
+            if candidate is replica_engine:
+                self._healthy[index] = False
+                REPLICA_HEALTHY.labels(replica=str(index)).set(0)
+
+    def check(self):
+        expired_before = time.monotonic() - self.sticky_window
+        for client_key, (written_at, _) in list(self._writes.items()):
+            if written_at < expired_before:
+                self._writes.pop(client_key, None)
+
+        with self.primary.connect() as connection:
+            primary_lsn = parse_lsn(connection.execute(text("SELECT pg_current_wal_lsn()::text")).scalar())
+
+        for index, replica in enumerate(self.replicas):
+            label = str(index)
+            try:
+                with replica.connect() as connection:
+                    replay_lsn, lag = connection.execute(text(
+                        "SELECT pg_last_wal_replay_lsn()::text, "
+                        "COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                    )).one()
+                replay = parse_lsn(replay_lsn)
+                lag_bytes = max(primary_lsn - replay, 0)
+                # На простаивающем primary время последнего replay растёт без реального лага,
+                # поэтому реплика, догнавшая LSN, считается здоровой независимо от lag
+                healthy = lag_bytes == 0 or float(lag) <= self.max_lag
+                self._replay_lsn[index] = replay
+                REPLICA_LAG.labels(replica=label).set(float(lag) if lag_bytes else 0)
+                REPLICA_LAG_BYTES.labels(replica=label).set(lag_bytes)
+            except Exception as e:
+                logger.warning(f"Replica {label} health check failed: {e}")
+                healthy = False
+            self._healthy[index] = healthy
+            REPLICA_HEALTHY.labels(replica=label).set(1 if healthy else 0)
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Replica monitor failed")
+            time.sleep(self.check_interval)
@@ -0,0 +1,171 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+from sqlalchemy.exc import IntegrityError
+
+import models
+from database import SessionLocal
+from notifications import notification_listener
+
+logger = logging.getLogger("app")
+
+# Канал, в который триггер на revoked_tokens (миграция 9a3c6e1f4b58) пишет jti отозванного токена
+TOKEN_REVOKED_CHANNEL = "token_revoked"
+# Ожидаемое число одновременно отозванных (ещё не истёкших) токенов и допустимая доля ложных срабатываний фильтра
+REVOCATION_EXPECTED_ITEMS = int(os.getenv("REVOCATION_EXPECTED_ITEMS", "100000"))
+REVOCATION_FALSE_POSITIVE_RATE = 0.001
+REVOCATION_MAINTENANCE_INTERVAL = 600
+# expires_at в БД — наивное время UTC
+EPOCH = datetime(1970, 1, 1)
+
+REVOKED_TOKENS = Gauge("revoked_tokens", "Revoked tokens that have not expired yet")
+REVOCATION_CHECKS = Counter("revocation_checks_total", "Token revocation checks", ["result"])
+
+
+class BloomFilter:
+    """
+    Битовый массив и k позиций на элемент (двойное хэширование от hash() строки). Проверка
+    отсутствия — несколько операций над int без аллокаций; hash() строки кэшируется в ней самой.
+    Удалять нельзя — фильтр периодически строится заново по точному множеству.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        bits = max(64, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.size = bits
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self._bits = bytearray((bits + 7) // 8)
+
+    def add(self, item: str):
+        h = hash(item)
+        h1, h2 = h & 0xFFFFFFFF, ((h >> 32) & 0xFFFFFFFF) | 1
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        h = hash(item)
+        h1, h2 = h & 0xFFFFFFFF, ((h >> 32) & 0xFFFFFFFF) | 1
+        bits = self._bits
+        for i in range(self.hashes):
+            position = (h1 + i * h2) % self.size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    Отозванные jti в памяти воркера: Bloom-фильтр отвечает «точно не отозван» для почти всех
+    токенов, точное множество (jti -> exp) подтверждает срабатывания фильтра. Источник истины —
+    таблица revoked_tokens; другие воркеры узнают об отзыве через NOTIFY token_revoked,
+    после переподключения слушателя список перечитывается целиком.
+    """
+
+    def __init__(self, capacity: int = REVOCATION_EXPECTED_ITEMS):
+        self.capacity = capacity
+        self._revoked: Dict[str, float] = {}
+        self._filter = BloomFilter(capacity, REVOCATION_FALSE_POSITIVE_RATE)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.reload()
+        self._thread = threading.Thread(target=self._run, name="token-revocation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def is_revoked(self, jti: str) -> bool:
+        # Горячий путь get_current_user: без блокировок и обращений к БД
+        if jti not in self._filter:
+            return False
+        revoked = jti in self._revoked
+        REVOCATION_CHECKS.labels(result="revoked" if revoked else "false_positive").inc()
+        return revoked
+
+    def add(self, jti: str, expires_at: float):
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._filter.add(jti)
+            REVOKED_TOKENS.set(len(self._revoked))
+
+    def revoke(self, jti: str, user_id: Optional[int], expires_at: float) -> bool:
+        # Запись в таблицу рассылает jti остальным воркерам (триггер NOTIFY); себе добавляем сразу.
+        # False — токен уже был отозван (в том числе параллельным запросом в другом воркере)
+        db = SessionLocal()
+        try:
+            db.add(models.RevokedToken(jti=jti, user_id=user_id, expires_at=datetime.utcfromtimestamp(expires_at)))
+            db.commit()
+            revoked = True
+        except IntegrityError:
+            db.rollback()
+            revoked = False
+        finally:
+            db.close()
+        self.add(jti, expires_at)
+        return revoked
+
+    def reload(self):
+        db = SessionLocal()
+        try:
+            rows = db.query(models.RevokedToken.jti, models.RevokedToken.expires_at) \
+                .filter(models.RevokedToken.expires_at > datetime.utcnow()).all()
+        finally:
+            db.close()
+        self._rebuild({row.jti: (row.expires_at - EPOCH).total_seconds() for row in rows})
+
+    def _rebuild(self, revoked: Dict[str, float]):
+        # Новый фильтр собирается в стороне и подменяется целиком: читатели не видят полупустой фильтр
+        bloom = BloomFilter(max(self.capacity, len(revoked) * 2), REVOCATION_FALSE_POSITIVE_RATE)
+        for jti in revoked:
+            bloom.add(jti)
+        with self._lock:
+            # jti, отозванные во время перестройки, не теряем
+            for jti, expires_at in self._revoked.items():
+                if jti not in revoked and expires_at > time.time():
+                    revoked[jti] = expires_at
+                    bloom.add(jti)
+            self._revoked, self._filter = revoked, bloom
+            REVOKED_TOKENS.set(len(revoked))
+
+    def _prune(self):
+        # Истёкший токен отклоняется проверкой exp — его запись больше не нужна ни в памяти, ни в БД
+        db = SessionLocal()
+        try:
+            db.query(models.RevokedToken).filter(models.RevokedToken.expires_at <= datetime.utcnow()) \
+                .delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            now = time.time()
+            alive = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        self._rebuild(alive)
+
+    def _run(self):
+        while not self._stopped.wait(REVOCATION_MAINTENANCE_INTERVAL):
+            try:
+                self._prune()
+            except Exception:
+                logger.exception("Revoked tokens maintenance failed")
+
+    def on_notify(self, payload: str):
+        # payload: "<jti>:<exp в секундах epoch>"
+        jti, _, expires_at = payload.partition(":")
+        self.add(jti, float(expires_at))
+
+
+revocation_list = RevocationList()
+
+notification_listener.subscribe(TOKEN_REVOKED_CHANNEL, revocation_list.on_notify)
+notification_listener.on_reconnect(revocation_list.reload)
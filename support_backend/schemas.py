@@ -1,4 +1,5 @@
-from typing import Optional, List
+from datetime import datetime
+from typing import Any, Generic, Optional, List, TypeVar
 from pydantic import BaseModel
 
 # ==== USER ====
@@ -56,6 +57,7 @@ class OrderUpdate(OrderBase):
 class OrderResponse(OrderBase):
     id: int
     user_id: int
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -66,10 +68,10 @@ class RoleBase(BaseModel):
     name: str
 
 class RoleCreate(RoleBase):
-    pass
+    permissions: List[str] = []  # имена permissions.Permission в нижнем регистре
 
 class RoleUpdate(RoleBase):
-    pass
+    permissions: List[str] = []
 
 class RoleResponse(RoleBase):
     id: int
@@ -77,6 +79,9 @@ class RoleResponse(RoleBase):
     class Config:
         from_attributes = True
 
+class RolePermissionsResponse(RoleResponse):
+    permissions: List[str] = []
+
 
 # ==== USER ROLES (Many-to-Many) ====
 class UserRoleLink(BaseModel):
@@ -90,7 +95,7 @@ class UserRoleLink(BaseModel):
 # ==== ACTIVITY LOGS ====
 class ActivityLogBase(BaseModel):
     action: str
-    ip_address: str
+    ip_address: Optional[str] = None
 
 class ActivityLogCreate(ActivityLogBase):
     user_id: int
@@ -101,11 +106,78 @@ class ActivityLogUpdate(ActivityLogBase):
 class ActivityLogResponse(ActivityLogBase):
     id: int
     user_id: int
-    created_at: str
+    created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+# ==== USER DETAIL (пользователь + профили + последние заказы + роли) ====
+class UserDetailResponse(UserBase):
+    id: int
+    profiles: List[ProfileResponse] = []
+    recent_orders: List[OrderResponse] = []
+    roles: List[RoleResponse] = []
+
+
+# ==== BATCH GET ====
+T = TypeVar("T")
+
+class BatchItem(BaseModel, Generic[T]):
+    id: int
+    found: bool
+    item: Optional[T] = None
+
+
+# ==== ORDERS ARCHIVE ====
+class OrderArchiveResponse(BaseModel):
+    month: str
+    rows: int
+    size_bytes: int
+
+
+# ==== MULTI-REQUEST BATCH (POST /batch) ====
+class BatchSubRequest(BaseModel):
+    method: str
+    path: str
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+    atomic: bool = False  # все записи в одной транзакции
+
+class BatchSubResponse(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    batch_id: str
+    results: List[BatchSubResponse]
+    committed: Optional[bool] = None  # заполняется только в атомарном режиме
+
+
 # ==== Обновляем "UserResponse" после определения всех зависимых моделей ====
-UserResponse.model_rebuild()
\ No newline at end of file
+UserResponse.model_rebuild()
+
+
+# ==== CHANGE FEED ====
+class ChangeEventResponse(BaseModel):
+    id: int
+    entity: str
+    entity_id: int
+    user_id: Optional[int] = None
+    op: str
+    status: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# ==== TOKENS ====
+# refresh-токен — в теле: из query-строки он попадал бы в логи доступа и прокси
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class RevokeTokenRequest(BaseModel):
+    refresh_token: Optional[str] = None  # без него отзывается только текущий access-токен
@@ -0,0 +1,140 @@
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import msgpack
+from fastapi import HTTPException, Response
+from prometheus_client import Histogram
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from sqlalchemy import Integer, Select, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from negotiation import MSGPACK_MEDIA_TYPE, response_msgpack
+from tracing import span
+
+USER_COLUMNS = (models.User.id, models.User.name, models.User.email)
+ORDER_COLUMNS = (models.Order.id, models.Order.user_id, models.Order.total_amount,
+                 models.Order.status, models.Order.created_at)
+# Поля UserResponse, которые грузятся отдельными запросами; profiles и logs в списке всегда пустые
+USER_RELATION_TABLES = {"orders": ("orders",), "roles": ("user_roles", "user_user_roles")}
+
+FIELDSET_RESPONSE_BYTES = Histogram(
+    "fieldset_response_bytes", "Response body size by fieldset", ["route", "fieldset"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+FIELDSET_RESPONSE_SECONDS = Histogram(
+    "fieldset_response_seconds", "Handler time including SELECT and serialization by fieldset", ["route", "fieldset"]
+)
+
+
+@lru_cache(maxsize=None)
+def type_adapter(tp) -> TypeAdapter:
+    # Построение валидатора дорогое — один TypeAdapter на тип на весь процесс
+    return TypeAdapter(tp)
+
+
+def rows_to(tp, rows) -> Any:
+    # Строки Core (без ORM-объектов и identity map) сразу в схемы ответа
+    with span("serialize.rows"):
+        return type_adapter(tp).validate_python(rows, from_attributes=True)
+
+
+def parse_fields(raw: Optional[str], schema: Type[BaseModel]) -> Optional[Tuple[str, ...]]:
+    # ?fields=id,name -> ("id", "name"); None — все поля схемы
+    if raw is None:
+        return None
+    fields = tuple(sorted({part.strip() for part in raw.split(",") if part.strip()}))
+    if not fields:
+        raise HTTPException(status_code=400, detail="fields must not be empty")
+    unknown = [field for field in fields if field not in schema.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+@lru_cache(maxsize=256)
+def partial_schema(schema: Type[BaseModel], fields: Optional[Tuple[str, ...]]) -> Type[BaseModel]:
+    # Подмножество полей схемы (в её порядке) с теми же типами и значениями по умолчанию
+    if fields is None:
+        return schema
+    return create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (info.annotation, info) for name, info in schema.model_fields.items() if name in fields},
+    )
+
+
+def selected_columns(columns, fields: Optional[Tuple[str, ...]], required=()) -> list:
+    # Колонки для SELECT: запрошенные поля плюс нужные для связей/курсора
+    if fields is None:
+        return list(columns)
+    return [column for column in columns if column.key in fields or column.key in required]
+
+
+def render(route: str, schema: Type[BaseModel], fields: Optional[Tuple[str, ...]], value: Any,
+           started: float, many: bool = False) -> Response:
+    # Сериализация через TypeAdapter урезанной схемы сразу в JSON-байты (или msgpack по Accept)
+    fieldset = "all" if fields is None else "sparse"
+    with span("serialize.render", route=route, fieldset=fieldset):
+        model = partial_schema(schema, fields)
+        adapter = type_adapter(List[model] if many else model)
+        validated = adapter.validate_python(value, from_attributes=True)
+        if response_msgpack.get():
+            body, media_type = msgpack.packb(adapter.dump_python(validated, mode="json")), MSGPACK_MEDIA_TYPE
+        else:
+            body, media_type = adapter.dump_json(validated), "application/json"
+    FIELDSET_RESPONSE_BYTES.labels(route=route, fieldset=fieldset).observe(len(body))
+    FIELDSET_RESPONSE_SECONDS.labels(route=route, fieldset=fieldset).observe(time.perf_counter() - started)
+    return Response(content=body, media_type=media_type)
+
+
+def users_page_statement(skip: int, limit: int, fields: Optional[Tuple[str, ...]] = None) -> Select:
+    columns = selected_columns(USER_COLUMNS, fields, required=("id",))
+    return select(*columns).order_by(models.User.id).offset(skip).limit(limit)
+
+
+def user_list_tables(fields: Optional[Tuple[str, ...]]) -> Tuple[str, ...]:
+    tables = ["users"]
+    for relation, relation_tables in USER_RELATION_TABLES.items():
+        if fields is None or relation in fields:
+            tables.extend(relation_tables)
+    return tuple(tables)
+
+
+def select_users_page(db: Session, statement: Select, fields: Optional[Tuple[str, ...]] = None) -> list:
+    """
+    Список пользователей в форме UserResponse (или её подмножества fields) запросами только
+    нужных колонок: пользователи, их заказы и роли (WHERE user_id = ANY(:ids)), без гидрации
+    ORM-объектов. Связи, не попавшие в fields, не загружаются.
+    """
+    users = db.execute(statement).all()
+    if not users:
+        return []
+    if fields is not None and not any(relation in fields for relation in USER_RELATION_TABLES):
+        return type_adapter(List[partial_schema(schemas.UserResponse, fields)]).validate_python(
+            users, from_attributes=True)
+
+    ids_param = bindparam("ids", [user.id for user in users], type_=ARRAY(Integer))
+    orders: Dict[int, list] = defaultdict(list)
+    if fields is None or "orders" in fields:
+        for order in db.execute(select(*ORDER_COLUMNS)
+                                .where(models.Order.user_id == any_(ids_param))
+                                .order_by(models.Order.user_id, models.Order.id)):
+            orders[order.user_id].append(dict(order._mapping))
+
+    roles: Dict[int, list] = defaultdict(list)
+    if fields is None or "roles" in fields:
+        for role in db.execute(select(models.UserUserRole.user_id, models.UserRole.id, models.UserRole.name)
+                               .join(models.UserRole, models.UserRole.id == models.UserUserRole.role_id)
+                               .where(models.UserUserRole.user_id == any_(ids_param))
+                               .order_by(models.UserUserRole.user_id, models.UserRole.id)):
+            roles[role.user_id].append({"id": role.id, "name": role.name})
+
+    return type_adapter(List[partial_schema(schemas.UserResponse, fields)]).validate_python([
+        {**user._mapping, "orders": orders[user.id], "roles": roles[user.id]}
+        for user in users
+    ])
@@ -0,0 +1,212 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional, Tuple
+
+import msgpack
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("app")
+
+# Файл в tmpfs, общий для воркеров на хосте; не задан — кэш выключен и всегда промахивается
+SHM_CACHE_PATH = os.getenv("SHM_CACHE_PATH")
+SHM_CACHE_SLOTS = int(os.getenv("SHM_CACHE_SLOTS", "16384"))
+SHM_CACHE_SLOT_SIZE = int(os.getenv("SHM_CACHE_SLOT_SIZE", "256"))
+# Сколько соседних слотов просматривается при поиске ключа (открытая адресация)
+PROBES = 4
+READ_RETRIES = 3
+
+# Пространства имён ключей; у каждого своё поколение в заголовке — invalidate сбрасывает все его записи
+NAMESPACES = {"token": 0, "user": 1}
+
+MAGIC = b"SBSHMC01"
+HEADER = struct.Struct("<8sII")  # magic, число слотов, размер слота
+GENERATIONS_OFFSET = 64
+GENERATION = struct.Struct("<Q")
+HEADER_SIZE = 256
+# seq, хэш ключа, пространство имён, его поколение, срок (time.time()), длина значения
+SLOT = struct.Struct("<Q16sHQdI")
+SLOT_HEADER_SIZE = 48
+SEQ = struct.Struct("<Q")
+EMPTY_KEY = bytes(16)
+
+SHM_CACHE_REQUESTS = Counter("shm_cache_requests_total", "Shared memory cache lookups", ["namespace", "result"])
+SHM_CACHE_WRITES = Counter("shm_cache_writes_total", "Shared memory cache writes", ["namespace", "result"])
+SHM_CACHE_USED_SLOTS = Gauge("shm_cache_used_slots", "Live entries in the shared memory cache")
+
+
+class SharedMemoryCache:
+    """
+    Хэш-таблица с фиксированными слотами в mmap-файле, общая для всех воркеров хоста.
+    Чтение без блокировок по схеме seqlock: писатель делает seq нечётным на время записи
+    и чётным после, читатель повторяет чтение, если seq изменился или нечётен.
+    Запись — под flock файла и блокировкой процесса, то есть писатель в каждый момент один. Ключ хранится
+    128-битным хэшем, значение — msgpack не длиннее слота; не поместившееся не кэшируется.
+    """
+
+    def __init__(self, path: Optional[str] = SHM_CACHE_PATH, slots: int = SHM_CACHE_SLOTS,
+                 slot_size: int = SHM_CACHE_SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_value_size = slot_size - SLOT_HEADER_SIZE
+        self._fd: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+        # flock принадлежит открытому файлу: потоки процесса с общим fd он друг от друга не исключает
+        self._lock = threading.Lock()
+        # Дочерние счётчики заранее: labels() на каждом чтении дороже самого чтения
+        self._requests = {(namespace, result): SHM_CACHE_REQUESTS.labels(namespace=namespace, result=result)
+                          for namespace in NAMESPACES for result in ("hit", "miss", "stale", "contended")}
+        if path:
+            try:
+                self._open(path)
+            except OSError:
+                logger.exception(f"Shared memory cache {path} is unavailable, falling back to per-process caches")
+
+    @property
+    def enabled(self) -> bool:
+        return self._mm is not None
+
+    def _open(self, path: str):
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+            magic, slots, slot_size = HEADER.unpack_from(mm, 0)
+            if (magic, slots, slot_size) != (MAGIC, self.slots, self.slot_size):
+                # Новый файл или другая раскладка — размечаем заново (под блокировкой, один раз)
+                mm[:] = bytes(size)
+                HEADER.pack_into(mm, 0, MAGIC, self.slots, self.slot_size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd, self._mm = fd, mm
+        SHM_CACHE_USED_SLOTS.set_function(self.used_slots)
+
+    @contextmanager
+    def _exclusive(self):
+        # Сначала потоки своего процесса, затем другие воркеры
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        # hash() строк солится в каждом процессе — для общего файла нужен стабильный хэш
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _generation(self, namespace_id: int) -> int:
+        return GENERATION.unpack_from(self._mm, GENERATIONS_OFFSET + namespace_id * GENERATION.size)[0]
+
+    def _slot_offsets(self, digest: bytes):
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        for probe in range(PROBES):
+            yield HEADER_SIZE + ((start + probe) % self.slots) * self.slot_size
+
+    def get(self, namespace: str, key: str) -> Tuple[bool, Any]:
+        if self._mm is None:
+            return False, None
+        mm = self._mm
+        namespace_id = NAMESPACES[namespace]
+        digest = self._digest(key)
+        generation = self._generation(namespace_id)
+        for offset in self._slot_offsets(digest):
+            for _ in range(READ_RETRIES):
+                seq, slot_key, slot_namespace, slot_generation, expires_at, length = SLOT.unpack_from(mm, offset)
+                if seq & 1:
+                    continue
+                if slot_key != digest:
+                    break
+                value = mm[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + length]
+                if SEQ.unpack_from(mm, offset)[0] != seq:
+                    continue
+                if (slot_namespace != namespace_id or slot_generation != generation
+                        or expires_at < time.time()):
+                    self._requests[namespace, "stale"].inc()
+                    return False, None
+                self._requests[namespace, "hit"].inc()
+                return True, msgpack.unpackb(value)
+            else:
+                # Слот всё время переписывался — считаем промахом, а не ждём писателя
+                self._requests[namespace, "contended"].inc()
+                return False, None
+            if slot_key == EMPTY_KEY:
+                break
+        self._requests[namespace, "miss"].inc()
+        return False, None
+
+    def put(self, namespace: str, key: str, value: Any, ttl: float):
+        if self._mm is None or ttl <= 0:
+            return
+        payload = msgpack.packb(value)
+        if len(payload) > self.max_value_size:
+            SHM_CACHE_WRITES.labels(namespace=namespace, result="too_large").inc()
+            return
+        mm = self._mm
+        namespace_id = NAMESPACES[namespace]
+        digest = self._digest(key)
+        now = time.time()
+        with self._exclusive():
+            target, result = None, "evicted"
+            for offset in self._slot_offsets(digest):
+                _, slot_key, slot_namespace, slot_generation, expires_at, _ = SLOT.unpack_from(mm, offset)
+                if slot_key == digest or slot_key == EMPTY_KEY:
+                    target, result = offset, "stored"
+                    break
+                if target is None and (expires_at < now or slot_generation != self._generation(slot_namespace)):
+                    target, result = offset, "stored"
+            if target is None:
+                # Окно проб заполнено живыми записями — вытесняем первую
+                target = next(self._slot_offsets(digest))
+            seq = SEQ.unpack_from(mm, target)[0]
+            SEQ.pack_into(mm, target, seq + 1)
+            SLOT.pack_into(mm, target, seq + 1, digest, namespace_id, self._generation(namespace_id),
+                           now + ttl, len(payload))
+            mm[target + SLOT_HEADER_SIZE:target + SLOT_HEADER_SIZE + len(payload)] = payload
+            SEQ.pack_into(mm, target, seq + 2)
+        SHM_CACHE_WRITES.labels(namespace=namespace, result=result).inc()
+
+    def invalidate(self, namespace: str):
+        # Новое поколение пространства имён: все его записи во всех воркерах становятся устаревшими
+        if self._mm is None:
+            return
+        offset = GENERATIONS_OFFSET + NAMESPACES[namespace] * GENERATION.size
+        with self._exclusive():
+            GENERATION.pack_into(self._mm, offset, GENERATION.unpack_from(self._mm, offset)[0] + 1)
+
+    def used_slots(self) -> int:
+        if self._mm is None:
+            return 0
+        mm = self._mm
+        now = time.time()
+        used = 0
+        for index in range(self.slots):
+            _, slot_key, slot_namespace, slot_generation, expires_at, _ = SLOT.unpack_from(
+                mm, HEADER_SIZE + index * self.slot_size)
+            if slot_key != EMPTY_KEY and expires_at >= now and slot_generation == self._generation(slot_namespace):
+                used += 1
+        return used
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "used_slots": self.used_slots(),
+            "generations": {name: self._generation(index) if self._mm is not None else 0
+                            for name, index in NAMESPACES.items()},
+        }
+
+
+shared_cache = SharedMemoryCache()
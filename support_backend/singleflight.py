@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from prometheus_client import Counter
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+
+# >0 — пока идёт обновление, повторные запросы получают предыдущий результат не старше этого возраста
+SINGLE_FLIGHT_STALE_SECONDS = float(os.getenv("SINGLE_FLIGHT_STALE_SECONDS", "0"))
+SINGLE_FLIGHT_MAX_RESULTS = 10000
+
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "single_flight_requests_total",
+    "Reads executed (leader), joined to an in-flight query (shared) or served stale (stale)",
+    ["kind", "outcome"],
+)
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "forgotten")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.forgotten = False
+
+
+class SingleFlight:
+    """
+    Схлопывание одинаковых конкурентных чтений: первый запрос с данным ключом выполняет
+    загрузку, остальные ждут и получают тот же результат (или ту же ошибку, например 404).
+    Ключ — кортеж (вид ресурса, id, параметры...); результат должен быть отвязан от сессии.
+    """
+
+    def __init__(self, stale_seconds: float = SINGLE_FLIGHT_STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Tuple, fn: Callable[[], Any]) -> Any:
+        kind = key[0]
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                leader = False
+                stale = self._results.get(key)
+                if stale is not None and time.monotonic() - stale[0] <= self.stale_seconds:
+                    SINGLE_FLIGHT_REQUESTS.labels(kind=kind, outcome="stale").inc()
+                    return stale[1]
+        if not leader:
+            return self._wait(kind, flight)
+
+        SINGLE_FLIGHT_REQUESTS.labels(kind=kind, outcome="leader").inc()
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if self.stale_seconds > 0 and flight.error is None and not flight.forgotten:
+                    self._remember(key, flight.result)
+            flight.done.set()
+
+    def _wait(self, kind: str, flight: _Flight) -> Any:
+        flight.done.wait()
+        SINGLE_FLIGHT_REQUESTS.labels(kind=kind, outcome="shared").inc()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _remember(self, key: Hashable, result: Any):
+        self._results.pop(key, None)
+        if len(self._results) >= SINGLE_FLIGHT_MAX_RESULTS:
+            # dict хранит порядок вставки — первым удаляется самый старый результат
+            del self._results[next(iter(self._results))]
+        self._results[key] = (time.monotonic(), result)
+
+    def forget(self, *prefix):
+        # После записи: новые запросы не присоединяются к уже идущим загрузкам и не получают устаревшее
+        size = len(prefix)
+        with self._lock:
+            for key in [key for key in self._flights if key[:size] == prefix]:
+                self._flights.pop(key).forgotten = True
+            for key in [key for key in self._results if key[:size] == prefix]:
+                del self._results[key]
+
+
+read_flights = SingleFlight()
+
+
+def _affected_keys(instance) -> list:
+    if isinstance(instance, models.User):
+        return [("user", instance.id), ("user_orders", instance.id)]
+    if isinstance(instance, models.Profile):
+        return [("profile", instance.id)]
+    if isinstance(instance, models.Order):
+        return [("user_orders", instance.user_id)]
+    return []
+
+
+# Слушаем Session, а не RoutingSession: записи атомарного /batch тоже должны сбрасывать результаты
+@event.listens_for(Session, "after_flush")
+def _collect_written_keys(session, flush_context):
+    keys = session.info.setdefault("single_flight_keys", set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys.update(_affected_keys(instance))
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_written_keys(session):
+    for key in session.info.pop("single_flight_keys", ()):
+        read_flights.forget(*key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_written_keys(session):
+    session.info.pop("single_flight_keys", None)
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import admission
+from admission import AdaptiveLimiter, AdmissionMiddleware, latency_target
+
+
+def ok(request):
+    return PlainTextResponse("ok")
+
+
+def failing(request):
+    return PlainTextResponse("error", status_code=500)
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    # Нулевая цель: любой ответ маршрута с целью по умолчанию считается медленным
+    monkeypatch.setattr(admission, "ADMISSION_LATENCY_TARGET", 0.0)
+    app = Starlette(routes=[Route("/users/", ok), Route("/batch", ok, methods=["POST"]),
+                            Route("/orders/archive/{month}", failing)])
+    limiter = AdaptiveLimiter()
+    app.add_middleware(AdmissionMiddleware, limiter=limiter, router=app.router)
+    return TestClient(app), limiter
+
+
+def test_long_budget_routes_have_no_latency_target():
+    assert latency_target("/batch") is None
+    assert latency_target("/orders/archive/{month}/download") is None
+    assert latency_target("/users/") == admission.ADMISSION_LATENCY_TARGET
+    assert latency_target(None) == admission.ADMISSION_LATENCY_TARGET
+
+
+def test_slow_regular_route_backs_off(limited):
+    client, limiter = limited
+    initial = limiter.limit
+    assert client.get("/users/").status_code == 200
+    assert limiter.limit == pytest.approx(initial * admission.ADMISSION_BACKOFF_RATIO)
+
+
+def test_long_budget_route_latency_does_not_change_limit(limited):
+    client, limiter = limited
+    initial = limiter.limit
+    for _ in range(5):
+        assert client.post("/batch").status_code == 200
+    assert limiter.limit == initial
+
+
+def test_long_budget_route_errors_still_back_off(limited):
+    client, limiter = limited
+    initial = limiter.limit
+    assert client.get("/orders/archive/2026-01").status_code == 500
+    assert limiter.limit == pytest.approx(initial * admission.ADMISSION_BACKOFF_RATIO)
+
+
+def test_fast_response_grows_limit_only_with_target():
+    limiter = AdaptiveLimiter()
+    limiter.limit = 4
+    limiter.inflight = 4
+    limiter.release(0.0, success=True, target=None)
+    assert limiter.limit == 4
+    limiter.release(0.0, success=True, target=1.0)
+    assert limiter.limit == pytest.approx(4.25)
+
+
+def test_cancelled_waiter_returns_granted_slot():
+    async def scenario():
+        limiter = AdaptiveLimiter()
+        limiter.limit = 1
+        assert await limiter.acquire("normal")
+        waiter = asyncio.create_task(limiter.acquire("normal"))
+        await asyncio.sleep(0)
+        assert limiter.inflight == 1 and len(limiter.queues["normal"]) == 1
+
+        # Отмена и выдача слота в одном витке цикла: задача не возобновилась, а слот уже её
+        waiter.cancel()
+        limiter.release(0.0, success=True, target=None, observe=False)
+        assert limiter.inflight == 1
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.inflight == 0
+    assert not any(limiter.queues.values())
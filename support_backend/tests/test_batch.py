@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy import event
+
+import models
+
+
+@pytest.fixture
+def user_id(db):
+    user = models.User(name="batch-owner", email="batch-owner@example.com", password="")
+    db.add(user)
+    db.commit()
+    yield user.id
+    db.query(models.Profile).filter(models.Profile.user_id == user.id).delete()
+    db.query(models.User).filter(models.User.id == user.id).delete()
+    db.commit()
+
+
+@pytest.fixture
+def timeline(pg_engine, monkeypatch):
+    # Порядок реальных COMMIT и сбросов кэшей в процессе
+    from auth import user_cache
+    from querycache import query_cache
+    from singleflight import read_flights
+
+    events = []
+    bump, clear, forget = query_cache.generations.bump, user_cache.clear, read_flights.forget
+    monkeypatch.setattr(query_cache.generations, "bump", lambda table: (events.append(("bump", table)), bump(table)))
+    monkeypatch.setattr(user_cache, "clear", lambda: (events.append(("user_cache",)), clear()))
+    monkeypatch.setattr(read_flights, "forget", lambda *key: (events.append(("forget",) + key), forget(*key)))
+
+    def on_commit(connection):
+        events.append(("commit",))
+
+    event.listen(pg_engine, "commit", on_commit)
+    yield events
+    event.remove(pg_engine, "commit", on_commit)
+
+
+def user_name(db, user_id):
+    return db.query(models.User.name).filter(models.User.id == user_id).scalar()
+
+
+def post_batch(client, headers, requests, atomic=True):
+    response = client.post("/batch", json={"atomic": atomic, "requests": requests}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_atomic_batch_invalidates_caches_after_single_commit(client, admin_headers, user_id, timeline, db):
+    body = post_batch(client, admin_headers, [
+        {"method": "POST", "path": "/profiles/", "body": {"user_id": user_id, "bio": "first"}},
+        {"method": "PATCH", "path": f"/users/{user_id}", "body": {"name": "renamed", "email": "batch-owner@example.com"}},
+    ])
+    assert [result["status"] for result in body["results"]] == [200, 200]
+    assert body["committed"] is True
+
+    # Журнал действий пишется своими транзакциями — смотрим только на транзакцию батча
+    first_commit = timeline.index(("commit",))
+    invalidations = [entry for entry in timeline if entry[0] != "commit"]
+    assert ("bump", "profiles") in timeline and ("bump", "users") in timeline and ("user_cache",) in timeline
+    assert all(timeline.index(entry) > first_commit for entry in invalidations)
+    assert user_name(db, user_id) == "renamed"
+
+
+def test_failed_atomic_batch_rolls_back_without_invalidation(client, admin_headers, user_id, timeline, db):
+    body = post_batch(client, admin_headers, [
+        {"method": "POST", "path": "/profiles/", "body": {"user_id": user_id, "bio": "lost"}},
+        {"method": "PATCH", "path": f"/users/{user_id}", "body": {"name": "lost", "email": "batch-owner@example.com"}},
+        {"method": "GET", "path": "/users/999999"},
+        {"method": "GET", "path": f"/users/{user_id}"},
+    ])
+    assert [result["status"] for result in body["results"]] == [200, 200, 404, 424]
+    assert body["committed"] is False
+    assert [entry for entry in timeline if entry[0] != "commit"] == []
+    assert db.query(models.Profile).filter(models.Profile.user_id == user_id).count() == 0
+    assert user_name(db, user_id) == "batch-owner"
+
+
+def test_non_atomic_batch_commits_each_write(client, admin_headers, user_id, db):
+    body = post_batch(client, admin_headers, [
+        {"method": "POST", "path": "/profiles/", "body": {"user_id": user_id, "bio": "kept"}},
+        {"method": "GET", "path": "/users/999999"},
+    ], atomic=False)
+    assert [result["status"] for result in body["results"]] == [200, 404]
+    assert db.query(models.Profile).filter(models.Profile.user_id == user_id).count() == 1
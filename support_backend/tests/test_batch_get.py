@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import event
+
+import models
+
+
+@pytest.fixture
+def entities(db):
+    users = [models.User(name=f"batch{i}", email=f"batch{i}@example.com", password="") for i in range(3)]
+    db.add_all(users)
+    db.flush()
+    orders = [models.Order(user_id=users[0].id, total_amount=10 + i, status="new") for i in range(2)]
+    profiles = [models.Profile(user_id=users[1].id, bio="bio")]
+    db.add_all(orders + profiles)
+    db.commit()
+    yield {"users": [u.id for u in users], "orders": [o.id for o in orders], "profiles": [p.id for p in profiles]}
+    for instance in orders + profiles + users:
+        db.delete(instance)
+    db.commit()
+
+
+def count_queries(engine, table):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if f"FROM {table}" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", capture)
+
+
+@pytest.mark.parametrize("path, kind", [("/users/batch", "users"), ("/orders/batch", "orders"),
+                                        ("/profiles/batch", "profiles")])
+def test_batch_preserves_order_and_marks_missing(client, admin_headers, entities, path, kind):
+    ids = [entities[kind][0], 999999, entities[kind][0]] + entities[kind][1:]
+    response = client.get(path, params={"ids": ",".join(map(str, ids))}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [item["id"] for item in body] == ids
+    assert [item["found"] for item in body] == [entity_id != 999999 for entity_id in ids]
+    assert all(item["item"]["id"] == item["id"] for item in body if item["found"])
+    assert body[1]["item"] is None
+
+
+def test_batch_routes_declare_batch_item_schema(client):
+    paths = client.get("/openapi.json").json()["paths"]
+    for path, schema in (("/users/batch", "UserResponse"), ("/orders/batch", "OrderResponse"),
+                         ("/profiles/batch", "ProfileResponse")):
+        items = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]["items"]
+        assert items["$ref"].endswith(f"BatchItem_{schema}_")
+    # Списки больше не принимают ids — их схема ответа осталась списком сущностей
+    assert not any(p["name"] == "ids" for p in paths["/users/"]["get"]["parameters"])
+    assert not any(p["name"] == "ids" for p in paths["/orders/"]["get"]["parameters"])
+
+
+def test_batch_reads_entity_cache(client, admin_headers, entities, pg_engine, db):
+    ids = ",".join(map(str, entities["orders"]))
+    assert client.get("/orders/batch", params={"ids": ids}, headers=admin_headers).status_code == 200
+
+    statements, stop = count_queries(pg_engine, "orders")
+    try:
+        cached = client.get("/orders/batch", params={"ids": ids}, headers=admin_headers).json()
+        assert statements == []
+
+        # Запись в orders сбрасывает поколение таблицы — следующая пачка читает БД
+        order = db.query(models.Order).filter(models.Order.id == entities["orders"][0]).one()
+        order.status = "paid"
+        db.commit()
+        statements.clear()
+        fresh = client.get("/orders/batch", params={"ids": ids}, headers=admin_headers).json()
+        assert len(statements) == 1
+    finally:
+        stop()
+    assert cached[0]["item"]["status"] == "new"
+    assert fresh[0]["item"]["status"] == "paid"
+
+
+def test_batch_rejects_bad_ids(client, admin_headers):
+    assert client.get("/users/batch", params={"ids": "1,x"}, headers=admin_headers).status_code == 400
+    assert client.get("/users/batch", params={"ids": ""}, headers=admin_headers).status_code == 400
@@ -0,0 +1,88 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+import models
+from group_commit import GroupCommitter
+
+
+@pytest.fixture
+def user_id(db):
+    user = models.User(name="group-commit", email="group-commit@example.com", password="")
+    db.add(user)
+    db.commit()
+    yield user.id
+    db.query(models.Order).filter(models.Order.user_id == user.id).delete()
+    db.query(models.User).filter(models.User.id == user.id).delete()
+    db.commit()
+
+
+@pytest.fixture
+def transactions(pg_engine):
+    counts = {"commit": 0, "rollback_savepoint": 0}
+
+    def listener(name):
+        def count(*args):
+            counts[name] += 1
+        return count
+
+    listeners = [(name, listener(name)) for name in counts]
+    for name, fn in listeners:
+        event.listen(pg_engine, name, fn)
+    yield counts
+    for name, fn in listeners:
+        event.remove(pg_engine, name, fn)
+
+
+def submit_all(rows):
+    # Окно больше времени отправки: все вызовы гарантированно попадают в одну пачку
+    committer = GroupCommitter(models.Order.__table__, window_ms=200, max_items=len(rows))
+
+    async def run():
+        return await asyncio.gather(*(committer.submit(row) for row in rows), return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_each_caller_gets_its_own_row(user_id, transactions, db):
+    rows = [{"user_id": user_id, "total_amount": Decimal(i), "status": f"s{i}"} for i in range(20)]
+    results = submit_all(rows)
+
+    assert transactions == {"commit": 1, "rollback_savepoint": 0}
+    assert [(result["total_amount"], result["status"]) for result in results] == \
+           [(row["total_amount"], row["status"]) for row in rows]
+    assert len({result["id"] for result in results}) == len(rows)
+    stored = dict(db.query(models.Order.id, models.Order.status).filter(models.Order.user_id == user_id))
+    assert stored == {result["id"]: result["status"] for result in results}
+
+
+def test_bad_rows_get_their_own_error(user_id, transactions, db):
+    # Несуществующий пользователь ломает multi-row INSERT — пачка повторяется построчно через SAVEPOINT
+    bad = {3, 7}
+    rows = [{"user_id": 999999 if i in bad else user_id, "total_amount": Decimal(i), "status": f"s{i}"}
+            for i in range(10)]
+    results = submit_all(rows)
+
+    assert transactions == {"commit": 1, "rollback_savepoint": len(bad)}
+    for i, result in enumerate(results):
+        if i in bad:
+            assert isinstance(result, IntegrityError)
+        else:
+            assert result["status"] == f"s{i}" and result["user_id"] == user_id
+    stored = {status for status, in db.query(models.Order.status).filter(models.Order.user_id == user_id)}
+    assert stored == {f"s{i}" for i in range(10) if i not in bad}
+
+
+@pytest.mark.parametrize("group_commit", [False, True])
+def test_create_order_endpoint(client, admin_headers, user_id, monkeypatch, group_commit):
+    import main
+
+    monkeypatch.setattr(main, "ORDER_GROUP_COMMIT", group_commit)
+    response = client.post("/orders/", json={"user_id": user_id, "total_amount": "12.50", "status": "new"},
+                           headers=admin_headers)
+    assert response.status_code == 200, response.text
+    created = response.json()
+    assert created["user_id"] == user_id and created["total_amount"] == 12.5 and created["id"]
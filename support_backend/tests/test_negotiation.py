@@ -0,0 +1,60 @@
+import msgpack
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from negotiation import MSGPACK_MEDIA_TYPE, MsgPackMiddleware
+
+
+async def echo(request):
+    return JSONResponse({"received": await request.json()} if request.method == "POST" else {"ok": True})
+
+
+def with_vary(request):
+    return JSONResponse({"ok": True}, headers={"Vary": "Origin"})
+
+
+def text(request):
+    return PlainTextResponse("ok")
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[Route("/json", echo, methods=["GET", "POST"]), Route("/vary", with_vary),
+                            Route("/text", text)])
+    app.add_middleware(MsgPackMiddleware)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("accept", [None, "application/json", MSGPACK_MEDIA_TYPE])
+@pytest.mark.parametrize("path", ["/json", "/text"])
+def test_every_response_varies_on_accept(client, accept, path):
+    response = client.get(path, headers={"Accept": accept} if accept else {})
+    assert response.status_code == 200
+    assert response.headers.get_list("vary") == ["Accept"]
+
+
+def test_msgpack_response(client):
+    response = client.get("/json", headers={"Accept": MSGPACK_MEDIA_TYPE})
+    assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE
+    assert msgpack.unpackb(response.content) == {"ok": True}
+
+
+@pytest.mark.parametrize("accept", [None, MSGPACK_MEDIA_TYPE])
+def test_existing_vary_is_extended(client, accept):
+    response = client.get("/vary", headers={"Accept": accept} if accept else {})
+    assert response.headers.get_list("vary") == ["Origin, Accept"]
+
+
+@pytest.mark.parametrize("accept", [None, MSGPACK_MEDIA_TYPE])
+def test_msgpack_request_body_and_errors(client, accept):
+    headers = {"Content-Type": MSGPACK_MEDIA_TYPE, **({"Accept": accept} if accept else {})}
+    response = client.post("/json", content=msgpack.packb({"a": 1}), headers=headers)
+    assert response.status_code == 200
+    assert response.headers["vary"] == "Accept"
+
+    invalid = client.post("/json", content=b"\xc1", headers=headers)
+    assert invalid.status_code == 400
+    assert invalid.headers["vary"] == "Accept"
@@ -0,0 +1,16 @@
+import time
+
+from sqlalchemy import text
+
+
+def test_notify_bumps_table_generation(app, pg_engine):
+    from querycache import TABLE_CHANGED_CHANNEL, query_cache
+
+    before = query_cache.generations.snapshot(["profiles"])
+    deadline = time.monotonic() + 10
+    # Слушатель стартует фоном при импорте main — шлём, пока он не подпишется и не примет уведомление
+    while query_cache.generations.snapshot(["profiles"]) == before:
+        assert time.monotonic() < deadline, "table_changed notification was not received"
+        with pg_engine.begin() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, 'profiles')"), {"channel": TABLE_CHANGED_CHANNEL})
+        time.sleep(0.1)
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from sqlalchemy import event, text
+
+# Засеянные пользователи получают id с отступом: администратор и данные других тестов не трогаются
+FIRST_USER_ID = 100001
+SEEDED_USER = FIRST_USER_ID + 16
+
+# Фильтр/сортировка GET /orders/ -> индекс, под который он заведён (models.Order.__table_args__)
+CASES = [
+    ({"sort": "created_at"}, "ix_orders_created_at_id"),
+    ({"sort": "-created_at"}, "ix_orders_created_at_id"),
+    ({"user_id": SEEDED_USER, "sort": "created_at"}, "ix_orders_user_id_created_at_id"),
+    ({"user_id": SEEDED_USER, "sort": "id"}, "ix_orders_user_id_id"),
+    ({"user_id": SEEDED_USER, "order_status": "refunded", "sort": "id"}, "ix_orders_user_id_status_id"),
+    ({"user_id": SEEDED_USER, "sort": "-total_amount"}, "ix_orders_user_id_total_amount_id"),
+    ({"order_status": "refunded", "sort": "id"}, "ix_orders_status_id"),
+    ({"order_status": "refunded", "sort": "total_amount"}, "ix_orders_status_total_amount_id"),
+    ({"sort": "total_amount"}, "ix_orders_total_amount_id"),
+    ({"min_amount": 990, "sort": "total_amount"}, "ix_orders_total_amount_id"),
+]
+
+
+@pytest.fixture(scope="module")
+def orders(pg_engine):
+    # 2000 пользователей, 300 тысяч заказов за три месяца; refunded — редкий статус (1%)
+    with pg_engine.begin() as connection:
+        connection.execute(text("TRUNCATE orders"))
+        connection.execute(text(
+            "INSERT INTO users (id, name, email, password, role) "
+            "SELECT :first + i, 'user' || i, 'user' || i || '@example.com', '', 'user' FROM generate_series(0, 1999) i"
+        ), {"first": FIRST_USER_ID})
+        connection.execute(text(
+            "INSERT INTO orders (user_id, total_amount, status, created_at) "
+            "SELECT :first + i % 2000, (i::bigint * 7919 % 100000) / 100.0, "
+            "CASE WHEN i % 100 = 0 THEN 'refunded' WHEN i % 10 < 3 THEN 'paid' ELSE 'new' END, "
+            "date_trunc('month', now()) - interval '2 months' + (i % 7776000) * interval '1 second' "
+            "FROM generate_series(1, 300000) i"
+        ), {"first": FIRST_USER_ID})
+        connection.execute(text("ANALYZE orders"))
+    yield
+    with pg_engine.begin() as connection:
+        connection.execute(text("TRUNCATE orders"))
+        connection.execute(text("DELETE FROM users WHERE id >= :first"), {"first": FIRST_USER_ID})
+
+
+def parent_indexes(connection):
+    # Индекс партиционированной таблицы в плане виден индексами партиций — сводим их к родителю
+    rows = connection.execute(text(
+        "SELECT child.relname, parent.relname FROM pg_inherits i "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "WHERE parent.relkind = 'I'"
+    ))
+    return dict(rows.all())
+
+
+def empty_partitions(connection):
+    # Пустые партиции (месяцы без данных) планировщик законно читает Seq Scan-ом
+    return set(connection.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND relname LIKE 'orders\\_%' AND reltuples <= 0"
+    )).scalars())
+
+
+def plan_nodes(plan, skip=frozenset()):
+    if plan.get("Relation Name") in skip:
+        return
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child, skip)
+
+
+def capture_orders_query(pg_engine, run):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM orders" in statement:
+            statements.append((statement, parameters))
+
+    event.listen(pg_engine, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(pg_engine, "before_cursor_execute", capture)
+    assert len(statements) == 1
+    return statements[0]
+
+
+@pytest.mark.parametrize("filters, index", CASES, ids=[index + ":" + ",".join(map(str, filters.values()))
+                                                       for filters, index in CASES])
+def test_orders_query_uses_index(app, pg_engine, db, orders, filters, index):
+    import main
+
+    arguments = {"user_id": None, "order_status": None, "min_amount": None, "max_amount": None,
+                 "created_from": None, "created_to": None, "cursor": None, "limit": 50, **filters}
+    statement, parameters = capture_orders_query(pg_engine, lambda: main.query_orders_page(db, **arguments))
+
+    with pg_engine.connect() as connection:
+        plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        parents = parent_indexes(connection)
+        empty = empty_partitions(connection)
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    nodes = list(plan_nodes(plan, empty))
+
+    assert not [node for node in nodes if node["Node Type"] == "Seq Scan"], json.dumps(plan, indent=1)
+    used = {parents.get(node["Index Name"], node["Index Name"]) for node in nodes if "Index Name" in node}
+    assert used == {index}, json.dumps(plan, indent=1)
@@ -0,0 +1,87 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import models
+from pagination import MAX_PAGE_SIZE, clamp_limit, decode_cursor, encode_cursor, keyset_page
+
+USER_SORT_KEYS = {
+    "id": ([models.User.id], [int]),
+    "name": ([models.User.name, models.User.id], [str, int]),
+}
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    models.User.__table__.create(engine)
+    with Session(engine) as session:
+        # Повторяющиеся имена: порядок внутри одного имени задаёт id
+        session.add_all(models.User(id=i, name=f"user{i % 7}", email=f"u{i}@example.com") for i in range(1, 51))
+        session.commit()
+        yield session
+
+
+def collect(session, sort, limit):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(session.query(models.User), sort, USER_SORT_KEYS, cursor, limit)
+        pages.append([row.id for row in rows])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("values, parsers", [
+    ([42], [int]),
+    ([Decimal("10.50"), 7], [Decimal, int]),
+    ([datetime(2026, 10, 19, 12, 30, 5, 123456), 3], [datetime.fromisoformat, int]),
+    (["имя с пробелом", 1], [str, int]),
+])
+def test_cursor_round_trip(values, parsers):
+    cursor = encode_cursor("-created_at", values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "-created_at", parsers) == values
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor("id", [1, 2]), encode_cursor("id", ["x"])])
+def test_invalid_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, "id", [int])
+    assert error.value.status_code == 400
+
+
+def test_cursor_bound_to_sort():
+    with pytest.raises(HTTPException):
+        decode_cursor(encode_cursor("id", [1]), "-id", [int])
+
+
+def test_clamp_limit():
+    assert clamp_limit(0) == 1
+    assert clamp_limit(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
+
+
+@pytest.mark.parametrize("sort, expected", [
+    ("id", list(range(1, 51))),
+    ("-id", list(range(50, 0, -1))),
+    ("name", [i for _, i in sorted((f"user{i % 7}", i) for i in range(1, 51))]),
+    ("-name", [i for _, i in sorted(((f"user{i % 7}", i) for i in range(1, 51)), reverse=True)]),
+])
+def test_keyset_pages_cover_all_rows_once(session, sort, expected):
+    pages = collect(session, sort, 8)
+    assert [len(page) for page in pages] == [8] * 6 + [2]
+    assert [user_id for page in pages for user_id in page] == expected
+
+
+def test_keyset_exact_multiple_has_no_empty_page(session):
+    pages = collect(session, "id", 10)
+    assert len(pages) == 5 and all(len(page) == 10 for page in pages)
+
+
+def test_keyset_unknown_sort_is_400(session):
+    with pytest.raises(HTTPException) as error:
+        keyset_page(session.query(models.User), "email", USER_SORT_KEYS, None, 10)
+    assert error.value.status_code == 400
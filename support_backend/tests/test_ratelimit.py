@@ -0,0 +1,37 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import ratelimit
+from ratelimit import RateLimitMiddleware
+
+
+def ok(request):
+    return PlainTextResponse("ok")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Корзина на два запроса, токен восстанавливается раз в 4 секунды
+    monkeypatch.setattr(ratelimit, "RATE_LIMITS", {"read": (0.25, 2), "write": (100, 100)})
+    app = Starlette(routes=[Route("/users/", ok, methods=["GET", "POST"])])
+    app.add_middleware(RateLimitMiddleware, redis_url=None)
+    return TestClient(app)
+
+
+def test_over_limit_is_429_with_retry_after(client):
+    assert [client.get("/users/").status_code for _ in range(2)] == [200, 200]
+    response = client.get("/users/")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too many requests"}
+    assert response.headers["retry-after"] == "4"
+
+
+def test_groups_and_clients_have_separate_buckets(client):
+    for _ in range(3):
+        client.get("/users/")
+    assert client.post("/users/").status_code == 200
+    other = TestClient(client.app, client=("10.0.0.2", 5000))
+    assert other.get("/users/").status_code == 200
@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import create_engine, event
+
+import database
+import models
+from replicas import ReplicaRouter, parse_lsn
+
+
+@pytest.fixture
+def router(monkeypatch):
+    # Две «реплики» без репликации: здоровье и LSN задаются вручную
+    replicas = [create_engine("sqlite://"), create_engine("sqlite://")]
+    router = ReplicaRouter(database.engine, replicas, max_lag=5, sticky_window=10)
+    router._healthy = {0: True, 1: True}
+    monkeypatch.setattr(database, "replica_router", router)
+    return router
+
+
+def read_only_session():
+    session = database.SessionLocal()
+    session.info["read_only"] = True
+    return session
+
+
+def test_session_pins_one_replica(router):
+    first, second = read_only_session(), read_only_session()
+    try:
+        assert len({first.get_bind() for _ in range(5)}) == 1
+        assert len({second.get_bind() for _ in range(5)}) == 1
+        # Балансировка — между сессиями, а не между запросами одной сессии
+        assert {first.get_bind(), second.get_bind()} == set(router.replicas)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_unhealthy_replicas_fall_back_to_primary(router):
+    router._healthy = {0: False, 1: False}
+    session = read_only_session()
+    try:
+        assert session.get_bind() is database.engine
+    finally:
+        session.close()
+
+
+def test_write_records_lsn_on_the_same_connection(router, pg_engine, db):
+    checkouts = []
+    listener = lambda *args: checkouts.append(args)
+    event.listen(pg_engine, "checkout", listener)
+    try:
+        db.info["client_key"] = lambda: "replica-test-client"
+        user = models.User(name="replica", email="replica@example.com", password="")
+        db.add(user)
+        db.commit()
+    finally:
+        event.remove(pg_engine, "checkout", listener)
+    db.delete(user)
+    db.commit()
+
+    written_at, lsn = router._writes["replica-test-client"]
+    assert lsn > 0
+    assert len(checkouts) == 1
+
+    # Клиент читает с primary, пока ни одна реплика не воспроизвела LSN его записи
+    assert router.read_bind("replica-test-client") is database.engine
+    router._replay_lsn = {0: lsn, 1: 0}
+    assert router.read_bind("replica-test-client") is router.replicas[0]
+
+
+def test_parse_lsn():
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+    assert parse_lsn(None) == 0
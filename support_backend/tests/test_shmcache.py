@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from shmcache import GENERATION, GENERATIONS_OFFSET, NAMESPACES, SharedMemoryCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedMemoryCache(str(tmp_path / "cache"), slots=64, slot_size=256)
+
+
+def generation(cache, namespace):
+    return GENERATION.unpack_from(cache._mm, GENERATIONS_OFFSET + NAMESPACES[namespace] * GENERATION.size)[0]
+
+
+def test_put_get_and_invalidate(cache):
+    cache.put("user", "1", {"id": 1}, ttl=60)
+    assert cache.get("user", "1") == (True, {"id": 1})
+    cache.invalidate("user")
+    assert cache.get("user", "1")[0] is False
+
+
+def test_writers_wait_for_process_lock(cache):
+    # flock на общем fd поток не остановит — писателя держит блокировка процесса
+    writer = threading.Thread(target=cache.invalidate, args=("token",))
+    with cache._lock:
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+        assert generation(cache, "token") == 0
+    writer.join()
+    assert generation(cache, "token") == 1
+
+
+def test_concurrent_writers_do_not_lose_updates(cache):
+    def work(worker):
+        for i in range(500):
+            cache.invalidate("token")
+            cache.put("user", f"{worker}:{i % 8}", {"worker": worker, "i": i}, ttl=60)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert generation(cache, "token") == 8 * 500
+    for worker in range(8):
+        found, value = cache.get("user", f"{worker}:7")
+        assert not found or value["worker"] == worker
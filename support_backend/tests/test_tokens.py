@@ -0,0 +1,47 @@
+import logging
+import os
+
+import pytest
+
+
+@pytest.fixture
+def tokens(client):
+    response = client.post("/token", params={"username": os.environ.get("ADMIN_EMAIL", "admin"),
+                                             "password": os.environ["ADMIN_PASSWORD"]})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def bearer(tokens):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def test_refresh_takes_token_from_json_body(client, tokens, caplog):
+    with caplog.at_level(logging.INFO):
+        response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    assert response.json()["refresh_token"] != tokens["refresh_token"]
+    # В журнал запросов тело попадает замаскированным
+    assert not any(tokens["refresh_token"] in record.getMessage() for record in caplog.records)
+    assert not any(response.json()["refresh_token"] in record.getMessage() for record in caplog.records)
+
+    # Ротация: использованный refresh-токен повторно не принимается
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_refresh_rejects_query_parameter(client, tokens):
+    response = client.post("/token/refresh", params={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 422
+
+
+def test_revoke_takes_refresh_token_from_body(client, tokens):
+    response = client.post("/token/revoke", json={"refresh_token": tokens["refresh_token"]}, headers=bearer(tokens))
+    assert response.status_code == 200, response.text
+    assert client.get("/users/", headers=bearer(tokens)).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_revoke_without_body_keeps_refresh_token(client, tokens):
+    assert client.post("/token/revoke", headers=bearer(tokens)).status_code == 200
+    assert client.get("/users/", headers=bearer(tokens)).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import models
+import schemas
+from pagination import MAX_PAGE_SIZE
+
+
+@pytest.fixture
+def customer(db):
+    user = models.User(name="detail", email="detail@example.com", password="")
+    role = models.UserRole(name="detail-support")
+    db.add_all([user, role])
+    db.flush()
+    base = datetime.utcnow().replace(microsecond=0) - timedelta(days=1)
+    # Пары заказов с одинаковым created_at: порядок внутри пары задаёт id
+    orders = [models.Order(user_id=user.id, total_amount=i + 0.5, status="new",
+                           created_at=base + timedelta(minutes=i // 2)) for i in range(MAX_PAGE_SIZE + 20)]
+    profiles = [models.Profile(user_id=user.id, bio=f"bio{i}", avatar_url=None) for i in range(2)]
+    db.add_all(orders + profiles + [models.UserUserRole(user_id=user.id, role_id=role.id)])
+    db.commit()
+    yield user.id
+    db.query(models.UserUserRole).filter(models.UserUserRole.user_id == user.id).delete()
+    db.query(models.Order).filter(models.Order.user_id == user.id).delete()
+    db.query(models.Profile).filter(models.Profile.user_id == user.id).delete()
+    db.delete(role)
+    db.delete(user)
+    db.commit()
+
+
+def get_detail(client, headers, user_id, **params):
+    response = client.get(f"/users/{user_id}/detail", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_detail_matches_separate_calls(client, admin_headers, customer, db):
+    detail = get_detail(client, admin_headers, customer, orders_limit=3)
+    # json_agg отдаёт ровно поля схемы — без лишних и без пропущенных
+    assert set(detail) == set(schemas.UserDetailResponse.model_fields)
+    schemas.UserDetailResponse.model_validate(detail)
+
+    user = client.get(f"/users/{customer}", headers=admin_headers).json()
+    assert {key: detail[key] for key in ("id", "name", "email")} == {key: user[key] for key in ("id", "name", "email")}
+
+    orders = client.get(f"/users/{customer}/orders", params={"sort": "-created_at", "limit": 3},
+                        headers=admin_headers).json()
+    assert detail["recent_orders"] == orders
+
+    profile_ids = [p.id for p in db.query(models.Profile).filter(models.Profile.user_id == customer)
+                   .order_by(models.Profile.id)]
+    assert detail["profiles"] == [client.get(f"/profiles/{profile_id}", headers=admin_headers).json()
+                                  for profile_id in profile_ids]
+    assert [role["name"] for role in detail["roles"]] == ["detail-support"]
+
+
+def test_orders_limit_caps_recent_orders(client, admin_headers, customer):
+    assert len(get_detail(client, admin_headers, customer)["recent_orders"]) == 10
+    assert get_detail(client, admin_headers, customer, orders_limit=0)["recent_orders"] == []
+    recent = get_detail(client, admin_headers, customer, orders_limit=MAX_PAGE_SIZE * 5)["recent_orders"]
+    assert len(recent) == MAX_PAGE_SIZE
+    keys = [(order["created_at"], order["id"]) for order in recent]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_detail_rejects_negative_limit_and_unknown_user(client, admin_headers):
+    assert client.get("/users/1/detail", params={"orders_limit": -1}, headers=admin_headers).status_code == 422
+    assert client.get("/users/999999/detail", headers=admin_headers).status_code == 404
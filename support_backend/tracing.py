@@ -0,0 +1,124 @@
+import logging
+import os
+from contextlib import nullcontext
+from typing import Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("app")
+
+# none — трассировка выключена; console/file — локальная отладка; otlp — коллектор (OTEL_EXPORTER_OTLP_ENDPOINT)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE_PATH = os.getenv("TRACING_FILE_PATH", "logs/traces.jsonl")
+# Head-based sampling: решение принимается в корне трассы и наследуется по traceparent
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.05"))
+SQL_STATEMENT_MAX_LENGTH = 2000
+# Опросы мониторинга трассировать незачем
+TRACING_EXCLUDED_PATHS = ("/metrics", "/health")
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # трассировка — необязательная зависимость
+    trace = None
+
+_tracer = None
+_NOOP_SPAN = nullcontext()
+
+
+def setup_tracing():
+    global _tracer
+    if TRACING_EXPORTER == "none" or _tracer is not None:
+        return
+    if trace is None:
+        logger.warning("TRACING_EXPORTER is set but opentelemetry is not installed, tracing disabled")
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.warning("TRACING_EXPORTER is set but opentelemetry-sdk is not installed, tracing disabled")
+        return
+
+    if TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    elif TRACING_EXPORTER == "file":
+        # Одна строка JSON на span — удобно грепать по trace_id из логов
+        exporter = ConsoleSpanExporter(out=open(TRACING_FILE_PATH, "a", encoding="utf-8"),
+                                       formatter=lambda span: span.to_json(indent=None) + os.linesep)
+    elif TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    else:
+        logger.warning(f"Unknown TRACING_EXPORTER {TRACING_EXPORTER!r}, tracing disabled")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "support-backend"}),
+                              sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("support_backend")
+
+
+def span(name: str, **attributes):
+    # Без трассировки — общий nullcontext: на горячем пути ни аллокаций, ни вызовов SDK
+    if _tracer is None:
+        return _NOOP_SPAN
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def current_trace_ids() -> Optional[Tuple[str, str]]:
+    # Для JSONFormatter: ID трассы и span'а, в которых пишется запись лога
+    if _tracer is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    if not context.is_valid:
+        return None
+    return format(context.trace_id, "032x"), format(context.span_id, "016x")
+
+
+def telemetry_config() -> dict:
+    # Корневой span запроса, извлечение W3C traceparent и span'ы зависимостей/обработчика/сериализации
+    # даёт встроенная телеметрия FastAPI; здесь — только провайдер и исключения
+    return {
+        "tracing": _tracer is not None,
+        "metrics": False,  # метрики — через prometheus_client
+        "logs": False,  # ошибки и так пишет JSON-логгер, уже с trace_id
+        "exclude": lambda scope: scope.get("path") in TRACING_EXCLUDED_PATHS,
+    }
+
+
+# SQL-span на каждый запрос курсора: время в БД отдельно от ORM и сериализации
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    if _tracer is None or not trace.get_current_span().get_span_context().is_valid:
+        return
+    sql_span = _tracer.start_span("db.query", kind=SpanKind.CLIENT, attributes={
+        "db.system": conn.dialect.name,
+        "db.query.text": statement[:SQL_STATEMENT_MAX_LENGTH],
+    })
+    conn.info.setdefault("otel_spans", []).append(sql_span)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_sql_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("otel_spans")
+    if spans:
+        sql_span = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            sql_span.set_attribute("db.response.returned_rows", cursor.rowcount)
+        sql_span.end()
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_sql_span(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get("otel_spans") if connection is not None else None
+    if spans:
+        sql_span = spans.pop()
+        sql_span.record_exception(exception_context.original_exception)
+        sql_span.set_status(Status(StatusCode.ERROR))
+        sql_span.end()
@@ -10,9 +10,6 @@ done
 
 echo "База данных готова!"
 
-# Генерируем миграцию (опционально)
-alembic revision --autogenerate -m "Auto-generated migration"
-
 # Применяем миграции
 echo "Запускаем миграции..."
 alembic upgrade head